@@ -0,0 +1,164 @@
+import os
+import math
+import time
+import threading
+import zlib
+from collections import OrderedDict
+
+from entity_matching import normalize_text
+from ingestion_watermark import current_watermark
+
+# ============================================================================
+# CACHÉ DE RESPUESTAS DEL CHATBOT
+# ============================================================================
+# Las preguntas repetidas ("¿Cuántas prendas de LACOSTE hay?") se responden sin
+# pasar por el orquestador. La clave es la pregunta corregida y normalizada
+# (mayúsculas, sin tildes ni signos) más los filtros del panel. Cada respuesta
+# guarda la marca de ingesta con la que se generó y deja de servirse en cuanto
+# la ingesta guarda registros nuevos.
+# Opcionalmente (ANSWER_CACHE_SIMILARITY > 0) una pregunta distinta pero casi
+# igual también se sirve de la caché: se compara un vector local de trigramas
+# de caracteres con los de las respuestas guardadas con los mismos filtros.
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "si", "yes")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+# Similitud coseno mínima para reutilizar la respuesta de otra pregunta (0 = solo iguales)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+# Dimensiones del vector de trigramas (hashing trick)
+EMBEDDING_DIMENSIONS = 512
+
+# Respuestas que no se guardan: errores, avisos y pedidos de reformular
+UNCACHEABLE_PREFIXES = ("❌", "⚠️", "Lo siento", "No pude", "No se encontraron", "Error")
+
+
+def embed_question(normalized):
+    """Vector disperso y normalizado de trigramas de caracteres."""
+    vector = {}
+    padded = f" {normalized} "
+    for i in range(len(padded) - 2):
+        bucket = zlib.crc32(padded[i:i + 3].encode("utf-8")) % EMBEDDING_DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {bucket: value / norm for bucket, value in vector.items()}
+
+
+def cosine_similarity(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+def filters_key(filters):
+    """Filtros con valor, en orden estable."""
+    return tuple(sorted(
+        (key, str(value).strip().upper())
+        for key, value in (filters or {}).items()
+        if value and str(value).strip()
+    ))
+
+
+class AnswerCache:
+    """Respuestas por (pregunta normalizada, filtros), invalidadas por la marca de ingesta."""
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity=ANSWER_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _valid(self, entry, watermark):
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        # Sin marca legible no se puede saber si hubo ingesta: no se sirve nada
+        return watermark is not None and entry["watermark"] == watermark
+
+    def lookup(self, question, filters, count_miss=True):
+        """
+        Args:
+            count_miss: Si contar el fallo en las estadísticas. El pipeline busca
+                        hasta dos veces por pregunta y cuenta un solo fallo (record_miss)
+
+        Returns:
+            dict: Entrada {payload, question, similarity, ...} o None
+        """
+        normalized = normalize_text(question)
+        if not normalized:
+            return None
+        key = (normalized, filters_key(filters))
+        watermark = current_watermark()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._valid(entry, watermark):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry, similarity=1.0)
+
+            if self.similarity > 0:
+                vector = embed_question(normalized)
+                best, best_score = None, self.similarity
+                for (other_question, other_filters), other in self._entries.items():
+                    if other_filters != key[1] or not self._valid(other, watermark):
+                        continue
+                    score = cosine_similarity(vector, other["vector"])
+                    if score >= best_score:
+                        best, best_score = other, score
+                if best is not None:
+                    self.hits += 1
+                    return dict(best, similarity=round(best_score, 3))
+
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def record_miss(self):
+        """Cuenta un fallo de una petición cuyas búsquedas usaron count_miss=False."""
+        with self._lock:
+            self.misses += 1
+
+    def store(self, question, filters, payload, watermark):
+        """
+        Guarda una respuesta.
+
+        Args:
+            question: Pregunta corregida
+            filters: Filtros del panel
+            payload: dict con "response" (texto) y los campos que se devuelven con ella
+            watermark: Marca de ingesta leída ANTES de consultar los datos
+        """
+        response = payload.get("response")
+        if watermark is None or not isinstance(response, str) or not response \
+                or response.startswith(UNCACHEABLE_PREFIXES):
+            return
+        normalized = normalize_text(question)
+        if not normalized:
+            return
+        entry = {
+            "question": question,
+            "payload": payload,
+            "watermark": watermark,
+            "created_at": time.time(),
+            "vector": embed_question(normalized) if self.similarity > 0 else None,
+        }
+        key = (normalized, filters_key(filters))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = AnswerCache()
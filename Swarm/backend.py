@@ -3,23 +3,39 @@ import os
 import pymysql
 import warnings
 import requests
-from flask import Flask, request, jsonify, render_template
+import json
+import hashlib
+import base64
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, JWTManager
 from flask_cors import CORS
 from datetime import timedelta
 import cx_Oracle
 from dotenv import load_dotenv
 from flask_jwt_extended import get_jwt
-from chatbot import orquestador_bot, set_ai_model, AIModel, correct_user_input_with_ai, extract_filters_from_question
 from db import (
     get_next_conversation_group,
     get_current_conversation_group,
     get_conversation_history,
     get_all_conversations_for_user,
-    save_chat_message,
-    get_conversation_context_for_ai,
     delete_conversation
 )
+from swarm_cache import (
+    fetch_swarm_documents,
+    to_ndjson_fragment,
+    open_swarm_document_stream,
+    project_swarm_document,
+    is_valid_swarm_reference,
+    SwarmGatewayError
+)
+from search_index import search_values, SEARCH_FIELDS
+from latest_versions import LATEST_HASH_SQL, latest_hashes_query, filter_data_where, filter_data_query
+from facets import get_facet_counts, FACET_DIMENSIONS
+from bulkhead import limit_concurrency, chat_bulkhead, swarm_bulkhead, events_bulkhead
+from chat_pipeline import run_chat_pipeline
+from chat_jobs import chat_job_store
+from answer_cache import answer_cache
+from http_encoding import init_app as init_http_encoding, dumps_bytes
 
 # ------------------- Configuraciones y env ----------------------------
 
@@ -53,14 +69,16 @@ db_config = {
 ORACLE_DSN = cx_Oracle.makedsn(DB_HOST, DB_PORT, sid=DB_NAME)
 
 app = Flask(__name__, template_folder="../frontend/templates", static_folder="../frontend/static")
+# JSON con orjson (si está instalado) y compresión gzip/brotli negociada
+init_http_encoding(app)
 
 # Configuración de CORS - Permite peticiones desde cualquier origen
 CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "Last-Event-ID", "X-Request-ID"],
+        "expose_headers": ["Content-Type", "Authorization", "ETag", "Cache-Control", "X-Missing-Sections", "Retry-After", "X-Request-ID"],
         "supports_credentials": False,
         "max_age": 3600
     }
@@ -72,6 +90,29 @@ app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=48)  # El token expira
 
 jwt = JWTManager(app)
 
+# Máximo de tickbarrs aceptados por /resolve_tickbarrs en una sola llamada
+MAX_BATCH_TICKBARRS = int(os.getenv("MAX_BATCH_TICKBARRS", "500"))
+# Documentos descargados por bloque al responder en NDJSON
+BATCH_STREAM_CHUNK = 20
+
+# Cabeceras de caché HTTP: los documentos de Swarm son inmutables, mientras que
+# el hash de un tickbarr puede avanzar de versión y debe revalidarse pronto
+DOCUMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HASH_CACHE_CONTROL = f"public, max-age={int(os.getenv('HASH_CACHE_MAX_AGE', '60'))}, must-revalidate"
+
+# Intervalo de los comentarios keepalive en /chat/jobs/<id>/events
+SSE_KEEPALIVE_SECONDS = 15
+
+# Autocompletado de /search
+SEARCH_MIN_CHARS = 2
+SEARCH_MAX_LIMIT = 50
+
+# Paginación de /filter_data por clave (TFECHGUAR, TTICKBARR)
+FILTER_PAGE_SIZE = int(os.getenv("FILTER_PAGE_SIZE", "500"))
+FILTER_MAX_PAGE_SIZE = 5000
+# Filas leídas del cursor del servidor por cada bloque NDJSON
+FILTER_STREAM_CHUNK = 500
+
 
 # ------------------------------ Funciones -----------------------------
 
@@ -118,6 +159,45 @@ def verify_user(user: str, pwd: str):
         if connection:
             connection.close()
 
+def get_latest_hashes(conn, tickbarrs=None, numecaja=None):
+    """
+    Obtiene el hash de la versión vigente de varios tickbarrs en una sola consulta.
+
+    Args:
+        conn: Conexión abierta a MariaDB
+        tickbarrs: Lista de tickbarrs a resolver (opcional)
+        numecaja: Número de caja para resolver todas sus prendas (opcional)
+
+    Returns:
+        list: Diccionarios {TTICKBARR, TNUMEVERS, TTICKHASH} ordenados por tickbarr
+    """
+    query, params = latest_hashes_query(tickbarrs=tickbarrs, numecaja=numecaja)
+
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute(query, params)
+        return list(cursor.fetchall())
+
+def _batch_ndjson_lines(rows, documents, include_documents):
+    """
+    Genera las líneas NDJSON de /resolve_tickbarrs. El documento se inserta
+    como bytes crudos (compactados a una línea) sin parsearlo.
+    """
+    for row in rows:
+        hash_value = row["TTICKHASH"]
+        header = json.dumps({
+            "tickbarr": row["TTICKBARR"],
+            "version": row["TNUMEVERS"],
+            "hash": hash_value
+        }, ensure_ascii=False).encode("utf-8")
+        if not include_documents:
+            yield header + b"\n"
+            continue
+        document = documents.get(hash_value)
+        if document is None:
+            yield header[:-1] + b', "document": null, "error": "No se pudo obtener el documento"}\n'
+        else:
+            yield header[:-1] + b', "document": ' + to_ndjson_fragment(document) + b"}\n"
+
 # ----------------------------------------------------------------------
 
 # -------------------------------- Flask -------------------------------
@@ -153,15 +233,30 @@ def get_hash():
     """
     Obtiene el hash más reciente (versión más alta) de un tickbarr desde la base de datos.
     """
+    data = request.json
+    tickbarr = data.get("tickbarr")
+
+    if not tickbarr:
+        return jsonify({"error": "Falta el parámetro tickbarr"}), 400
+
+    return _latest_hash_response(tickbarr)
+
+@app.route('/get_hash/<tickbarr>', methods=['GET'])
+def get_hash_by_tickbarr(tickbarr):
+    """
+    Variante GET de /get_hash para que el navegador y los proxies puedan
+    cachear la respuesta y revalidarla con If-None-Match.
+    """
+    return _latest_hash_response(tickbarr)
+
+def _latest_hash_response(tickbarr):
+    """
+    Construye la respuesta de /get_hash. El ETag es el hash actual; como un
+    tickbarr puede recibir nuevas versiones, solo se cachea por poco tiempo.
+    """
     conn = None
     cursor = None
     try:
-        data = request.json
-        tickbarr = data.get("tickbarr")
-
-        if not tickbarr:
-            return jsonify({"error": "Falta el parámetro tickbarr"}), 400
-
         # Conectar a la base de datos usando la función existente
         conn = connect_to_my_db()
         if not conn:
@@ -169,24 +264,21 @@ def get_hash():
 
         cursor = conn.cursor()
 
-        # Consultar el hash más reciente del tickbarr
-        query = """
-        SELECT TTICKHASH FROM apdobloctrazhash
-        WHERE TTICKBARR = %s
-        ORDER BY TNUMEVERS DESC
-        LIMIT 1
-        """
-        cursor.execute(query, (tickbarr,))
+        # Consultar el hash vigente del tickbarr (acceso por clave primaria)
+        cursor.execute(LATEST_HASH_SQL, (tickbarr,))
         result = cursor.fetchone()
 
         if result:
             hash_value = result[0]
             print(f"Hash encontrado para tickbarr {tickbarr}: {hash_value}")
-            return jsonify({
+            response = jsonify({
                 "tickbarr": tickbarr,
                 "hash": hash_value,
                 "mensaje": "Hash encontrado exitosamente"
-            }), 200
+            })
+            response.set_etag(hash_value)
+            response.headers["Cache-Control"] = HASH_CACHE_CONTROL
+            return response.make_conditional(request)
         else:
             return jsonify({
                 "error": "No se encontró hash para el tickbarr proporcionado"
@@ -202,11 +294,225 @@ def get_hash():
         if conn:
             conn.close()
 
+@app.route('/resolve_tickbarrs', methods=['POST'])
+@limit_concurrency(swarm_bulkhead)
+def resolve_tickbarrs():
+    """
+    Resuelve varios tickbarrs (o todas las prendas de una caja) a su hash más
+    reciente y, opcionalmente, a su documento de Swarm en una sola llamada.
+
+    Body JSON:
+        - tickbarrs: Lista de tickbarrs (máximo MAX_BATCH_TICKBARRS)
+        - numecaja: Número de caja, alternativa a tickbarrs
+        - include_documents: Si incluir los documentos de Swarm (default: true)
+        - stream: Si responder en NDJSON, una línea por prenda (default: false)
+    """
+    conn = None
+    try:
+        data = request.json or {}
+        tickbarrs = data.get("tickbarrs") or []
+        numecaja = data.get("numecaja")
+        include_documents = data.get("include_documents", True)
+        stream = data.get("stream", False)
+
+        if not isinstance(tickbarrs, list):
+            return jsonify({"error": "El parámetro tickbarrs debe ser una lista"}), 400
+
+        tickbarrs = list(dict.fromkeys(str(t).strip() for t in tickbarrs if str(t).strip()))
+
+        if not tickbarrs and not numecaja:
+            return jsonify({"error": "Debe proporcionar tickbarrs o numecaja"}), 400
+
+        if len(tickbarrs) > MAX_BATCH_TICKBARRS:
+            return jsonify({
+                "error": f"Se aceptan como máximo {MAX_BATCH_TICKBARRS} tickbarrs por llamada"
+            }), 400
+
+        conn = connect_to_my_db()
+        if not conn:
+            return jsonify({"error": "Error de conexión a la base de datos"}), 500
+
+        rows = get_latest_hashes(conn, tickbarrs=tickbarrs, numecaja=numecaja)
+        conn.close()
+        conn = None
+
+        if numecaja and not tickbarrs and len(rows) > MAX_BATCH_TICKBARRS:
+            return jsonify({
+                "error": f"La caja tiene {len(rows)} prendas, el máximo por llamada es {MAX_BATCH_TICKBARRS}"
+            }), 400
+
+        found = {row["TTICKBARR"] for row in rows}
+        not_found = [t for t in tickbarrs if t not in found]
+
+        if stream:
+            def generate():
+                # Se descarga por bloques para que las primeras líneas salgan
+                # antes de tener todos los documentos
+                for start in range(0, len(rows), BATCH_STREAM_CHUNK):
+                    chunk = rows[start:start + BATCH_STREAM_CHUNK]
+                    documents = {}
+                    if include_documents:
+                        documents = fetch_swarm_documents([row["TTICKHASH"] for row in chunk])
+                    for line in _batch_ndjson_lines(chunk, documents, include_documents):
+                        yield line
+                for tickbarr in not_found:
+                    yield json.dumps({
+                        "tickbarr": tickbarr,
+                        "hash": None,
+                        "error": "No se encontró hash para el tickbarr"
+                    }, ensure_ascii=False).encode("utf-8") + b"\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        documents = {}
+        if include_documents and rows:
+            documents = fetch_swarm_documents([row["TTICKHASH"] for row in rows])
+
+        results = []
+        for row in rows:
+            item = {
+                "tickbarr": row["TTICKBARR"],
+                "version": row["TNUMEVERS"],
+                "hash": row["TTICKHASH"]
+            }
+            if include_documents:
+                document = documents.get(row["TTICKHASH"])
+                item["document"] = None
+                if document is None:
+                    item["error"] = "No se pudo obtener el documento"
+                else:
+                    # Un documento corrupto solo afecta a su prenda, no a todo el lote
+                    try:
+                        item["document"] = json.loads(document)
+                    except ValueError:
+                        item["error"] = "El documento de Swarm no es JSON válido"
+            results.append(item)
+
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "data": results,
+            "not_found": not_found
+        }), 200
+
+    except Exception as e:
+        print(f"Error en resolve_tickbarrs: {e}")
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    Autocompletado por prefijo o subcadena sobre caja, estilo, etiqueta y tickbarr.
+
+    Query params:
+        - q: Texto parcial (mínimo SEARCH_MIN_CHARS caracteres)
+        - fields: Campos separados por coma (numecaja, esticlie, etiqclie, tickbarr). Default: todos
+        - limit: Candidatos por campo (default 10, máximo SEARCH_MAX_LIMIT)
+
+    Returns:
+        - results: {campo: [{value, count, match}]} con las coincidencias exactas,
+          luego prefijos y luego subcadenas, cada grupo por cantidad de prendas
+    """
+    query = (request.args.get("q") or "").strip()
+    if len(query) < SEARCH_MIN_CHARS:
+        return jsonify({"error": f"El parámetro q debe tener al menos {SEARCH_MIN_CHARS} caracteres"}), 400
+
+    allowed_fields = list(SEARCH_FIELDS) + ["tickbarr"]
+    fields = [f.strip() for f in (request.args.get("fields") or "").split(",") if f.strip()] or allowed_fields
+    invalid = [f for f in fields if f not in allowed_fields]
+    if invalid:
+        return jsonify({"error": f"Campos no soportados: {', '.join(invalid)}"}), 400
+
+    limit = request.args.get("limit", 10, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    try:
+        return jsonify({
+            "query": query,
+            "results": search_values(query, fields, limit)
+        }), 200
+    except Exception as e:
+        print(f"Error en search: {e}")
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+@app.route('/facets', methods=['POST'])
+def facets():
+    """
+    Cantidad de prendas por cliente, género, edad, tipo de prenda, tejido y talla
+    bajo la selección actual, leída de la tabla agregada apdobloctrazface.
+
+    Body JSON:
+        - filters: Selección actual con claves de FilterState
+          (client, gender, age, garmentType, fabric, size). Opcional.
+        - limit: Máximo de valores por faceta (default 200)
+
+    Returns:
+        - total: Prendas que cumplen toda la selección
+        - facets: {faceta: [{value, count}]}; cada faceta ignora su propio filtro
+    """
+    try:
+        data = request.json or {}
+        filters = data.get("filters") or {}
+        if not isinstance(filters, dict):
+            return jsonify({"error": "El parámetro filters debe ser un objeto"}), 400
+
+        unknown = [key for key, value in filters.items() if value and key not in FACET_DIMENSIONS]
+        try:
+            limit = max(1, min(int(data.get("limit", 200)), 1000))
+        except (TypeError, ValueError):
+            return jsonify({"error": "El parámetro limit debe ser un número"}), 400
+
+        result = get_facet_counts(filters, limit)
+        if result is None:
+            return jsonify({"error": "Error de conexión a la base de datos"}), 500
+
+        result["success"] = True
+        # clientStyle, boxNumber y label no son facetas: se informan como ignorados
+        result["ignored_filters"] = unknown
+        return jsonify(result), 200
+
+    except Exception as e:
+        print(f"Error en facets: {e}")
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+def _encode_filter_cursor(row):
+    """Cursor opaco con la clave (TFECHGUAR, TTICKBARR) de la última fila entregada (fecha puede ser null)."""
+    raw = json.dumps([row["TFECHGUAR"], row["TTICKBARR"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_filter_cursor(cursor_value):
+    """
+    Decodifica un cursor de /filter_data.
+
+    Returns:
+        tuple: (fecha o None, tickbarr) o None si el cursor no es válido
+    """
+    try:
+        fecha, tickbarr = json.loads(base64.urlsafe_b64decode(cursor_value.encode("ascii")))
+        return (None if fecha is None else str(fecha)), str(tickbarr)
+    except Exception:
+        return None
+
+
 @app.route('/filter_data', methods=['POST'])
 def filter_data():
     """
-    Filtra datos de apdobloctrazhash según parámetros opcionales.
+    Filtra la versión vigente de cada prenda (apdobloctrazactu) según parámetros opcionales.
     Acepta 1 o más filtros: numecaja, esticlie, etiqclie, coditall
+
+    Body JSON (además de los filtros):
+        - limit: Filas por página (default FILTER_PAGE_SIZE, máximo FILTER_MAX_PAGE_SIZE)
+        - cursor: Valor next_cursor de la página anterior
+        - stream: Si responder en NDJSON con todas las filas desde el cursor (default: false)
+
+    Returns:
+        - data: Filas de la página, de la más reciente a la más antigua
+        - has_more / next_cursor: Si hay más filas y el cursor para pedirlas
     """
     conn = None
     cursor = None
@@ -216,26 +522,10 @@ def filter_data():
         esticlie = data.get("esticlie")
         etiqclie = data.get("etiqclie")
         coditall = data.get("coditall")
+        stream = data.get("stream", False)
 
         # Construir query dinámicamente según los filtros proporcionados
-        where_clauses = []
-        params = []
-
-        if numecaja:
-            where_clauses.append("TNUMECAJA = %s")
-            params.append(numecaja)
-
-        if esticlie:
-            where_clauses.append("TESTICLIE = %s")
-            params.append(esticlie)
-
-        if etiqclie:
-            where_clauses.append("TETIQCLIE = %s")
-            params.append(etiqclie)
-
-        if coditall:
-            where_clauses.append("TCODITALL = %s")
-            params.append(coditall)
+        where_clauses, params = filter_data_where(data)
 
         # Validar que al menos un filtro fue proporcionado
         if not where_clauses:
@@ -243,61 +533,81 @@ def filter_data():
                 "error": "Debe proporcionar al menos un filtro (numecaja, esticlie, etiqclie o coditall)"
             }), 400
 
+        after = None
+        if data.get("cursor"):
+            after = _decode_filter_cursor(data["cursor"])
+            if not after:
+                return jsonify({"error": "Cursor inválido"}), 400
+
+        try:
+            limit = int(data.get("limit", FILTER_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return jsonify({"error": "El parámetro limit debe ser un número"}), 400
+        if limit < 1 or limit > FILTER_MAX_PAGE_SIZE:
+            return jsonify({"error": f"El parámetro limit debe estar entre 1 y {FILTER_MAX_PAGE_SIZE}"}), 400
+
+        filters_applied = {
+            "numecaja": numecaja,
+            "esticlie": esticlie,
+            "etiqclie": etiqclie,
+            "coditall": coditall
+        }
+
         # Conectar a la base de datos
         conn = connect_to_my_db()
         if not conn:
             return jsonify({"error": "Error de conexión a la base de datos"}), 500
 
+        if stream:
+            query, query_params = filter_data_query(where_clauses, params, after=after)
+            stream_conn = conn
+            conn = None  # La conexión pasa a ser del generador
+
+            def generate():
+                # Cursor del lado del servidor: las filas se leen por bloques
+                # sin cargar todo el resultado en memoria
+                stream_cursor = stream_conn.cursor(pymysql.cursors.SSDictCursor)
+                try:
+                    stream_cursor.execute(query, query_params)
+                    while True:
+                        rows = stream_cursor.fetchmany(FILTER_STREAM_CHUNK)
+                        if not rows:
+                            break
+                        yield b"".join(dumps_bytes(row) + b"\n" for row in rows)
+                finally:
+                    stream_cursor.close()
+                    stream_conn.close()
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
         cursor = conn.cursor(pymysql.cursors.DictCursor)  # Usar DictCursor para obtener resultados como diccionarios
 
-        # Construir query completo
-        where_sql = " AND ".join(where_clauses)
-        query = f"""
-        SELECT
-            TTICKBARR,
-            TNUMEVERS,
-            TNUMECAJA,
-            TESTICLIE,
-            TETIQCLIE,
-            TCODITALL,
-            TTICKHASH,
-            TFECHGUAR
-        FROM apdobloctrazhash
-        WHERE {where_sql}
-        ORDER BY TFECHGUAR DESC
-        """
-
-        cursor.execute(query, tuple(params))
+        # Se pide una fila extra para saber si existe una página siguiente
+        query, query_params = filter_data_query(where_clauses, params, after=after, limit=limit + 1)
+        cursor.execute(query, query_params)
         results = cursor.fetchall()
 
-        if results:
-            # Convertir datetime a string para JSON serialization
-            for row in results:
-                if 'TFECHGUAR' in row and row['TFECHGUAR']:
-                    row['TFECHGUAR'] = row['TFECHGUAR'].strftime('%Y-%m-%d %H:%M:%S')
+        has_more = len(results) > limit
+        results = results[:limit]
+        next_cursor = _encode_filter_cursor(results[-1]) if has_more else None
 
+        if results:
             return jsonify({
                 "success": True,
                 "count": len(results),
-                "filters_applied": {
-                    "numecaja": numecaja,
-                    "esticlie": esticlie,
-                    "etiqclie": etiqclie,
-                    "coditall": coditall
-                },
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+                "filters_applied": filters_applied,
                 "data": results
             }), 200
         else:
             return jsonify({
                 "success": True,
                 "count": 0,
+                "has_more": False,
+                "next_cursor": None,
                 "message": "No se encontraron resultados con los filtros proporcionados",
-                "filters_applied": {
-                    "numecaja": numecaja,
-                    "esticlie": esticlie,
-                    "etiqclie": etiqclie,
-                    "coditall": coditall
-                },
+                "filters_applied": filters_applied,
                 "data": []
             }), 200
 
@@ -312,6 +622,7 @@ def filter_data():
             conn.close()
 
 @app.route('/chat', methods=['POST'])
+@limit_concurrency(chat_bulkhead)
 def chat():
     """
     Endpoint del chatbot de trazabilidad.
@@ -324,9 +635,17 @@ def chat():
         - user_code: Codigo del usuario para historial (opcional)
         - user_name: Nombre del usuario para historial (opcional)
         - conversation_group: Grupo de conversacion actual (opcional)
+        - stream: Si responder en NDJSON con el avance y la respuesta por fragmentos (default: false).
+          Cada línea es {"type": "progress" | "token" | "token_reset" | "result" | "failed", ...}
+        - debug: Si incluir en la respuesta el resumen de la traza de latencia (default: false)
+
+    Headers:
+        - X-Request-ID: Id de la traza (opcional; si falta se genera uno y se devuelve en la respuesta)
 
     Returns:
         - response: Respuesta del chatbot
+        - request_id: Id de la traza en logs/chat_traces.jsonl
+        - trace: Duración por etapa, tokens, tiempo SQL, filas y hashes (solo con debug)
         - model_used: Modelo de IA utilizado
         - corrections: Correcciones realizadas en la pregunta
         - extracted_filters: Filtros extraídos de la pregunta para sincronizar con UI
@@ -336,105 +655,32 @@ def chat():
     try:
         data = request.json
         question = data.get("question")
-        model = data.get("model", "deepseek").lower()
-        filters = data.get("filters", {})
-        user_code = data.get("user_code")
-        user_name = data.get("user_name", "Usuario")
-        conversation_group = data.get("conversation_group")
 
         if not question:
             return jsonify({"error": "Falta el parámetro 'question'"}), 400
 
-        # Configurar el modelo de IA según el parámetro
-        if model == "gemini":
-            set_ai_model(AIModel.GEMINI)
-        else:
-            set_ai_model(AIModel.DEEPSEEK)
-
-        print(f"[CHAT API] Pregunta original: {question}")
-        print(f"[CHAT API] Modelo: {model}")
-        print(f"[CHAT API] Filtros recibidos: {filters}")
-        print(f"[CHAT API] Usuario: {user_code}, Grupo conversacion: {conversation_group}")
-
-        # PASO 1: Corregir errores tipográficos en la pregunta
-        corrected_question, corrections = correct_user_input_with_ai(question)
-
-        if corrections:
-            print(f"[CHAT API] Correcciones aplicadas: {corrections}")
-            print(f"[CHAT API] Pregunta corregida: {corrected_question}")
-
-        # PASO 2: Extraer filtros de la pregunta corregida
-        extracted_filters = extract_filters_from_question(corrected_question, corrections)
-        print(f"[CHAT API] Filtros extraídos: {extracted_filters}")
-
-        # PASO 3: Combinar filtros del UI con los extraídos de la pregunta
-        # Los filtros del UI tienen prioridad (no se sobrescriben)
-        final_filters = extracted_filters.copy()
-        for key, value in filters.items():
-            if value and str(value).strip():
-                final_filters[key] = value  # UI filters override extracted
-
-        # PASO 4: Agregar filtros al contexto de la pregunta para el orquestador
-        question_with_context = corrected_question
-
-        # Agregar contexto del historial de conversacion si existe
-        if user_code and conversation_group:
-            history_context = get_conversation_context_for_ai(user_code, conversation_group)
-            if history_context:
-                question_with_context = f"{history_context}\n\nPregunta actual del usuario: {corrected_question}"
-                print(f"[CHAT API] Contexto de historial agregado")
-
-        if final_filters and any(final_filters.values()):
-            filter_context = []
-            filter_mappings = {
-                "client": ("cliente", "TDESCCLIE"),
-                "clientStyle": ("estilo cliente", "TESTICLIE"),
-                "boxNumber": ("número de caja", "TNUMECAJA"),
-                "label": ("etiqueta", "TETIQCLIE"),
-                "size": ("talla", "TCODITALL"),
-                "gender": ("género", "TTIPOGENE"),
-                "age": ("edad", "TTIPOEDAD"),
-                "garmentType": ("tipo de prenda", "TTIPOPREN"),
-            }
-
-            for key, value in final_filters.items():
-                if value and key in filter_mappings:
-                    filter_name, _ = filter_mappings[key]
-                    filter_context.append(f"{filter_name}: {value}")
-
-            if filter_context:
-                question_with_context = f"{question_with_context} (Filtrar por: {', '.join(filter_context)})"
-
-        print(f"[CHAT API] Pregunta final con contexto: {question_with_context[:200]}...")
-
-        # PASO 5: Llamar al orquestador del chatbot
-        response = orquestador_bot(question_with_context, auto_confirm=True)
-
-        # PASO 6: Guardar en historial si hay usuario
-        if user_code and conversation_group:
-            save_success = save_chat_message(
-                user_code=user_code,
-                user_name=user_name,
-                conversation_group=conversation_group,
-                question=question,  # Guardamos la pregunta original
-                answer=response
-            )
-            if save_success:
-                print(f"[CHAT API] Mensaje guardado en historial")
-            else:
-                print(f"[CHAT API] Error al guardar mensaje en historial")
-
-        return jsonify({
-            "success": True,
-            "response": response,
-            "model_used": model,
-            "filters_applied": final_filters if any(final_filters.values()) else None,
-            # Nuevos campos para sincronización bidireccional
-            "corrections": corrections if corrections else None,
-            "extracted_filters": extracted_filters,
-            "corrected_question": corrected_question if corrections else None,
-            "conversation_group": conversation_group
-        }), 200
+        if data.get("stream", False):
+            # El pipeline corre como job y esta respuesta reenvía sus eventos
+            job = chat_job_store.submit(_chat_params(data))
+            if job is None:
+                return jsonify({"error": "Hay demasiadas consultas en curso, intenta de nuevo en unos segundos"}), 503
+
+            def generate():
+                for event in _iter_job_events(job, -1):
+                    if event is None:
+                        yield b"\n"  # Mantiene viva la conexión
+                        continue
+                    line = dict(event["data"], type=event["type"])
+                    yield dumps_bytes(line) + b"\n"
+
+            response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+            response.headers["X-Accel-Buffering"] = "no"
+            return response
+
+        result = run_chat_pipeline(request_id=request.headers.get("X-Request-ID"), **_chat_params(data))
+        response = jsonify(result)
+        response.headers["X-Request-ID"] = result["request_id"]
+        return response, 200
 
     except Exception as e:
         print(f"Error en /chat: {e}")
@@ -446,6 +692,114 @@ def chat():
         }), 500
 
 
+def _chat_params(data):
+    """Parámetros de run_chat_pipeline a partir del body de /chat."""
+    return {
+        "question": data.get("question"),
+        "model": data.get("model", "deepseek").lower(),
+        "filters": data.get("filters", {}),
+        "user_code": data.get("user_code"),
+        "user_name": data.get("user_name", "Usuario"),
+        "conversation_group": data.get("conversation_group"),
+        "debug": bool(data.get("debug", False))
+    }
+
+
+# -------------------- Jobs del Chat en segundo plano --------------------
+
+def _iter_job_events(job, after_id):
+    """
+    Recorre los eventos de un job a medida que se producen hasta el evento
+    final ('result' o 'failed'). Entrega None cada SSE_KEEPALIVE_SECONDS sin eventos.
+    """
+    while True:
+        events = job.wait_for_events(after_id, timeout=SSE_KEEPALIVE_SECONDS)
+        if not events:
+            if job.finished:
+                return
+            yield None
+            continue
+        for event in events:
+            after_id = event["id"]
+            yield event
+            if event["type"] in ("result", "failed"):
+                return
+
+@app.route('/chat/jobs', methods=['POST'])
+def create_chat_job():
+    """
+    Encola una pregunta al chatbot y responde de inmediato con el id del job.
+    Acepta el mismo body que /chat.
+
+    Returns:
+        - job_id: Id del job
+        - status_url: Estado y resultado (polling)
+        - events_url: Avance y resultado por Server-Sent Events
+    """
+    data = request.json or {}
+    if not data.get("question"):
+        return jsonify({"error": "Falta el parámetro 'question'"}), 400
+
+    job = chat_job_store.submit(_chat_params(data))
+    if job is None:
+        response = jsonify({"error": "Hay demasiadas consultas en curso, intenta de nuevo en unos segundos"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "15"
+        return response
+
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/chat/jobs/{job.id}",
+        "events_url": f"/chat/jobs/{job.id}/events"
+    }), 202
+
+
+@app.route('/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Estado, etapas completadas y resultado (cuando termina) de un job."""
+    job = chat_job_store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado o expirado"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/chat/jobs/<job_id>/events', methods=['GET'])
+@limit_concurrency(events_bulkhead)
+def chat_job_events(job_id):
+    """
+    Server-Sent Events del job: 'progress' con cada etapa, 'token' con cada
+    fragmento de la respuesta final ('token_reset' si se reintenta la
+    generación) y un evento final 'result' o 'failed'. Soporta reconexión
+    con Last-Event-ID.
+    """
+    job = chat_job_store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado o expirado"}), 404
+
+    last_event_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id", "-1"))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = -1
+
+    def generate():
+        yield "retry: 3000\n\n"
+        for event in _iter_job_events(job, last_event_id):
+            if event is None:
+                # Comentario SSE para que proxies no cierren la conexión inactiva
+                yield ": keepalive\n\n"
+                continue
+            payload = json.dumps(event["data"], ensure_ascii=False)
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 # -------------------- Endpoints de Historial del Chat --------------------
 
 @app.route('/chat/new_conversation', methods=['POST'])
@@ -594,29 +948,141 @@ def delete_chat_conversation():
         }), 500
 
 @app.route('/get_swarm_data', methods=['POST'])
+@limit_concurrency(swarm_bulkhead)
 def get_swarm_data():
     """
     Proxy endpoint para obtener datos JSON desde Ethereum Swarm.
     Recibe un hash y retorna el JSON almacenado en Swarm.
     """
+    data = request.json
+    hash_value = data.get("hash")
+
+    if not hash_value:
+        return jsonify({"error": "Falta el parámetro hash"}), 400
+
+    return _swarm_document_response(hash_value)
+
+@app.route('/get_swarm_data/<hash_value>', methods=['GET'])
+@limit_concurrency(swarm_bulkhead)
+def get_swarm_data_by_hash(hash_value):
+    """
+    Variante GET de /get_swarm_data. Como el contenido de una referencia Swarm
+    nunca cambia, el navegador y los proxies pueden cachearla indefinidamente.
+    """
+    return _swarm_document_response(hash_value)
+
+@app.route('/get_swarm_sections', methods=['POST'])
+@limit_concurrency(swarm_bulkhead)
+def get_swarm_sections():
+    """
+    Retorna solo las secciones/campos pedidos de un documento de Swarm.
+
+    Body JSON:
+        - hash: Referencia Swarm del documento (requerido)
+        - sections: Lista de secciones, ej: ["tztotrazwebtint", "tztotrazwebacab"]
+        - fields: Lista de campos, "CAMPO" o "seccion.CAMPO" (opcional)
+    """
+    data = request.json or {}
+    hash_value = data.get("hash")
+
+    if not hash_value:
+        return jsonify({"error": "Falta el parámetro hash"}), 400
+
+    return _swarm_sections_response(hash_value, data.get("sections"), data.get("fields"))
+
+@app.route('/get_swarm_data/<hash_value>/sections', methods=['GET'])
+@limit_concurrency(swarm_bulkhead)
+def get_swarm_sections_by_hash(hash_value):
+    """
+    Variante GET cacheable de /get_swarm_sections.
+    Query string: ?sections=tztotrazwebtint,tztotrazwebacab&fields=TNOMBMAQUACAB
+    """
+    sections = [s for s in request.args.get("sections", "").split(",") if s.strip()]
+    fields = [f for f in request.args.get("fields", "").split(",") if f.strip()]
+    return _swarm_sections_response(hash_value, sections, fields)
+
+def _swarm_sections_response(hash_value, sections, fields):
+    """
+    Proyección de un documento servida desde su forma parseada en caché.
+    El ETag combina la referencia con la proyección pedida, por lo que
+    también es inmutable.
+    """
     try:
-        data = request.json
-        hash_value = data.get("hash")
+        if not is_valid_swarm_reference(hash_value):
+            return jsonify({"error": "El hash no es una referencia Swarm válida"}), 400
 
-        if not hash_value:
-            return jsonify({"error": "Falta el parámetro hash"}), 400
+        if (sections is not None and not isinstance(sections, list)) or \
+                (fields is not None and not isinstance(fields, list)):
+            return jsonify({"error": "sections y fields deben ser listas"}), 400
 
-        # Llamar al gateway de Swarm
-        swarm_url = f"https://api.gateway.ethswarm.org/bzz/{hash_value}"
-        response = requests.get(swarm_url, timeout=30)
+        sections = [str(s).strip() for s in sections or []]
+        fields = [str(f).strip() for f in fields or []]
 
-        if response.status_code == 200:
-            return jsonify(response.json()), 200
-        else:
-            return jsonify({
-                "error": f"Error al obtener datos de Swarm: {response.status_code}"
-            }), response.status_code
+        projection_key = ",".join(sections) + "|" + ",".join(fields)
+        etag = f"{hash_value}-{hashlib.sha1(projection_key.encode('utf-8')).hexdigest()[:16]}"
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = DOCUMENT_CACHE_CONTROL
+            return response
+
+        body, missing = project_swarm_document(hash_value, sections or None, fields or None)
+
+        response = Response(body, status=200, content_type="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = DOCUMENT_CACHE_CONTROL
+        if missing:
+            response.headers["X-Missing-Sections"] = ",".join(missing)
+        return response
+
+    except SwarmGatewayError as e:
+        return jsonify({
+            "error": f"Error al obtener datos de Swarm: {e.status_code}"
+        }), e.status_code
+    except requests.exceptions.Timeout:
+        return jsonify({"error": "Timeout al conectar con Swarm gateway"}), 504
+    except requests.exceptions.RequestException as e:
+        print(f"Error de conexión con Swarm: {e}")
+        return jsonify({"error": "Error de conexión con Swarm gateway"}), 502
+    except Exception as e:
+        print(f"Error en get_swarm_sections: {e}")
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
+def _swarm_document_response(hash_value):
+    """
+    Reenvía el documento tal cual (bytes crudos desde la caché o el gateway),
+    sin parsearlo ni volver a serializarlo. El ETag es la propia referencia,
+    así que un If-None-Match que la contenga se responde con 304 sin tocar Swarm.
+    """
+    try:
+        if not is_valid_swarm_reference(hash_value):
+            return jsonify({"error": "El hash no es una referencia Swarm válida"}), 400
+
+        if request.if_none_match.contains_weak(hash_value):
+            response = Response(status=304)
+            response.set_etag(hash_value)
+            response.headers["Cache-Control"] = DOCUMENT_CACHE_CONTROL
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        accept_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+        document = open_swarm_document_stream(hash_value, accept_gzip=accept_gzip)
+
+        response = Response(document.body, status=200, content_type=document.content_type)
+        response.set_etag(hash_value)
+        response.headers["Cache-Control"] = DOCUMENT_CACHE_CONTROL
+        response.headers["Vary"] = "Accept-Encoding"
+        if document.content_encoding:
+            response.headers["Content-Encoding"] = document.content_encoding
+        if document.content_length is not None:
+            response.headers["Content-Length"] = str(document.content_length)
+        return response
+
+    except SwarmGatewayError as e:
+        return jsonify({
+            "error": f"Error al obtener datos de Swarm: {e.status_code}"
+        }), e.status_code
     except requests.exceptions.Timeout:
         return jsonify({"error": "Timeout al conectar con Swarm gateway"}), 504
     except requests.exceptions.RequestException as e:
@@ -626,5 +1092,24 @@ def get_swarm_data():
         print(f"Error en get_swarm_data: {e}")
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
+@app.route('/health', methods=['GET'])
+def health():
+    """Estado del proceso y ocupación de los grupos de concurrencia."""
+    return jsonify({
+        "status": "ok",
+        "bulkheads": {
+            "chat": chat_bulkhead.stats(),
+            "swarm": swarm_bulkhead.stats(),
+            "events": events_bulkhead.stats()
+        },
+        "answer_cache": answer_cache.stats()
+    }), 200
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Servidor de desarrollo. En producción: gunicorn -c gunicorn.conf.py backend:app
+    app.run(
+        debug=os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true"),
+        host='0.0.0.0',
+        port=int(os.getenv("PORT", "5000")),
+        threaded=True
+    )
\ No newline at end of file
@@ -0,0 +1,90 @@
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from http_encoding import dumps_bytes, compress_bytes, available_encodings, orjson
+
+# ============================================================================
+# BENCHMARK DE SERIALIZACIÓN Y COMPRESIÓN
+# ============================================================================
+# Mide con datos sintéticos del tamaño de las respuestas grandes de la API:
+# una página de /filter_data y un documento de trazabilidad de Swarm.
+# Uso: python bench_encoding.py --rows 5000 --repeat 20
+
+
+def build_filter_rows(count):
+    """Filas con la forma de /filter_data."""
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "TTICKBARR": f"{100000000000 + i}",
+            "TNUMEVERS": random.randint(1, 4),
+            "TNUMECAJA": f"CJ{random.randint(1, 400):05d}",
+            "TESTICLIE": f"EST-{random.randint(1, 80):03d}",
+            "TETIQCLIE": f"ETQ{random.randint(1, 300):04d}",
+            "TCODITALL": random.choice(["XS", "S", "M", "L", "XL"]),
+            "TTICKHASH": "%064x" % random.getrandbits(256),
+            "TFECHGUAR": start + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def build_document(sections=12, items=60):
+    """Documento con secciones de procesos como los JSON guardados en Swarm."""
+    return {
+        f"seccion_{s}": [
+            {
+                "proceso": f"Proceso {s}-{i}",
+                "maquina": f"MAQ-{random.randint(1, 99):02d}",
+                "operario": f"Operario {random.randint(1, 500)}",
+                "cantidad": random.randint(1, 1000),
+                "merma": round(random.random() * 5, 3),
+                "fecha": (datetime(2024, 3, 1) + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                "observacion": "Sin observaciones" if i % 3 else "Revisión de calidad conforme",
+            }
+            for i in range(items)
+        ]
+        for s in range(sections)
+    }
+
+
+def timed(function, repeat):
+    """Mejor tiempo en ms de repeat ejecuciones y el último resultado."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmark(rows=5000, repeat=20):
+    payloads = {
+        f"filter_data ({rows} filas)": {"success": True, "data": build_filter_rows(rows)},
+        "documento Swarm": build_document(),
+    }
+    encoders = ["json"] + (["orjson"] if orjson is not None else [])
+
+    for name, payload in payloads.items():
+        print(f"\n=== {name} ===")
+        body = None
+        for encoder in encoders:
+            elapsed, body = timed(lambda: dumps_bytes(payload, encoder), repeat)
+            print(f"  {encoder:<8} {elapsed:8.2f} ms  {len(body):>10,} bytes")
+
+        for encoding in available_encodings():
+            elapsed, compressed = timed(lambda: compress_bytes(body, encoding), repeat)
+            ratio = len(compressed) / len(body) * 100
+            print(f"  {encoding:<8} {elapsed:8.2f} ms  {len(compressed):>10,} bytes ({ratio:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de serialización JSON y compresión de respuestas")
+    parser.add_argument("--rows", type=int, default=5000, help="Filas de /filter_data a simular")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por medición (se toma la mejor)")
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.repeat)
@@ -0,0 +1,101 @@
+import os
+import threading
+from functools import wraps
+
+from flask import jsonify, make_response
+
+# ============================================================================
+# LÍMITE DE CONCURRENCIA POR GRUPO DE ENDPOINTS (BULKHEAD)
+# ============================================================================
+# Cada worker de gunicorn atiende GUNICORN_THREADS peticiones a la vez. Los
+# endpoints lentos (el chatbot, las descargas de Swarm) solo pueden ocupar una
+# parte de esos hilos; el resto queda siempre libre para /get_hash,
+# /filter_data y demás consultas rápidas. Si el grupo está lleno se responde
+# 503 con Retry-After en vez de encolar la petición.
+
+
+class Bulkhead:
+    """Semáforo con nombre que limita cuántas peticiones de un grupo corren a la vez."""
+
+    def __init__(self, name: str, max_concurrent: int, acquire_timeout: float = 0.5, retry_after: int = 5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.acquire_timeout = acquire_timeout
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if not self._semaphore.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.active += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self.active,
+                "rejected": self.rejected
+            }
+
+
+def limit_concurrency(bulkhead: Bulkhead):
+    """
+    Decorador de endpoints Flask. El cupo se libera cuando el servidor termina
+    de enviar la respuesta, así las respuestas en streaming también cuentan.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not bulkhead.try_acquire():
+                print(f"[WARN] Bulkhead '{bulkhead.name}' lleno ({bulkhead.max_concurrent}), petición rechazada")
+                response = jsonify({
+                    "error": "El servidor está atendiendo demasiadas consultas de este tipo, intenta de nuevo en unos segundos"
+                })
+                response.status_code = 503
+                response.headers["Retry-After"] = str(bulkhead.retry_after)
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                bulkhead.release()
+                raise
+            response.call_on_close(bulkhead.release)
+            return response
+        return wrapper
+    return decorator
+
+
+# Hilos por worker (debe coincidir con gunicorn.conf.py)
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# /chat síncrono puede tardar 20-60 s por pregunta (los jobs de /chat/jobs
+# corren en su propio pool y no cuentan aquí)
+chat_bulkhead = Bulkhead(
+    "chat",
+    int(os.getenv("CHAT_MAX_CONCURRENT", str(max(1, GUNICORN_THREADS // 4)))),
+    retry_after=15
+)
+# Descargas desde el gateway de Swarm: dependen de un servicio externo
+swarm_bulkhead = Bulkhead(
+    "swarm",
+    int(os.getenv("SWARM_MAX_CONCURRENT", str(max(1, GUNICORN_THREADS // 4))))
+)
+# Suscripciones SSE a jobs del chat: el pipeline corre en chat_jobs, pero cada
+# conexión abierta ocupa un hilo mientras espera eventos
+events_bulkhead = Bulkhead(
+    "events",
+    int(os.getenv("EVENTS_MAX_CONCURRENT", str(max(1, GUNICORN_THREADS // 4))))
+)
@@ -0,0 +1,158 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_pipeline import run_chat_pipeline
+
+# ============================================================================
+# JOBS DEL CHATBOT EN SEGUNDO PLANO
+# ============================================================================
+# POST /chat/jobs devuelve un id de inmediato y el pipeline corre en un pool
+# propio, sin ocupar el hilo de la petición. El cliente consulta el estado
+# (polling) o se suscribe a los eventos de avance por SSE.
+# Los jobs viven en la memoria del proceso: con varios workers de gunicorn el
+# balanceador debe mantener afinidad, o usar un solo worker con más hilos.
+
+CHAT_JOB_WORKERS = int(os.getenv("CHAT_JOB_WORKERS", "8"))
+# Tiempo que se conserva un job terminado para que el cliente lo recoja
+CHAT_JOB_TTL = int(os.getenv("CHAT_JOB_TTL", "900"))
+# Jobs pendientes + en curso aceptados antes de rechazar nuevos
+CHAT_JOB_MAX_PENDING = int(os.getenv("CHAT_JOB_MAX_PENDING", "50"))
+
+JOB_PENDING = "pendiente"
+JOB_RUNNING = "en_curso"
+JOB_DONE = "completado"
+JOB_FAILED = "error"
+
+
+class ChatJob:
+    """Estado de una pregunta en curso y su lista de eventos de avance."""
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = JOB_PENDING
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def add_event(self, event_type, data):
+        with self._condition:
+            self.events.append({"id": len(self.events), "type": event_type, "data": data})
+            self._condition.notify_all()
+
+    def finish(self, status, event_type, data):
+        """
+        Agrega el evento final y marca el job como terminado en un solo paso:
+        quien vea el job terminado ya encuentra el evento en la lista.
+        """
+        with self._condition:
+            self.events.append({"id": len(self.events), "type": event_type, "data": data})
+            self.finished_at = time.time()
+            self.status = status
+            self._condition.notify_all()
+
+    def wait_for_events(self, after_id, timeout):
+        """
+        Espera eventos con id mayor a after_id.
+
+        Returns:
+            list: Eventos nuevos (vacía si venció el timeout)
+        """
+        with self._condition:
+            if len(self.events) <= after_id + 1 and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[after_id + 1:]
+
+    def to_dict(self):
+        with self._condition:
+            progress = [e["data"] for e in self.events if e["type"] == "progress"]
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 1)
+        }
+
+
+class ChatJobStore:
+    """Registro de jobs en memoria con su pool de ejecución."""
+
+    def __init__(self, max_workers=CHAT_JOB_WORKERS, ttl=CHAT_JOB_TTL, max_pending=CHAT_JOB_MAX_PENDING):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-job")
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished and now - job.finished_at > self.ttl
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, params):
+        """
+        Crea un job y lo encola.
+
+        Returns:
+            ChatJob o None si hay demasiados jobs sin terminar
+        """
+        self._purge_expired()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_pending:
+                return None
+            job = ChatJob(params)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = JOB_RUNNING
+        job.add_event("progress", {"stage": "inicio", "message": "Procesando la pregunta"})
+
+        def on_progress(stage, message):
+            job.add_event("progress", {"stage": stage, "message": message})
+
+        def on_token(text):
+            # None marca el inicio de un intento nuevo: el cliente descarta lo recibido
+            if text is None:
+                job.add_event("token_reset", {})
+            else:
+                job.add_event("token", {"text": text})
+
+        try:
+            # El id del job es también el request id de la traza
+            job.result = run_chat_pipeline(
+                progress_callback=on_progress, token_callback=on_token, request_id=job.id, **job.params
+            )
+            job.finish(JOB_DONE, "result", job.result)
+        except Exception as e:
+            print(f"Error en job de chat {job.id}: {e}")
+            traceback.print_exc()
+            job.error = f"Error al procesar la consulta: {str(e)}"
+            job.finish(JOB_FAILED, "failed", {"error": job.error})
+
+
+chat_job_store = ChatJobStore()
@@ -0,0 +1,349 @@
+from chatbot import (
+    orquestador_bot,
+    use_ai_model,
+    AIModel,
+    correct_user_input_with_ai,
+    extract_filters_from_question,
+    understand_question,
+    validate_extracted_filters,
+    analyze_entities,
+    answer_without_llm,
+    USE_UNDERSTAND_STAGE
+)
+from db import save_chat_message, get_conversation_context_for_ai
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from entity_matching import normalize_text
+from ingestion_watermark import current_watermark
+from tracing import start_trace
+from pipeline_context import PipelineContext
+from task_graph import TaskGraph
+
+# ============================================================================
+# PIPELINE COMPLETO DE UNA PREGUNTA AL CHATBOT
+# ============================================================================
+# Lo usan tanto /chat (respuesta síncrona) como los jobs de /chat/jobs.
+
+# Clave de FilterState (frontend) -> (nombre legible, columna)
+FILTER_MAPPINGS = {
+    "client": ("cliente", "TDESCCLIE"),
+    "clientStyle": ("estilo cliente", "TESTICLIE"),
+    "boxNumber": ("número de caja", "TNUMECAJA"),
+    "label": ("etiqueta", "TETIQCLIE"),
+    "size": ("talla", "TCODITALL"),
+    "gender": ("género", "TTIPOGENE"),
+    "age": ("edad", "TTIPOEDAD"),
+    "garmentType": ("tipo de prenda", "TTIPOPREN"),
+}
+
+
+def _filter_context(filters):
+    """Filtros con valor en forma legible, ej "cliente: LACOSTE, talla: M"."""
+    parts = []
+    for key, value in (filters or {}).items():
+        if value and str(value).strip() and key in FILTER_MAPPINGS:
+            filter_name, _ = FILTER_MAPPINGS[key]
+            parts.append(f"{filter_name}: {value}")
+    return ", ".join(parts)
+
+
+def run_chat_pipeline(question, model="deepseek", filters=None, user_code=None, user_name="Usuario",
+                      conversation_group=None, progress_callback=None, token_callback=None,
+                      request_id=None, debug=False):
+    """
+    Ejecuta el pipeline dentro de una traza de latencia (ver tracing.py).
+
+    Args:
+        request_id: Identificador de la petición para la traza (opcional)
+        debug: Si es True, agrega a la respuesta el resumen de la traza
+        (el resto, igual que _answer_question)
+
+    Returns:
+        dict: Cuerpo de respuesta de /chat, con request_id y, en debug, trace
+    """
+    # El modelo se fija solo para esta petición; las demás en curso usan el suyo
+    ai_model = AIModel.GEMINI if model == "gemini" else AIModel.DEEPSEEK
+    with start_trace(request_id) as trace, use_ai_model(ai_model):
+        context = PipelineContext(question, request_id=trace.request_id)
+        result = _answer_question(
+            context, model=model, filters=filters, user_code=user_code, user_name=user_name,
+            conversation_group=conversation_group, progress_callback=progress_callback,
+            token_callback=token_callback
+        )
+    print(f"[CHAT API] Tiempos: {context.timings_summary()}")
+    totals = trace.summary()["totals"]
+    if totals["prompt_tokens_estimated"]:
+        print(f"[CHAT API] Tokens de prompts: ~{totals['prompt_tokens_estimated']} "
+              f"(ahorrados ~{totals['prompt_tokens_saved']}, en caché del proveedor {totals['cached_tokens']})")
+    result["request_id"] = trace.request_id
+    if debug:
+        result["trace"] = trace.summary()
+    return result
+
+
+def _answer_question(context, model="deepseek", filters=None, user_code=None, user_name="Usuario",
+                     conversation_group=None, progress_callback=None, token_callback=None):
+    """
+    Corrige la pregunta, extrae filtros, agrega el contexto del historial,
+    llama al orquestador y guarda el intercambio en el historial. Cada paso
+    corre una sola vez: sus resultados quedan en context y el orquestador
+    los reutiliza. Los pasos que no dependen entre sí corren en paralelo
+    (task_graph.TaskGraph).
+
+    Args:
+        context: PipelineContext con la pregunta original del usuario
+        model: Modelo de IA ("deepseek" o "gemini"), ya activo vía use_ai_model
+        filters: Filtros del panel (claves de FilterState)
+        user_code: Código del usuario para historial (opcional)
+        user_name: Nombre del usuario para historial
+        conversation_group: Grupo de conversación actual (opcional)
+        progress_callback: Función opcional callback(etapa, mensaje)
+        token_callback: Función opcional que recibe la respuesta final por fragmentos
+
+    Returns:
+        dict: Cuerpo de respuesta de /chat
+    """
+    question = context.question
+    filters = filters or {}
+
+    def report_progress(stage, message):
+        if progress_callback:
+            progress_callback(stage, message)
+
+    print(f"[CHAT API] Pregunta original: {question}")
+    print(f"[CHAT API] Modelo: {model}")
+    print(f"[CHAT API] Filtros recibidos: {filters}")
+    print(f"[CHAT API] Usuario: {user_code}, Grupo conversacion: {conversation_group}")
+
+    # PASO 0-2 como grafo de tareas: lo que no depende entre sí corre en paralelo
+    # (ej el historial se lee mientras se corrige la pregunta y se extraen filtros)
+    has_history = bool(user_code and conversation_group)
+    graph = TaskGraph("chat")
+    graph.add(
+        "historial_contexto",
+        lambda _: get_conversation_context_for_ai(user_code, conversation_group),
+        when=lambda _: has_history, stage=context.stage
+    )
+    graph.add("entidades_locales", lambda _: _local_analysis(question), stage=context.stage)
+    # La marca de ingesta se lee antes de consultar datos: si la ingesta guarda algo
+    # mientras se responde, la respuesta queda guardada con la marca vieja
+    graph.add(
+        "marca_ingesta", lambda _: current_watermark(),
+        when=lambda _: ANSWER_CACHE_ENABLED, stage=context.stage
+    )
+    # Caché de respuestas y camino rápido: solo necesitan las entidades locales.
+    # Con historial no se usan (la respuesta depende de la conversación)
+    graph.add(
+        "atajo", lambda r: _shortcut(r["entidades_locales"], filters),
+        depends_on=("entidades_locales", "marca_ingesta"),
+        when=lambda _: not has_history, stage=context.stage
+    )
+    if USE_UNDERSTAND_STAGE:
+        # El plan necesita el historial (con historial el atajo no corre)
+        graph.add(
+            "understand",
+            lambda r: _run_understand(question, r["historial_contexto"] or "", filters, report_progress),
+            depends_on=("historial_contexto", "atajo"),
+            when=lambda r: r["atajo"] is None, stage=context.stage
+        )
+    else:
+        # Corrección y filtros no necesitan el historial: corren mientras se lee
+        graph.add(
+            "correccion", lambda _: _run_correction(question, report_progress),
+            depends_on=("atajo",), when=lambda r: r["atajo"] is None, stage=context.stage
+        )
+        graph.add(
+            "filtros", lambda r: _run_filter_extraction(r["correccion"], report_progress),
+            depends_on=("correccion",), when=lambda r: r["correccion"] is not None, stage=context.stage
+        )
+    results = graph.run()
+
+    # Caché de respuestas: solo preguntas sin historial (las de seguimiento dependen de él)
+    history_context = results["historial_contexto"] or ""
+    cacheable = ANSWER_CACHE_ENABLED and not history_context
+    watermark = results["marca_ingesta"] if cacheable else None
+    local = results["entidades_locales"]
+    local_question = local.corrected_question if local else None
+    shortcut = results["atajo"]
+    # Pregunta que el atajo ya buscó en la caché (sin contar el fallo)
+    looked_up_question = local_question if ANSWER_CACHE_ENABLED and not has_history else None
+
+    cached = None
+    fast_response = None
+    if shortcut and shortcut[0] == "cache":
+        # Acierto antes de cualquier llamada al LLM: se reutiliza también la corrección
+        cached = shortcut[1]
+        payload = cached["payload"]
+        context.corrected_question = payload["corrected_question"]
+        context.corrections = payload["corrections"]
+        context.extracted_filters = payload["extracted_filters"]
+    elif shortcut and shortcut[0] == "rapido":
+        # Camino rápido: conteos y listados de la DB sin plan ni respuesta del LLM
+        fast_response = shortcut[1]
+        context.corrected_question = local_question
+        context.corrections = local.corrections
+        context.extracted_filters = validate_extracted_filters(local.entities)
+    else:
+        if results.get("understand"):
+            understood = results["understand"]
+            context.corrected_question = understood["corrected_question"]
+            context.corrections = understood["corrections"]
+            context.extracted_filters = understood["filters"]
+            context.plan = understood["plan"]
+        elif results.get("filtros") is not None:
+            context.corrected_question, context.corrections = results["correccion"]
+            context.extracted_filters = results["filtros"]
+        else:
+            # understand falló: camino de varias llamadas
+            context.corrected_question, context.corrections = _run_correction(question, report_progress, context)
+            context.extracted_filters = _run_filter_extraction(
+                (context.corrected_question, context.corrections), report_progress, context
+            )
+        if cacheable and (looked_up_question is None
+                          or normalize_text(looked_up_question) != normalize_text(context.corrected_question)):
+            with context.stage("cache"):
+                cached = answer_cache.lookup(context.corrected_question, filters, count_miss=False)
+    if cacheable and cached is None:
+        # Un solo fallo por petición aunque se haya buscado dos veces
+        answer_cache.record_miss()
+
+    corrected_question, corrections = context.corrected_question, context.corrections
+    extracted_filters = context.extracted_filters
+    if corrections:
+        print(f"[CHAT API] Correcciones aplicadas: {corrections}")
+        print(f"[CHAT API] Pregunta corregida: {corrected_question}")
+    print(f"[CHAT API] Filtros extraídos: {extracted_filters}")
+
+    # PASO 3: Combinar filtros del UI con los extraídos de la pregunta
+    # Los filtros del UI tienen prioridad (no se sobrescriben)
+    final_filters = extracted_filters.copy()
+    for key, value in filters.items():
+        if value and str(value).strip():
+            final_filters[key] = value  # UI filters override extracted
+    context.filters = final_filters
+
+    # PASO 4: Agregar filtros al contexto de la pregunta para el orquestador
+    question_with_context = corrected_question
+
+    # Agregar contexto del historial de conversacion si existe
+    if history_context:
+        question_with_context = f"{history_context}\n\nPregunta actual del usuario: {corrected_question}"
+        print(f"[CHAT API] Contexto de historial agregado")
+
+    filter_context = _filter_context(final_filters)
+    if filter_context:
+        question_with_context = f"{question_with_context} (Filtrar por: {filter_context})"
+
+    context.question_with_context = question_with_context
+    print(f"[CHAT API] Pregunta final con contexto: {question_with_context[:200]}...")
+
+    # PASO 5: Llamar al orquestador del chatbot (no vuelve a corregir la pregunta)
+    if cached is not None:
+        print(f"[CHAT API] Respuesta desde la caché (similitud {cached['similarity']}): {cached['question']}")
+        report_progress("respuesta", "Respuesta encontrada en caché")
+        response = cached["payload"]["response"]
+        if token_callback:
+            token_callback(response)
+    elif fast_response is not None:
+        print("[CHAT API] Respuesta con plantilla SQL (camino rápido, sin LLM)")
+        response = fast_response
+        if token_callback:
+            token_callback(response)
+    else:
+        with context.stage("orquestador"):
+            response = orquestador_bot(
+                question_with_context,
+                auto_confirm=True,
+                progress_callback=progress_callback,
+                token_callback=token_callback,
+                context=context
+            )
+        if cacheable:
+            payload = {
+                "response": response,
+                "corrected_question": corrected_question,
+                "corrections": corrections,
+                "extracted_filters": extracted_filters,
+            }
+            answer_cache.store(corrected_question, filters, payload, watermark)
+            if local_question and local_question != corrected_question:
+                answer_cache.store(local_question, filters, payload, watermark)
+
+    # PASO 6: Guardar en historial si hay usuario
+    if user_code and conversation_group:
+        with context.stage("historial_guardar"):
+            save_success = save_chat_message(
+                user_code=user_code,
+                user_name=user_name,
+                conversation_group=conversation_group,
+                question=question,  # Guardamos la pregunta original
+                answer=response
+            )
+        if save_success:
+            print(f"[CHAT API] Mensaje guardado en historial")
+        else:
+            print(f"[CHAT API] Error al guardar mensaje en historial")
+
+    return {
+        "success": True,
+        "response": response,
+        "model_used": model,
+        "filters_applied": final_filters if any(final_filters.values()) else None,
+        # Nuevos campos para sincronización bidireccional
+        "corrections": corrections if corrections else None,
+        "extracted_filters": extracted_filters,
+        "corrected_question": corrected_question if corrections else None,
+        "conversation_group": conversation_group,
+        "cached": cached is not None
+    }
+
+
+def _local_analysis(question):
+    """Entidades reconocidas localmente, o None si hay dudas."""
+    analysis = analyze_entities(question)
+    return analysis if analysis is not None and analysis.confident else None
+
+
+def _shortcut(local, filters):
+    """
+    Respuesta sin LLM para una pregunta reconocida localmente.
+
+    Returns:
+        tuple: ("cache", entrada de answer_cache), ("rapido", texto) o None
+    """
+    if local is None:
+        return None
+    if ANSWER_CACHE_ENABLED:
+        cached = answer_cache.lookup(local.corrected_question, filters, count_miss=False)
+        if cached is not None:
+            return "cache", cached
+    fast_response = answer_without_llm(local, filters)
+    if fast_response:
+        return "rapido", fast_response
+    return None
+
+
+def _run_understand(question, history_context, filters, report_progress):
+    """PASO 1-2 en una sola llamada: corrección, filtros y plan (understand)."""
+    report_progress("correccion", "Analizando la pregunta")
+    return understand_question(
+        question, history_context=history_context, filter_context=_filter_context(filters)
+    )
+
+
+def _run_correction(question, report_progress, context=None):
+    """PASO 1: Corregir errores tipográficos en la pregunta."""
+    report_progress("correccion", "Corrigiendo la pregunta")
+    if context is None:
+        return correct_user_input_with_ai(question)
+    with context.stage("correccion"):
+        return correct_user_input_with_ai(question)
+
+
+def _run_filter_extraction(correction, report_progress, context=None):
+    """PASO 2: Extraer filtros de la pregunta corregida."""
+    corrected_question, corrections = correction
+    report_progress("filtros", "Identificando filtros en la pregunta")
+    if context is None:
+        return extract_filters_from_question(corrected_question, corrections)
+    with context.stage("filtros"):
+        return extract_filters_from_question(corrected_question, corrections)
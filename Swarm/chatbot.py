@@ -7,10 +7,20 @@ import pymysql
 import pandas as pd
 import json
 import requests
-from difflib import get_close_matches
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from swarm_cache import get_swarm_document_bytes, fetch_swarm_documents, prefetch_swarm_documents, SwarmGatewayError
+from document_store import load_documents_from_store
+from vocabulary import vocabulary_cache, VOCABULARY_COLUMNS
+from tracing import span, traced, set_span_attributes
+from entity_matching import EntityMatcher, fuzzy_matcher_for
+from prompt_builder import PromptBuilder, count_tokens
+from query_templates import match_query_template, format_template_answer, USE_QUERY_TEMPLATES, QUESTION_WORDS
 
 load_dotenv()
 warnings.filterwarnings('ignore')
@@ -30,9 +40,15 @@ class AIModel(Enum):
 # Configuración global del modelo activo
 _current_model = AIModel.DEEPSEEK  # Modelo por defecto
 
+# Modelo elegido para la pregunta en curso. Viaja en un contextvar (como la
+# traza de tracing.py): cada petición de /chat usa el suyo sin tocar el global,
+# y los threads de TaskGraph lo heredan al copiar el contexto
+_request_model = contextvars.ContextVar("request_model", default=None)
+
 def set_ai_model(model: AIModel):
     """
-    Establece el modelo de IA a usar globalmente.
+    Establece el modelo de IA a usar globalmente (scripts y CLI).
+    En la API usar use_ai_model, que solo afecta a la petición en curso.
 
     Args:
         model: AIModel enum (DEEPSEEK, GEMINI, etc.)
@@ -44,9 +60,24 @@ def set_ai_model(model: AIModel):
     _current_model = model
     print(f"✓ Modelo de IA configurado: {model.value.upper()}")
 
+@contextmanager
+def use_ai_model(model: AIModel):
+    """
+    Usa un modelo de IA solo dentro del bloque (y de los threads que copien su contexto).
+
+    Ejemplo:
+        with use_ai_model(AIModel.GEMINI):
+            orquestador_bot(pregunta)
+    """
+    token = _request_model.set(model)
+    try:
+        yield model
+    finally:
+        _request_model.reset(token)
+
 def get_current_model() -> AIModel:
-    """Retorna el modelo de IA actualmente configurado"""
-    return _current_model
+    """Retorna el modelo de IA de la petición en curso, o el global si no hay uno"""
+    return _request_model.get() or _current_model
 
 class AIProvider:
     """
@@ -59,9 +90,9 @@ class AIProvider:
         Inicializa el proveedor con el modelo especificado o el global.
 
         Args:
-            model: AIModel a usar (opcional, usa el global si no se especifica)
+            model: AIModel a usar (opcional, usa el de la petición o el global si no se especifica)
         """
-        self.model = model or _current_model
+        self.model = model or get_current_model()
         self._init_client()
 
     def _init_client(self):
@@ -100,37 +131,113 @@ class AIProvider:
             str: Respuesta generada por el modelo
         """
         try:
-            if self.model == AIModel.DEEPSEEK:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_message}
-                    ],
-                    temperature=temperature
-                )
-                return response.choices[0].message.content.strip()
-
-            elif self.model == AIModel.GEMINI:
-                # Gemini usa un formato diferente - combinamos system + user
-                full_prompt = f"{system_prompt}\n\n---\n\nUsuario: {user_message}"
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=full_prompt,
-                    config=genai.types.GenerateContentConfig(
+            with span("llm", model=self.model_name):
+                if self.model == AIModel.DEEPSEEK:
+                    response = self.client.chat.completions.create(
+                        model=self.model_name,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_message}
+                        ],
                         temperature=temperature
-                    ) if hasattr(genai.types, 'GenerateContentConfig') else None
-                )
-                return response.text.strip()
+                    )
+                    self._record_usage(response)
+                    return response.choices[0].message.content.strip()
+
+                elif self.model == AIModel.GEMINI:
+                    # Gemini usa un formato diferente - combinamos system + user
+                    full_prompt = f"{system_prompt}\n\n---\n\nUsuario: {user_message}"
+                    response = self.client.models.generate_content(
+                        model=self.model_name,
+                        contents=full_prompt,
+                        config=genai.types.GenerateContentConfig(
+                            temperature=temperature
+                        ) if hasattr(genai.types, 'GenerateContentConfig') else None
+                    )
+                    self._record_usage(response)
+                    return response.text.strip()
 
-            # Agregar más modelos aquí
-            else:
-                raise ValueError(f"Modelo no implementado: {self.model}")
+                # Agregar más modelos aquí
+                else:
+                    raise ValueError(f"Modelo no implementado: {self.model}")
 
         except Exception as e:
             print(f"[ERROR] Error en {self.model.value}: {str(e)}")
             raise
 
+    def chat_stream(self, system_prompt: str, user_message: str, temperature: float = 0.3):
+        """
+        Variante de chat() que entrega la respuesta por fragmentos a medida que
+        el modelo los genera.
+
+        Args:
+            system_prompt: Contexto/instrucciones del sistema
+            user_message: Mensaje del usuario
+            temperature: Temperatura para generación (0.0-1.0)
+
+        Yields:
+            str: Fragmentos de texto en orden
+        """
+        try:
+            with span("llm", model=self.model_name, stream=True):
+                if self.model == AIModel.DEEPSEEK:
+                    stream = self.client.chat.completions.create(
+                        model=self.model_name,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_message}
+                        ],
+                        temperature=temperature,
+                        stream=True,
+                        # El último fragmento trae el uso de tokens (sin choices)
+                        stream_options={"include_usage": True}
+                    )
+                    for chunk in stream:
+                        self._record_usage(chunk)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+
+                elif self.model == AIModel.GEMINI:
+                    full_prompt = f"{system_prompt}\n\n---\n\nUsuario: {user_message}"
+                    stream = self.client.models.generate_content_stream(
+                        model=self.model_name,
+                        contents=full_prompt,
+                        config=genai.types.GenerateContentConfig(
+                            temperature=temperature
+                        ) if hasattr(genai.types, 'GenerateContentConfig') else None
+                    )
+                    for chunk in stream:
+                        self._record_usage(chunk)
+                        if chunk.text:
+                            yield chunk.text
+
+                else:
+                    raise ValueError(f"Modelo no implementado: {self.model}")
+
+        except Exception as e:
+            print(f"[ERROR] Error en {self.model.value} (streaming): {str(e)}")
+            raise
+
+    def _record_usage(self, response):
+        """Copia el uso de tokens de la respuesta del modelo al span en curso."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # DeepSeek informa cuántos tokens del prompt salieron de su caché de prefijos
+            set_span_attributes(
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+                cached_tokens=getattr(usage, "prompt_cache_hit_tokens", None)
+            )
+            return
+        # Gemini reporta el uso en usage_metadata (en streaming, acumulado por fragmento)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+            set_span_attributes(
+                prompt_tokens=usage.prompt_token_count,
+                completion_tokens=getattr(usage, "candidates_token_count", None),
+                cached_tokens=getattr(usage, "cached_content_token_count", None)
+            )
+
     def __repr__(self):
         return f"AIProvider(model={self.model.value}, model_name={self.model_name})"
 
@@ -140,7 +247,7 @@ def get_ai_provider(model: AIModel = None) -> AIProvider:
     Factory function para obtener un proveedor de IA.
 
     Args:
-        model: Modelo específico (opcional, usa el global si no se especifica)
+        model: Modelo específico (opcional, usa el de la petición o el global si no se especifica)
 
     Returns:
         AIProvider configurado
@@ -151,8 +258,30 @@ def get_ai_provider(model: AIModel = None) -> AIProvider:
     """
     return AIProvider(model)
 
-# Caché global para valores únicos de la DB
-_db_values_cache = {}
+# Si está activo, los documentos se leen primero del espejo local (apdobloctrazdocu)
+# y query_bot puede consultar máquinas/operarios directamente en SQL
+USE_DOCUMENT_STORE = os.getenv("USE_DOCUMENT_STORE", "false").lower() in ("1", "true", "si", "yes")
+
+# Si está activo, /chat corrige la pregunta, extrae filtros y genera el plan en
+# una sola llamada al LLM (understand_question); si esa llamada falla se usa el
+# camino de varias llamadas
+USE_UNDERSTAND_STAGE = os.getenv("USE_UNDERSTAND_STAGE", "true").lower() in ("1", "true", "si", "yes")
+
+# Si está activo, las preguntas que solo necesitan un conteo o un listado de la
+# DB (reconocidas localmente, ver answer_without_llm) se responden con una
+# plantilla SQL y un formato fijo, sin plan ni respuesta del LLM
+USE_FAST_PATH = os.getenv("USE_FAST_PATH", "true").lower() in ("1", "true", "si", "yes")
+
+# Documentos de Swarm que se precargan mientras el LLM valida la factibilidad
+SWARM_PREFETCH_LIMIT = int(os.getenv("SWARM_PREFETCH_LIMIT", "50"))
+
+# Registro de las queries ejecutadas (JSONL), usado por index_advisor.py para
+# revisar con EXPLAIN las consultas reales que genera query_bot
+QUERY_LOG_PATH = os.getenv(
+    "QUERY_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "query_bot_sql.jsonl")
+)
+_query_log_lock = threading.Lock()
 
 DB_USER = os.getenv("DB_PRENDAS_USER")
 DB_PASSWORD = os.getenv("DB_PRENDAS_PASSWORD")
@@ -178,19 +307,46 @@ def connect_to_my_db():
         print("falló al conectarse a la base de datos de MariaDB")
         return None
 
-def execute_query(query):
+def log_executed_query(query, elapsed_ms, row_count, params=None):
+    """Agrega una query ejecutada al registro JSONL. Nunca interrumpe la consulta."""
+    if not QUERY_LOG_PATH:
+        return
+    record = {
+        "fecha": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "sql": query,
+        "ms": round(elapsed_ms, 1),
+        "filas": row_count
+    }
+    if params:
+        record["params"] = list(params)
+    entry = json.dumps(record, ensure_ascii=False)
+    try:
+        with _query_log_lock:
+            os.makedirs(os.path.dirname(QUERY_LOG_PATH), exist_ok=True)
+            with open(QUERY_LOG_PATH, "a", encoding="utf-8") as log_file:
+                log_file.write(entry + "\n")
+    except OSError as e:
+        print(f"[WARN] No se pudo registrar la query: {e}")
+
+@traced("execute_query")
+def execute_query(query, params=None):
     """
     Ejecuta una query SQL en la base de datos MariaDB.
     Args:
         query: String con la consulta SQL (debe ser SELECT)
+        params: Valores para los marcadores %s de la query (opcional)
     Returns:
         pandas.DataFrame con los resultados o DataFrame vacío si falla
     """
     conn = connect_to_my_db()
     if conn:
         try:
-            df = pd.read_sql(query, conn)
+            start_time = time.time()
+            df = pd.read_sql(query, conn, params=params)
             conn.close()
+            elapsed_ms = (time.time() - start_time) * 1000
+            log_executed_query(query, elapsed_ms, len(df), params)
+            set_span_attributes(sql_ms=round(elapsed_ms, 1), rows=len(df))
 
             # Normalizar nombres de columnas a minúsculas para consistencia
             df.columns = df.columns.str.lower()
@@ -209,63 +365,122 @@ def execute_query(query):
         print("[ERROR] No se pudo conectar a la base de datos")
         return pd.DataFrame()
 
-def get_unique_values(column_name, use_cache=True, limit=1000):
+def get_unique_values(column_name, use_cache=True, limit=None):
     """
-    Obtiene valores únicos de una columna específica de la DB.
-    Usa caché para evitar consultas repetidas.
+    Obtiene valores únicos de una columna específica de la DB, del más al menos
+    frecuente. Usa la caché de vocabularios (vocabulary.py), que se refresca
+    por TTL y cuando la ingesta guarda registros nuevos.
 
     Args:
         column_name: Nombre de la columna (ej: 'TDESCCLIE', 'TTIPOGENE')
         use_cache: Si usar caché o forzar consulta nueva
-        limit: Límite de valores únicos a retornar
+        limit: Límite de valores únicos a retornar (opcional, por defecto todos)
 
     Returns:
         list: Lista de valores únicos o [] si falla
     """
-    global _db_values_cache
-
     # Normalizar nombre de columna a mayúsculas
     column_name = column_name.upper()
 
-    # Verificar caché
-    if use_cache and column_name in _db_values_cache:
-        print(f"[CACHE] Usando valores cacheados para {column_name}")
-        return _db_values_cache[column_name]
-
-    # Columnas válidas para consultar
-    valid_columns = [
-        'TDESCCLIE', 'TCODICLIE', 'TTIPOGENE', 'TTIPOEDAD',
-        'TTIPOPREN', 'TTIPOTEJI', 'TCODITALL', 'TLUGADEST'
-    ]
-
-    if column_name not in valid_columns:
+    if column_name not in VOCABULARY_COLUMNS:
         print(f"[WARN] Columna '{column_name}' no está en la lista de columnas válidas")
         return []
 
+    values = vocabulary_cache.get(column_name, force=not use_cache)
+    return values[:limit] if limit else values
+
+# Claves de FilterState del frontend
+FILTER_KEYS = ("client", "clientStyle", "boxNumber", "label", "size", "gender", "age", "garmentType")
+
+# Vocabularios para el reconocimiento local de entidades (campo -> columna)
+ENTITY_COLUMNS = {
+    "client": "TDESCCLIE",
+    "gender": "TTIPOGENE",
+    "age": "TTIPOEDAD",
+    "garmentType": "TTIPOPREN",
+    "fabric": "TTIPOTEJI",
+    "size": "TCODITALL",
+}
+_entity_matcher = None
+_entity_matcher_key = None
+_entity_matcher_lock = threading.Lock()
+
+def get_entity_matcher():
+    """
+    EntityMatcher sobre los valores de get_unique_values. Se reconstruye solo
+    cuando cambian las listas de valores (cuando se refresca la caché).
+    """
+    global _entity_matcher, _entity_matcher_key
+    vocabularies = {field: get_unique_values(column) for field, column in ENTITY_COLUMNS.items()}
+    key = tuple(id(values) for values in vocabularies.values())
+    with _entity_matcher_lock:
+        if _entity_matcher is None or key != _entity_matcher_key:
+            start_time = time.time()
+            _entity_matcher = EntityMatcher(vocabularies, known_words=QUESTION_WORDS)
+            _entity_matcher_key = key
+            print(f"✓ Índice de entidades construido en {(time.time() - start_time) * 1000:.0f} ms")
+        return _entity_matcher
+
+def analyze_entities(question):
+    """
+    Reconocimiento local de entidades (sin LLM).
+
+    Returns:
+        EntityAnalysis o None si no se pudo construir el índice
+    """
     try:
-        query = f"SELECT DISTINCT {column_name} FROM apdobloctrazhash WHERE {column_name} IS NOT NULL LIMIT {limit}"
-        df = execute_query(query)
+        analysis = get_entity_matcher().analyze(question)
+    except Exception as e:
+        print(f"[WARN] Error en el reconocimiento local de entidades: {e}")
+        return None
+    set_span_attributes(local_confident=analysis.confident)
+    return analysis
 
-        if df.empty:
-            return []
+@traced("fast_path")
+def answer_without_llm(analysis, filters=None):
+    """
+    Camino rápido: responde sin LLM las preguntas que son solo un conteo o un
+    listado de la DB (contar, contar por columna, valores distintos).
+    La pregunta debe reconocerse completa con las plantillas de query_templates.
 
-        # Convertir a lista y limpiar
-        values = df[column_name.lower()].dropna().astype(str).str.strip().tolist()
-        values = [v for v in values if v]  # Filtrar vacíos
+    Args:
+        analysis: EntityAnalysis de la pregunta (analyze_entities)
+        filters: Filtros del panel (claves de FilterState)
 
-        # Guardar en caché
-        _db_values_cache[column_name] = values
+    Returns:
+        str: Respuesta o None si la pregunta necesita el camino con LLM
+    """
+    if not USE_FAST_PATH or analysis is None or not analysis.confident:
+        return None
+    # Sin LLM que revise la respuesta: solo entidades reconocidas tal cual, nunca
+    # corregidas por aproximación ("NIQUE" no debe contarse como el tejido "Pique")
+    if analysis.corrections:
+        return None
 
-        print(f"✓ Recuperados {len(values)} valores únicos para {column_name}")
-        return values
+    panel_filters = {}
+    for key, value in (filters or {}).items():
+        if not value or not str(value).strip():
+            continue
+        if key not in ENTITY_COLUMNS:
+            # Estilo, caja o etiqueta: no hay plantilla que los use
+            return None
+        panel_filters[ENTITY_COLUMNS[key]] = str(value).strip()
 
-    except Exception as e:
-        print(f"[ERROR] Error al obtener valores únicos de {column_name}: {e}")
-        return []
+    template = match_query_template(analysis, ENTITY_COLUMNS, extra_filters=panel_filters)
+    if template is None or template.name == "hashes":
+        return None
+
+    set_span_attributes(sql_template=template.name)
+    print(f"[FAST PATH] Plantilla '{template.name}': {template.sql} {template.params}")
+    df = execute_query(template.sql, params=template.params)
+    if df.empty:
+        return None
+    return format_template_answer(template, list(df.itertuples(index=False, name=None)))
 
 def fuzzy_match_value(input_value, valid_values, threshold=0.6):
     """
     Encuentra el valor más cercano usando fuzzy matching.
+    El índice de cada lista de valores se construye una vez (fuzzy_matcher_for).
 
     Args:
         input_value: Valor ingresado por el usuario (puede tener errores)
@@ -278,33 +493,31 @@ def fuzzy_match_value(input_value, valid_values, threshold=0.6):
     if not input_value or not valid_values:
         return None, 0.0
 
-    # Limpiar input
-    input_clean = str(input_value).strip().upper()
-
-    # Convertir valid_values a mayúsculas para comparación
-    valid_upper = [str(v).strip().upper() for v in valid_values]
+    return fuzzy_matcher_for(valid_values).match(input_value, threshold)
 
-    # Match exacto (caso insensitive)
-    if input_clean in valid_upper:
-        idx = valid_upper.index(input_clean)
-        return valid_values[idx], 1.0
+CORRECTION_CONTEXT = """
+Eres un experto en corregir errores de escritura en consultas sobre trazabilidad de prendas.
 
-    # Fuzzy matching con difflib
-    matches = get_close_matches(input_clean, valid_upper, n=1, cutoff=threshold)
+**TU TAREA**:
+Analiza la pregunta del usuario y detecta nombres de clientes, tipos de prenda, géneros, etc. que puedan estar mal escritos.
+Compara con los valores válidos de la base de datos (al final) y sugiere correcciones.
 
-    if matches:
-        matched_upper = matches[0]
-        idx = valid_upper.index(matched_upper)
-        original_value = valid_values[idx]
+**REGLAS**:
+1. Si detectas un nombre que NO está en la lista pero es similar, sugiérelo corregido
+2. Usa fuzzy matching mental: "LASCOSTE" → "LACOSTE", "NIQUE" → "NIKE"
+3. NO corrijas si el nombre existe exactamente en la lista
+4. Retorna JSON con: {"corrected_question": "...", "corrections": {"original": "corrected"}}
 
-        # Calcular confianza aproximada (similitud de caracteres)
-        from difflib import SequenceMatcher
-        confidence = SequenceMatcher(None, input_clean, matched_upper).ratio()
+**EJEMPLO**:
 
-        return original_value, confidence
+Input: "¿Cuántas prendas de LASCOSTE para honbres hay?"
+Output: {"corrected_question": "¿Cuántas prendas de LACOSTE para hombres hay?", "corrections": {"LASCOSTE": "LACOSTE", "honbres": "hombres"}}
 
-    return None, 0.0
+Input: "¿Cuántas prendas de LACOSTE hay?"
+Output: {"corrected_question": "¿Cuántas prendas de LACOSTE hay?", "corrections": {}}
+"""
 
+@traced("correct_user_input_with_ai")
 def correct_user_input_with_ai(user_question):
     """
     Usa IA para detectar y corregir nombres mal escritos en la pregunta del usuario,
@@ -316,51 +529,29 @@ def correct_user_input_with_ai(user_question):
     Returns:
         tuple: (corrected_question, corrections_made: dict)
     """
+    # Primero el reconocimiento local: si resuelve todo con confianza no se llama al LLM
+    analysis = analyze_entities(user_question)
+    if analysis is not None and analysis.confident:
+        if analysis.corrections:
+            print(f"\n[CORRECCIÓN LOCAL]")
+            for orig, corr in analysis.corrections.items():
+                print(f"  '{orig}' → '{corr}'")
+        return analysis.corrected_question, analysis.corrections
+    if analysis is not None:
+        print(f"[INFO] Corrección local con dudas {analysis.doubts}, se consulta al LLM")
+
     # Usar el sistema multi-modelo
     provider = get_ai_provider()
 
-    # Obtener valores válidos de columnas clave
-    valid_clients = get_unique_values('TDESCCLIE')
-    valid_genders = get_unique_values('TTIPOGENE')
-    valid_garment_types = get_unique_values('TTIPOPREN')
-    valid_fabric_types = get_unique_values('TTIPOTEJI')
-
-    # Preparar contexto con valores válidos
-    context = f"""
-Eres un experto en corregir errores de escritura en consultas sobre trazabilidad de prendas.
-
-**TU TAREA**:
-Analiza la pregunta del usuario y detecta nombres de clientes, tipos de prenda, géneros, etc. que puedan estar mal escritos.
-Compara con los valores válidos de la base de datos y sugiere correcciones.
-
-**VALORES VÁLIDOS DE LA BASE DE DATOS**:
-
-Clientes (TDESCCLIE):
-{', '.join(valid_clients[:50])}  # Primeros 50
-
-Géneros (TTIPOGENE):
-{', '.join(valid_genders)}
-
-Tipos de Prenda (TTIPOPREN):
-{', '.join(valid_garment_types[:30])}
-
-Tipos de Tejido (TTIPOTEJI):
-{', '.join(valid_fabric_types)}
-
-**REGLAS**:
-1. Si detectas un nombre que NO está en la lista pero es similar, sugiérelo corregido
-2. Usa fuzzy matching mental: "LASCOSTE" → "LACOSTE", "NIQUE" → "NIKE"
-3. NO corrijas si el nombre existe exactamente en la lista
-4. Retorna JSON con: {{"corrected_question": "...", "corrections": {{"original": "corrected"}}}}
-
-**EJEMPLO**:
-
-Input: "¿Cuántas prendas de LASCOSTE para honbres hay?"
-Output: {{"corrected_question": "¿Cuántas prendas de LACOSTE para hombres hay?", "corrections": {{"LASCOSTE": "LACOSTE", "honbres": "hombres"}}}}
-
-Input: "¿Cuántas prendas de LACOSTE hay?"
-Output: {{"corrected_question": "¿Cuántas prendas de LACOSTE hay?", "corrections": {{}}}}
-"""
+    # Instrucciones fijas primero (prefijo cacheable) y los valores válidos de la DB
+    # al final, recortados a los relacionados con la pregunta
+    builder = PromptBuilder("correccion").static(CORRECTION_CONTEXT)
+    builder.dynamic("**VALORES VÁLIDOS DE LA BASE DE DATOS**:")
+    builder.catalog("Clientes (TDESCCLIE)", get_unique_values('TDESCCLIE'), user_question, limit=40, previous_limit=50)
+    builder.catalog("Géneros (TTIPOGENE)", get_unique_values('TTIPOGENE'), user_question, limit=10)
+    builder.catalog("Tipos de Prenda (TTIPOPREN)", get_unique_values('TTIPOPREN'), user_question, limit=20, previous_limit=30)
+    builder.catalog("Tipos de Tejido (TTIPOTEJI)", get_unique_values('TTIPOTEJI'), user_question, limit=20)
+    context = builder.build()
 
     try:
         response_text = provider.chat(context, user_question, temperature=0.1)
@@ -386,64 +577,68 @@ Output: {{"corrected_question": "¿Cuántas prendas de LACOSTE hay?", "correctio
         print(f"[WARN] Error en corrección automática: {e}")
         return user_question, {}
 
-def extract_filters_from_question(question, corrections=None):
+def validate_extracted_filters(raw_filters):
     """
-    Extrae valores de filtro estructurados de la pregunta del usuario.
-    Usa IA para identificar entidades mencionadas y las valida contra la DB.
+    Valida los filtros que devolvió el LLM contra los valores reales de la DB.
 
     Args:
-        question: Pregunta del usuario (preferiblemente ya corregida)
-        corrections: Dict de correcciones realizadas {original: corregido}
+        raw_filters: Dict con claves de FilterState (pueden faltar o venir de más)
 
     Returns:
-        dict: Filtros extraídos con estructura compatible con FilterState del frontend
-              {client, clientStyle, boxNumber, label, size, gender, age, garmentType}
+        dict: Filtros con las 8 claves de FilterState; los valores con match en la DB
+              se reemplazan por el valor exacto de la DB
     """
-    provider = get_ai_provider()
-
-    # Estructura de filtros vacía
-    empty_filters = {
-        "client": "",
-        "clientStyle": "",
-        "boxNumber": "",
-        "label": "",
-        "size": "",
-        "gender": "",
-        "age": "",
-        "garmentType": ""
+    validated_filters = dict.fromkeys(FILTER_KEYS, "")
+
+    # Mapeo de campos a valores válidos
+    field_validators = {
+        "client": get_unique_values('TDESCCLIE'),
+        "gender": get_unique_values('TTIPOGENE'),
+        "garmentType": get_unique_values('TTIPOPREN'),
+        "size": get_unique_values('TCODITALL'),
+        "age": get_unique_values('TTIPOEDAD')
     }
 
-    # Obtener valores válidos de la DB para validación
-    valid_clients = get_unique_values('TDESCCLIE')
-    valid_genders = get_unique_values('TTIPOGENE')
-    valid_garment_types = get_unique_values('TTIPOPREN')
-    valid_sizes = get_unique_values('TCODITALL')
-    valid_ages = get_unique_values('TTIPOEDAD')
+    for field, value in (raw_filters or {}).items():
+        if field in validated_filters and value and str(value).strip():
+            value_str = str(value).strip()
+
+            # Si el campo tiene validación contra DB
+            if field in field_validators and field_validators[field]:
+                # Usar fuzzy matching para encontrar el valor correcto
+                matched_value, confidence = fuzzy_match_value(value_str, field_validators[field])
+                if matched_value and confidence >= 0.7:
+                    validated_filters[field] = matched_value
+                    print(f"[FILTER EXTRACT] {field}: '{value_str}' → '{matched_value}' (conf: {confidence:.2f})")
+                else:
+                    # Si no hay match bueno, usar el valor original
+                    validated_filters[field] = value_str
+                    print(f"[FILTER EXTRACT] {field}: '{value_str}' (sin match DB)")
+            else:
+                # Campos sin validación (clientStyle, boxNumber, label)
+                validated_filters[field] = value_str
+                print(f"[FILTER EXTRACT] {field}: '{value_str}'")
 
-    context = f"""
+    # Contar filtros extraídos
+    extracted_count = sum(1 for v in validated_filters.values() if v)
+    if extracted_count > 0:
+        print(f"[FILTER EXTRACT] Total filtros extraídos: {extracted_count}")
+
+    return validated_filters
+
+FILTER_EXTRACTION_CONTEXT = """
 Eres un extractor de entidades especializado en consultas sobre trazabilidad de prendas.
 
 **TU TAREA**:
 Analiza la pregunta del usuario y extrae cualquier valor que corresponda a los filtros disponibles.
 SOLO extrae valores que estén EXPLÍCITAMENTE mencionados en la pregunta.
 
-**FILTROS DISPONIBLES Y VALORES VÁLIDOS**:
-
-1. client (Cliente) - Valores válidos:
-{', '.join(valid_clients[:30]) if valid_clients else 'No disponible'}
-
-2. gender (Género) - Valores válidos:
-{', '.join(valid_genders) if valid_genders else 'No disponible'}
-
-3. garmentType (Tipo de Prenda) - Valores válidos:
-{', '.join(valid_garment_types[:20]) if valid_garment_types else 'No disponible'}
-
-4. size (Talla) - Valores válidos:
-{', '.join(valid_sizes[:20]) if valid_sizes else 'No disponible'}
-
-5. age (Edad) - Valores válidos:
-{', '.join(valid_ages) if valid_ages else 'No disponible'}
-
+**FILTROS DISPONIBLES** (los valores válidos están al final):
+1. client (Cliente)
+2. gender (Género)
+3. garmentType (Tipo de Prenda)
+4. size (Talla)
+5. age (Edad)
 6. clientStyle (Estilo Cliente) - Código alfanumérico del estilo
 7. boxNumber (Número de Caja) - Número de caja
 8. label (Etiqueta) - Código de etiqueta
@@ -456,20 +651,48 @@ SOLO extrae valores que estén EXPLÍCITAMENTE mencionados en la pregunta.
 5. Retorna SOLO JSON válido, sin explicaciones
 
 **FORMATO DE RESPUESTA** (JSON puro):
-{{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}}
+{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}
 
 **EJEMPLOS**:
 
 Pregunta: "¿Cuántas prendas de LACOSTE hay?"
-Respuesta: {{"client": "LACOSTE", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}}
+Respuesta: {"client": "LACOSTE", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}
 
 Pregunta: "¿Cuántas camisetas de hombre talla M hay?"
-Respuesta: {{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "M", "gender": "HOMBRE", "age": "", "garmentType": "CAMISETA"}}
+Respuesta: {"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "M", "gender": "HOMBRE", "age": "", "garmentType": "CAMISETA"}
 
 Pregunta: "¿Cuántos registros hay en total?"
-Respuesta: {{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}}
+Respuesta: {"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""}
 """
 
+@traced("extract_filters_from_question")
+def extract_filters_from_question(question, corrections=None):
+    """
+    Extrae valores de filtro estructurados de la pregunta del usuario.
+    Usa IA para identificar entidades mencionadas y las valida contra la DB.
+
+    Args:
+        question: Pregunta del usuario (preferiblemente ya corregida)
+        corrections: Dict de correcciones realizadas {original: corregido}
+
+    Returns:
+        dict: Filtros extraídos con estructura compatible con FilterState del frontend
+              {client, clientStyle, boxNumber, label, size, gender, age, garmentType}
+    """
+    provider = get_ai_provider()
+
+    # Estructura de filtros vacía
+    empty_filters = dict.fromkeys(FILTER_KEYS, "")
+
+    builder = PromptBuilder("filtros").static(FILTER_EXTRACTION_CONTEXT)
+    builder.dynamic("**VALORES VÁLIDOS DE LA BASE DE DATOS**:")
+    builder.catalog("client", get_unique_values('TDESCCLIE'), question, limit=20, previous_limit=30)
+    builder.catalog("gender", get_unique_values('TTIPOGENE'), question, limit=10)
+    builder.catalog("garmentType", get_unique_values('TTIPOPREN'), question, limit=15, previous_limit=20)
+    builder.catalog("size", get_unique_values('TCODITALL'), question, limit=15, previous_limit=20)
+    builder.catalog("age", get_unique_values('TTIPOEDAD'), question, limit=10)
+    context = builder.build()
+
     try:
         response_text = provider.chat(context, f"Pregunta: {question}", temperature=0.1)
 
@@ -482,43 +705,7 @@ Respuesta: {{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "siz
         result = json.loads(response_text)
 
         # Validar y normalizar los valores extraídos contra la DB
-        validated_filters = empty_filters.copy()
-
-        # Mapeo de campos a valores válidos y función de validación
-        field_validators = {
-            "client": valid_clients,
-            "gender": valid_genders,
-            "garmentType": valid_garment_types,
-            "size": valid_sizes,
-            "age": valid_ages
-        }
-
-        for field, value in result.items():
-            if field in validated_filters and value and str(value).strip():
-                value_str = str(value).strip()
-
-                # Si el campo tiene validación contra DB
-                if field in field_validators and field_validators[field]:
-                    # Usar fuzzy matching para encontrar el valor correcto
-                    matched_value, confidence = fuzzy_match_value(value_str, field_validators[field])
-                    if matched_value and confidence >= 0.7:
-                        validated_filters[field] = matched_value
-                        print(f"[FILTER EXTRACT] {field}: '{value_str}' → '{matched_value}' (conf: {confidence:.2f})")
-                    else:
-                        # Si no hay match bueno, usar el valor original
-                        validated_filters[field] = value_str
-                        print(f"[FILTER EXTRACT] {field}: '{value_str}' (sin match DB)")
-                else:
-                    # Campos sin validación (clientStyle, boxNumber, label)
-                    validated_filters[field] = value_str
-                    print(f"[FILTER EXTRACT] {field}: '{value_str}'")
-
-        # Contar filtros extraídos
-        extracted_count = sum(1 for v in validated_filters.values() if v)
-        if extracted_count > 0:
-            print(f"[FILTER EXTRACT] Total filtros extraídos: {extracted_count}")
-
-        return validated_filters
+        return validate_extracted_filters(result)
 
     except json.JSONDecodeError as e:
         print(f"[WARN] Error parseando JSON de filtros: {e}")
@@ -528,22 +715,31 @@ Respuesta: {{"client": "", "clientStyle": "", "boxNumber": "", "label": "", "siz
         print(f"[WARN] Error extrayendo filtros: {e}")
         return empty_filters
 
-def query_bot(question):
-    """
-    Bot generador de SQL: Convierte preguntas en español a queries SQL válidas.
-    - question: Pregunta del usuario o instrucción del orquestador.
-    """
-    # Usar el sistema multi-modelo
-    provider = get_ai_provider()
+DOCUMENT_STORE_SQL_CONTEXT = """
+**TABLA ADICIONAL**: apdobloctrazdocu (copia local de los JSONs de trazabilidad, una fila por registro de cada sección)
+- TTICKBARR: Tickbar de la prenda (unir con apdobloctrazactu.TTICKBARR)
+- TNOMBSECC: Sección del JSON (ej: 'tztotrazwebtint' tintorería, 'tztotrazwebteje' tejeduría, 'tztotrazwebcostoper' operaciones de costura)
+- TNOMBMAQUACAB: Rama de acabado (ej: 'Rama 3') - sección tztotrazwebtint
+- TNOMBMAQUTENI: Máquina de teñido - sección tztotrazwebtint
+- TNOMBMAQUSECA: Máquina de secado - sección tztotrazwebtint
+- TNOMBMAQU: Máquina de tejeduría - sección tztotrazwebteje
+- TNOMBPERS: Operario
+- TNUMEOB: Número de OB
+- TFECHACABINIC, TFECHTENIINIC, TFECHTEJE: Fechas 'YYYY-MM-DD HH:MM:SS' (inicio de acabado, teñido, tejido)
+
+Pregunta: "¿Qué Ramas procesaron prendas de LACOSTE en mayo de 2025?"
+SELECT d.TNOMBMAQUACAB, COUNT(DISTINCT d.TTICKBARR) AS cantidad FROM apdobloctrazdocu d JOIN apdobloctrazactu h ON h.TTICKBARR = d.TTICKBARR WHERE h.TDESCCLIE LIKE '%LACOSTE%' AND d.TNOMBMAQUACAB IS NOT NULL AND d.TFECHACABINIC >= '2025-05-01' AND d.TFECHACABINIC < '2025-06-01' GROUP BY d.TNOMBMAQUACAB
+"""
 
-    context = """
+QUERY_BOT_CONTEXT = """
 Eres un experto en generar queries SQL a partir de preguntas en español sobre trazabilidad de prendas.
 
-**TABLA**: apdobloctrazhash
+**TABLA**: apdobloctrazactu (una fila por prenda con su versión vigente)
 
 **COLUMNAS**:
 - TTICKBARR: Tickbar único de la prenda (VARCHAR)
-- TNUMEVERS: Versión del registro (INT)
+- TNUMEVERS: Versión vigente del registro (INT). El historial de versiones está en apdobloctrazhash;
+  úsala solo si la pregunta es sobre versiones anteriores
 - TNUMECAJA: Número de caja del lote (VARCHAR)
 - TESTICLIE: Estilo del cliente (VARCHAR)
 - TETIQCLIE: Etiqueta del cliente (VARCHAR)
@@ -568,22 +764,22 @@ Eres un experto en generar queries SQL a partir de preguntas en español sobre t
 **EJEMPLOS**:
 
 Pregunta: "¿Cuántas prendas para hombre hay?"
-SELECT COUNT(*) FROM apdobloctrazhash WHERE TTIPOGENE = 'Hombres'
+SELECT COUNT(*) FROM apdobloctrazactu WHERE TTIPOGENE = 'Hombres'
 
 Pregunta: "¿Qué clientes tienen talla 10?"
-SELECT DISTINCT TCODICLIE, TDESCCLIE FROM apdobloctrazhash WHERE TCODITALL = '10'
+SELECT DISTINCT TCODICLIE, TDESCCLIE FROM apdobloctrazactu WHERE TCODITALL = '10'
 
 Pregunta: "Dame todas las prendas de LACOSTE para hombres"
-SELECT * FROM apdobloctrazhash WHERE TDESCCLIE LIKE '%LACOSTE%' AND TTIPOGENE = 'Hombres'
+SELECT * FROM apdobloctrazactu WHERE TDESCCLIE LIKE '%LACOSTE%' AND TTIPOGENE = 'Hombres'
 
 Pregunta: "Lista los hashes de prendas tipo T-Shirt de NIKE"
-SELECT TTICKBARR, TTICKHASH FROM apdobloctrazhash WHERE TDESCCLIE LIKE '%NIKE%' AND TTIPOPREN LIKE '%T-Shirt%'
+SELECT TTICKBARR, TTICKHASH FROM apdobloctrazactu WHERE TDESCCLIE LIKE '%NIKE%' AND TTIPOPREN LIKE '%T-Shirt%'
 
 Pregunta: "¿Cuántas prendas de LACOSTE hay por género?"
-SELECT TTIPOGENE, COUNT(*) as cantidad FROM apdobloctrazhash WHERE TDESCCLIE LIKE '%LACOSTE%' GROUP BY TTIPOGENE
+SELECT TTIPOGENE, COUNT(*) as cantidad FROM apdobloctrazactu WHERE TDESCCLIE LIKE '%LACOSTE%' GROUP BY TTIPOGENE
 
 Pregunta: "Tipos de tejido usados en prendas para niños"
-SELECT DISTINCT TTIPOTEJI FROM apdobloctrazhash WHERE TTIPOEDAD = 'Niño'
+SELECT DISTINCT TTIPOTEJI FROM apdobloctrazactu WHERE TTIPOEDAD = 'Niño'
 
 **IMPORTANTE**:
 - Retorna SOLO la query SQL sin formato markdown
@@ -591,7 +787,21 @@ SELECT DISTINCT TTIPOTEJI FROM apdobloctrazhash WHERE TTIPOEDAD = 'Niño'
   genera una query que filtre por los campos disponibles y retorna los TTICKHASH para consultar JSONs después
 """
 
-    respuesta_texto = provider.chat(context, question, temperature=0.1)
+@traced("query_bot")
+def query_bot(question):
+    """
+    Bot generador de SQL: Convierte preguntas en español a queries SQL válidas.
+    - question: Pregunta del usuario o instrucción del orquestador.
+    """
+    # Usar el sistema multi-modelo
+    provider = get_ai_provider()
+
+    builder = PromptBuilder("query_bot").static(QUERY_BOT_CONTEXT)
+
+    if USE_DOCUMENT_STORE:
+        builder.static(DOCUMENT_STORE_SQL_CONTEXT)
+
+    respuesta_texto = provider.chat(builder.build(), question, temperature=0.1)
 
     # Limpieza de formato markdown si aparece
     if respuesta_texto.startswith("```sql"):
@@ -613,24 +823,20 @@ def fetch_json_from_swarm(hash_value, timeout=10, verbose=True):
     Returns:
         dict: JSON parseado del tickbarr o None si falla
     """
-    swarm_gateway_url = f"https://api.gateway.ethswarm.org/bzz/{hash_value}"
-
     try:
         if verbose:
             print(f"  → Descargando JSON para hash: {hash_value[:16]}...")
 
-        response = requests.get(swarm_gateway_url, timeout=timeout)
-
-        if response.status_code == 200:
-            json_data = response.json()
-            if verbose:
-                print(f"  ✓ JSON recuperado exitosamente ({len(str(json_data))} chars)")
-            return json_data
-        else:
-            if verbose:
-                print(f"  ✗ Error HTTP {response.status_code} para hash {hash_value[:16]}")
-            return None
+        # Los documentos de Swarm son inmutables: se sirven desde caché si ya se descargaron
+        json_data = json.loads(get_swarm_document_bytes(hash_value, timeout=timeout))
+        if verbose:
+            print(f"  ✓ JSON recuperado exitosamente ({len(str(json_data))} chars)")
+        return json_data
 
+    except SwarmGatewayError as e:
+        if verbose:
+            print(f"  ✗ Error HTTP {e.status_code} para hash {hash_value[:16]}")
+        return None
     except requests.exceptions.Timeout:
         if verbose:
             print(f"  ✗ Timeout al recuperar hash {hash_value[:16]}")
@@ -1278,6 +1484,7 @@ Recuerda:
             "explanation": None
         }
 
+@traced("fetch_and_filter_jsons")
 def fetch_and_filter_jsons(hashes, user_question, max_workers=10):
     """
     Recupera múltiples JSONs de Swarm en paralelo.
@@ -1303,12 +1510,25 @@ def fetch_and_filter_jsons(hashes, user_question, max_workers=10):
 
     num_hashes = len(hashes)
     print(f"\n[PASO 5] Procesando {num_hashes} JSONs de Swarm...")
+    set_span_attributes(hashes=num_hashes)
     start_time = time.time()
 
     # ============================================================================
     # ESTRATEGIA ADAPTATIVA: Decidir según cantidad de hashes
     # ============================================================================
 
+    # Documentos ya copiados al espejo local: se leen en una sola consulta
+    local_documents = load_documents_from_store(hashes) if USE_DOCUMENT_STORE else {}
+    if local_documents:
+        print(f"  → {len(local_documents)}/{num_hashes} documentos disponibles en el espejo local")
+    set_span_attributes(local_documents=len(local_documents))
+
+    def get_document(hash_val, timeout=10, verbose=True):
+        document = local_documents.get(hash_val)
+        if document is not None:
+            return document
+        return fetch_json_from_swarm(hash_val, timeout=timeout, verbose=verbose)
+
     USE_FULL_JSONS = num_hashes <= 10  # Umbral: 10 hashes o menos = JSONs completos
     SAMPLE_SIZE = 3  # CAMBIADO: Usar solo 3 JSONs de muestra para análisis
 
@@ -1329,7 +1549,7 @@ def fetch_and_filter_jsons(hashes, user_question, max_workers=10):
 
         for i, hash_val in enumerate(sample_hashes):
             print(f"  → Descargando muestra {i+1}/{SAMPLE_SIZE} (hash: {hash_val[:20]}...)")
-            json_data = fetch_json_from_swarm(hash_val)
+            json_data = get_document(hash_val)
             if json_data:
                 sample_jsons.append(json_data)
             else:
@@ -1492,7 +1712,7 @@ def fetch_and_filter_jsons(hashes, user_question, max_workers=10):
         """Procesa un hash individual: descarga y opcionalmente filtra"""
         try:
             # Descargar sin logs verbosos (modo paralelo)
-            json_data = fetch_json_from_swarm(hash_val, timeout=15, verbose=False)
+            json_data = get_document(hash_val, timeout=15, verbose=False)
 
             if not json_data:
                 return hash_val, None, 0, "download_failed"
@@ -1590,70 +1810,11 @@ def fetch_and_filter_jsons(hashes, user_question, max_workers=10):
     print(f"✓ Resultados: {successful} éxitos, {failed} fallos")
     print(f"✓ JSONs procesados: {len(result_jsons)}")
     print(f"✓ Tamaño total: {total_size:,} bytes (~{total_size//1000}KB)\n")
+    set_span_attributes(documents=successful, failed=failed, bytes=total_size)
 
     return result_jsons
 
-def final_response_bot(all_data_str, user_question, max_data_size=80000):
-    """
-    Bot final: Sintetiza una respuesta coherente y precisa basada en toda la información recabada.
-
-    IMPORTANTE: all_data ahora tiene esta estructura optimizada:
-    - user_question: Pregunta del usuario
-    - razonamiento: Análisis del orquestador
-    - db_summary: Resumen de datos de DB (NO datos crudos completos)
-    - jsons: Datos FILTRADOS de JSONs (solo campos relevantes)
-    - metadata: Estadísticas básicas
-
-    Args:
-        all_data_str: String JSON con datos recolectados
-        user_question: Pregunta original del usuario
-        max_data_size: Tamaño máximo en caracteres (default: 80KB - aumentado porque ya filtramos)
-    """
-    # Usar el sistema multi-modelo
-    provider = get_ai_provider()
-
-    # VALIDACIÓN CRÍTICA: Verificar tamaño de datos antes de enviar
-    data_size = len(all_data_str)
-    print(f"[VALIDACIÓN] Tamaño de datos: {data_size:,} caracteres")
-
-    if data_size > max_data_size:
-        print(f"[WARN] Datos exceden el límite ({data_size:,} > {max_data_size:,})")
-        print(f"[TRUNCATE] Aplicando truncamiento inteligente...")
-
-        try:
-            all_data = json.loads(all_data_str)
-
-            # Estrategia de truncamiento: Mantener estructura, reducir JSONs
-            truncated_data = {
-                "user_question": all_data.get("user_question"),
-                "razonamiento": all_data.get("razonamiento"),
-                "metadata": all_data.get("metadata"),
-                "db_summary": all_data.get("db_summary"),  # Ya es un resumen, mantenerlo
-                "jsons": {},
-                "truncated_warning": f"Datos truncados: {data_size:,} caracteres originales"
-            }
-
-            # Incluir solo una muestra de JSONs (primeros 30)
-            jsons_dict = all_data.get("jsons", {})
-            if jsons_dict:
-                sample_jsons = dict(list(jsons_dict.items())[:30])
-                truncated_data["jsons"] = sample_jsons
-                truncated_data["jsons_note"] = f"Mostrando 30 de {len(jsons_dict)} JSONs"
-
-            all_data_str = json.dumps(truncated_data, ensure_ascii=False)
-            new_size = len(all_data_str)
-            print(f"✓ Datos truncados: {data_size:,} → {new_size:,} caracteres ({100*new_size//data_size}%)")
-
-        except Exception as e:
-            print(f"[ERROR] Fallo al truncar datos: {e}")
-            # Si falla el truncamiento, usar solo metadata
-            all_data_str = json.dumps({
-                "error": "Datos demasiado grandes para procesar",
-                "user_question": user_question,
-                "size": data_size
-            }, ensure_ascii=False)
-
-    context = """
+FINAL_RESPONSE_CONTEXT = """
 Eres un experto asistente de trazabilidad de prendas textiles. Tu objetivo es responder consultas de usuarios de manera clara, precisa y profesional.
 
 **TU TAREA**:
@@ -1780,15 +1941,94 @@ Respuesta: "Las operaciones de costura realizadas fueron:
 - Usa nombres amigables: "Rama" en vez de "TNOMBMAQUACAB", "línea de costura" en vez de "TNUMELINECOST"
 """
 
+@traced("final_response_bot")
+def final_response_bot(all_data_str, user_question, max_data_size=80000, on_token=None):
+    """
+    Bot final: Sintetiza una respuesta coherente y precisa basada en toda la información recabada.
+
+    IMPORTANTE: all_data ahora tiene esta estructura optimizada:
+    - user_question: Pregunta del usuario
+    - razonamiento: Análisis del orquestador
+    - db_summary: Resumen de datos de DB (NO datos crudos completos)
+    - jsons: Datos FILTRADOS de JSONs (solo campos relevantes)
+    - metadata: Estadísticas básicas
+
+    Args:
+        all_data_str: String JSON con datos recolectados
+        user_question: Pregunta original del usuario
+        max_data_size: Tamaño máximo en caracteres (default: 80KB - aumentado porque ya filtramos)
+        on_token: Función opcional que recibe cada fragmento de la respuesta mientras se genera.
+                  Se llama primero con None para indicar que empieza un intento nuevo.
+    """
+    # Usar el sistema multi-modelo
+    provider = get_ai_provider()
+
+    # VALIDACIÓN CRÍTICA: Verificar tamaño de datos antes de enviar
+    data_size = len(all_data_str)
+    print(f"[VALIDACIÓN] Tamaño de datos: {data_size:,} caracteres")
+
+    if data_size > max_data_size:
+        print(f"[WARN] Datos exceden el límite ({data_size:,} > {max_data_size:,})")
+        print(f"[TRUNCATE] Aplicando truncamiento inteligente...")
+
+        try:
+            all_data = json.loads(all_data_str)
+
+            # Estrategia de truncamiento: Mantener estructura, reducir JSONs
+            truncated_data = {
+                "user_question": all_data.get("user_question"),
+                "razonamiento": all_data.get("razonamiento"),
+                "metadata": all_data.get("metadata"),
+                "db_summary": all_data.get("db_summary"),  # Ya es un resumen, mantenerlo
+                "jsons": {},
+                "truncated_warning": f"Datos truncados: {data_size:,} caracteres originales"
+            }
+
+            # Incluir solo una muestra de JSONs (primeros 30)
+            jsons_dict = all_data.get("jsons", {})
+            if jsons_dict:
+                sample_jsons = dict(list(jsons_dict.items())[:30])
+                truncated_data["jsons"] = sample_jsons
+                truncated_data["jsons_note"] = f"Mostrando 30 de {len(jsons_dict)} JSONs"
+
+            all_data_str = json.dumps(truncated_data, ensure_ascii=False)
+            new_size = len(all_data_str)
+            print(f"✓ Datos truncados: {data_size:,} → {new_size:,} caracteres ({100*new_size//data_size}%)")
+
+        except Exception as e:
+            print(f"[ERROR] Fallo al truncar datos: {e}")
+            # Si falla el truncamiento, usar solo metadata
+            all_data_str = json.dumps({
+                "error": "Datos demasiado grandes para procesar",
+                "user_question": user_question,
+                "size": data_size
+            }, ensure_ascii=False)
+
+    builder = PromptBuilder("respuesta_final").static(FINAL_RESPONSE_CONTEXT)
+
     try:
         all_data = json.loads(all_data_str)
     except json.JSONDecodeError:
         return "Lo siento, hubo un error al procesar la información. Por favor, intenta reformular tu consulta."
 
-    # Preparar prompt con datos estructurados
-    prompt = f"Consulta del usuario: {user_question}\n\nDatos disponibles:\n{json.dumps(all_data, indent=2, ensure_ascii=False)}"
-
-    respuesta_texto = provider.chat(context, prompt, temperature=0.3)
+    # Preparar prompt con datos estructurados. JSON compacto: la indentación no
+    # aporta nada al modelo y en respuestas con muchos JSONs es buena parte de los tokens
+    data_text = json.dumps(all_data, ensure_ascii=False, separators=(",", ":"))
+    builder.saved_tokens += max(
+        count_tokens(json.dumps(all_data, indent=2, ensure_ascii=False)) - count_tokens(data_text), 0
+    )
+    context = builder.build()
+    prompt = f"Consulta del usuario: {user_question}\n\nDatos disponibles:\n{data_text}"
+
+    if on_token:
+        on_token(None)
+        chunks = []
+        for chunk in provider.chat_stream(context, prompt, temperature=0.3):
+            chunks.append(chunk)
+            on_token(chunk)
+        respuesta_texto = "".join(chunks).strip()
+    else:
+        respuesta_texto = provider.chat(context, prompt, temperature=0.3)
     print("\n=== RESPUESTA FINAL GENERADA ===")
     print(respuesta_texto)
     print("================================\n")
@@ -2000,45 +2240,12 @@ Total de hashes/prendas que procesaría: {total_hashes_available}
                 "suggestion": None
             }
 
-def orquestador_bot(user_question, max_hashes=100, max_tokens=10000, max_retries=3, auto_confirm=False):
-    """
-    Bot orquestador impulsado por IA: Analiza la consulta del usuario, decide el flujo dinámico,
-    y coordina llamadas a funciones para responder de manera óptima.
-
-    Args:
-        user_question: Pregunta del usuario en español
-        max_hashes: Límite de hashes a procesar (el orquestador puede ajustarlo según necesidad)
-        max_tokens: Límite de tokens antes de llamar al bot final (el orquestador puede ajustarlo)
-        max_retries: Número máximo de reintentos por operación fallida
-        auto_confirm: Si es True, procesa automáticamente sin pedir confirmación (para testing)
-
-    Returns:
-        str: Respuesta final al usuario
-    """
-    # Usar el sistema multi-modelo
-    provider = get_ai_provider()
-
-    print(f"\n{'='*80}")
-    print(f"NUEVA CONSULTA: {user_question}")
-    print(f"{'='*80}\n")
-
-    # PASO 0: Corrección automática de errores de escritura
-    print("[PASO 0] Verificando y corrigiendo posibles errores de escritura...")
-    corrected_question, corrections = correct_user_input_with_ai(user_question)
-
-    # Si hubo correcciones, usar la pregunta corregida
-    if corrections:
-        print(f"✓ Pregunta original corregida automáticamente")
-        user_question = corrected_question
-    else:
-        print("✓ No se detectaron errores de escritura")
-
-    # Contexto mejorado para el orquestador IA
-    orchestrator_context = """
+# Contexto del orquestador IA
+ORCHESTRATOR_CONTEXT = """
 Eres un orquestador inteligente especializado en consultas de trazabilidad de prendas textiles.
 
 **ARQUITECTURA DEL SISTEMA**:
-1. **Base de Datos (MariaDB)** - Tabla: apdobloctrazhash
+1. **Base de Datos (MariaDB)** - Tabla: apdobloctrazactu (versión vigente de cada prenda)
    Contiene metadatos de prendas y hashes Swarm:
    - TTICKBARR: ID único de prenda (tickbar)
    - TTICKHASH: Hash Swarm para recuperar trazabilidad completa
@@ -2077,7 +2284,7 @@ A) **Consultas que NO necesitan JSONs** (needs_json_fetch: false):
    - Conteos simples: "¿Cuántas prendas de X hay?"
    - Listados de clientes/tipos: "¿Qué clientes tienen talla 10?"
    - Agregaciones por campos de DB: "Prendas por género"
-   - Consultas que solo usan columnas de apdobloctrazhash
+   - Consultas que solo usan columnas de apdobloctrazactu
 
 B) **Consultas que SÍ necesitan JSONs** (needs_json_fetch: true):
    - Menciona máquinas, operarios, fechas específicas, procesos
@@ -2136,6 +2343,200 @@ IMPORTANTE:
 - Siempre devuelve JSON válido sin formato markdown
 """
 
+ORCHESTRATOR_DOCUMENT_STORE_NOTE = """
+**COPIA LOCAL DE TRAZABILIDAD** (tabla apdobloctrazdocu):
+Ramas (TNOMBMAQUACAB), máquinas de teñido/secado/tejeduría, operarios, OB y fechas de acabado/teñido/tejido
+están disponibles en SQL. Las preguntas que solo usan esos campos NO necesitan JSONs (needs_json_fetch: false);
+indica en query_for_query_bot que use apdobloctrazdocu.
+"""
+
+
+def build_orchestrator_context():
+    """Instrucciones del orquestador (y del paso understand) según la configuración."""
+    if USE_DOCUMENT_STORE:
+        return ORCHESTRATOR_CONTEXT + ORCHESTRATOR_DOCUMENT_STORE_NOTE
+    return ORCHESTRATOR_CONTEXT
+
+
+UNDERSTAND_INSTRUCTIONS = """
+Realizas en UNA sola respuesta tres tareas sobre una pregunta de trazabilidad de prendas:
+1. Corregir nombres mal escritos (clientes, géneros, tipos de prenda, tejidos): "LASCOSTE" → "LACOSTE"
+2. Extraer los filtros mencionados en la pregunta
+3. Diseñar el plan de ejecución como orquestador
+Los valores válidos de la base de datos (y, si las hay, pistas de un reconocimiento local) están al final.
+
+**INSTRUCCIONES DEL ORQUESTADOR** (para el plan):
+"""
+
+UNDERSTAND_FORMAT = """
+**FORMATO DE RESPUESTA FINAL** (reemplaza al formato indicado arriba):
+Responde SOLO con un JSON válido, sin ```json ni explicaciones, con estas claves:
+{
+    "corrected_question": "Pregunta con los nombres mal escritos corregidos (igual a la original si no hay errores)",
+    "corrections": {"original": "corregido"},
+    "filters": {"client": "", "clientStyle": "", "boxNumber": "", "label": "", "size": "", "gender": "", "age": "", "garmentType": ""},
+    "plan": {
+        "razonamiento": "...",
+        "query_for_query_bot": "Instrucción para query_bot en español (o null)",
+        "needs_json_fetch": true/false,
+        "limit_hashes": número,
+        "final_call": true
+    }
+}
+
+**REGLAS**:
+1. corrections: solo nombres mal escritos que existen en la lista de valores válidos ({} si no hay)
+2. filters: solo valores mencionados EXPLÍCITAMENTE en la pregunta, con el valor EXACTO de la lista; "" si no se mencionan
+3. plan: se genera sobre la pregunta corregida, siguiendo las reglas del orquestador
+"""
+
+@traced("understand_question")
+def understand_question(question, history_context="", filter_context=""):
+    """
+    Paso "understand": en una sola llamada al LLM corrige la pregunta, extrae
+    los filtros y genera el plan del orquestador (incluida la instrucción SQL).
+    Reemplaza a correct_user_input_with_ai + extract_filters_from_question +
+    el plan de orquestador_bot, que reenviaban cada uno el catálogo de valores.
+
+    Args:
+        question: Pregunta original del usuario
+        history_context: Historial de la conversación formateado (opcional)
+        filter_context: Filtros elegidos en el panel, ej "cliente: LACOSTE" (opcional)
+
+    Returns:
+        dict: {corrected_question, corrections, filters, plan} o None si la
+              respuesta no es válida (el llamador debe usar el camino de varias llamadas)
+    """
+    provider = get_ai_provider()
+
+    # Las entidades reconocidas localmente van como pistas: el LLM sigue viendo
+    # el catálogo y puede corregir lo que el reconocimiento local no resolvió
+    analysis = analyze_entities(question)
+    local = analysis if analysis is not None and analysis.confident else None
+
+    # Instrucciones fijas primero (prefijo cacheable); las entidades o los
+    # catálogos de la DB, que cambian con la pregunta, al final
+    builder = PromptBuilder("understand").static(UNDERSTAND_INSTRUCTIONS)
+    builder.static(build_orchestrator_context())
+    builder.static(UNDERSTAND_FORMAT)
+
+    builder.dynamic("**VALORES VÁLIDOS DE LA BASE DE DATOS**:")
+    builder.catalog("Clientes (client)", get_unique_values('TDESCCLIE'), question, limit=30, previous_limit=50)
+    builder.catalog("Géneros (gender)", get_unique_values('TTIPOGENE'), question, limit=10)
+    builder.catalog("Edades (age)", get_unique_values('TTIPOEDAD'), question, limit=10)
+    builder.catalog("Tipos de prenda (garmentType)", get_unique_values('TTIPOPREN'), question, limit=20, previous_limit=30)
+    builder.catalog("Tipos de tejido", get_unique_values('TTIPOTEJI'), question, limit=20)
+    builder.catalog("Tallas (size)", get_unique_values('TCODITALL'), question, limit=15, previous_limit=20)
+    builder.dynamic("- clientStyle (estilo cliente), boxNumber (número de caja) y label (etiqueta) son códigos libres")
+    if local and (local.entities or local.corrections):
+        hints = [f"- {field}: {value}" for field, value in local.entities.items()]
+        hints += [f"- corrección propuesta: '{original}' → '{value}'" for original, value in local.corrections.items()]
+        builder.dynamic("**PISTAS DEL RECONOCIMIENTO LOCAL** (verifícalas con la lista de valores; "
+                        "corrígelas si no corresponden):\n" + "\n".join(hints))
+    context = builder.build()
+
+    user_message = question
+    if history_context:
+        user_message = f"{history_context}\n\nPregunta actual del usuario: {question}"
+    if filter_context:
+        # Van al plan pero no a "filters", que solo recoge lo que dice la pregunta
+        user_message = f"{user_message} (Filtrar por: {filter_context})"
+
+    try:
+        response_text = provider.chat(context, user_message, temperature=0.1)
+
+        # Limpiar formato markdown si existe
+        if response_text.startswith("```"):
+            response_text = response_text.replace("```json", "").replace("```", "").strip()
+
+        result = json.loads(response_text)
+        corrected_question = result.get("corrected_question")
+        plan = result.get("plan")
+        if not isinstance(corrected_question, str) or not corrected_question.strip():
+            raise ValueError("Falta corrected_question")
+        if not isinstance(plan, dict) or "needs_json_fetch" not in plan:
+            raise ValueError("Falta el plan")
+
+        corrections = result.get("corrections") or {}
+        if not isinstance(corrections, dict):
+            corrections = {}
+        filters = result.get("filters")
+        filters = dict(filters) if isinstance(filters, dict) else {}
+        if local:
+            # Las entidades locales exactas (no las corregidas, que el LLM pudo
+            # descartar) solo completan los filtros que el LLM dejó vacíos
+            corrected_values = set(local.corrections.values())
+            for field, value in local.entities.items():
+                if field in FILTER_KEYS and not filters.get(field) and value not in corrected_values:
+                    filters[field] = value
+        if corrections:
+            print(f"\n[UNDERSTAND] Correcciones: {corrections}")
+
+        return {
+            "corrected_question": corrected_question.strip(),
+            "corrections": corrections,
+            "filters": validate_extracted_filters(filters),
+            "plan": plan
+        }
+
+    except Exception as e:
+        print(f"[WARN] Paso understand inválido, se usa el camino de varias llamadas: {e}")
+        return None
+
+@traced("orquestador_bot")
+def orquestador_bot(user_question, max_hashes=100, max_tokens=10000, max_retries=3, auto_confirm=False,
+                    progress_callback=None, token_callback=None, context=None):
+    """
+    Bot orquestador impulsado por IA: Analiza la consulta del usuario, decide el flujo dinámico,
+    y coordina llamadas a funciones para responder de manera óptima.
+
+    Args:
+        user_question: Pregunta del usuario en español
+        max_hashes: Límite de hashes a procesar (el orquestador puede ajustarlo según necesidad)
+        max_tokens: Límite de tokens antes de llamar al bot final (el orquestador puede ajustarlo)
+        max_retries: Número máximo de reintentos por operación fallida
+        auto_confirm: Si es True, procesa automáticamente sin pedir confirmación (para testing)
+        progress_callback: Función opcional callback(etapa, mensaje) para informar el avance
+        token_callback: Función opcional que recibe la respuesta final por fragmentos (ver final_response_bot)
+        context: PipelineContext opcional; si la pregunta ya fue corregida, se omite el PASO 0,
+                 y si trae un plan (paso understand), se omite el PASO 1
+
+    Returns:
+        str: Respuesta final al usuario
+    """
+    # Usar el sistema multi-modelo
+    provider = get_ai_provider()
+
+    def report_progress(stage, message):
+        # El avance es informativo: un error al reportarlo no detiene la consulta
+        if progress_callback:
+            try:
+                progress_callback(stage, message)
+            except Exception as e:
+                print(f"[WARN] Error al reportar progreso: {e}")
+
+    print(f"\n{'='*80}")
+    print(f"NUEVA CONSULTA: {user_question}")
+    print(f"{'='*80}\n")
+
+    # PASO 0: Corrección automática de errores de escritura
+    if context is not None and context.corrected:
+        # El pipeline de /chat ya corrigió la pregunta: no se repite la llamada al LLM
+        print("[PASO 0] Pregunta ya corregida por el pipeline")
+    else:
+        print("[PASO 0] Verificando y corrigiendo posibles errores de escritura...")
+        report_progress("correccion", "Revisando la pregunta")
+        corrected_question, corrections = correct_user_input_with_ai(user_question)
+
+        # Si hubo correcciones, usar la pregunta corregida
+        if corrections:
+            print(f"✓ Pregunta original corregida automáticamente")
+            user_question = corrected_question
+        else:
+            print("✓ No se detectaron errores de escritura")
+
+    orchestrator_context = build_orchestrator_context()
+
     # Función helper mejorada para retries con validación de lógica
     def retry_operation(operation, *args, validation_type="text", **kwargs):
         """
@@ -2252,11 +2653,19 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
     if len(user_question.strip()) < 5:
         return "❌ Tu pregunta es demasiado corta. Por favor, proporciona más detalles sobre lo que deseas saber."
 
-    # PASO 1: Generar plan dinámico usando IA
-    print("\n[PASO 1] Generando plan de ejecución con IA...")
+    # PASO 0.7: Camino rápido para conteos y listados de la DB (el pipeline de /chat
+    # ya lo intentó antes de llamar al orquestador)
+    if context is None:
+        fast_response = answer_without_llm(analyze_entities(user_question))
+        if fast_response:
+            print("✓ Respondida con plantilla SQL, sin plan del LLM")
+            return fast_response
 
+    # PASO 1: Generar plan dinámico usando IA
+    @traced("plan")
     def generate_plan():
-        plan_text = provider.chat(orchestrator_context, user_question, temperature=0.2)
+        system_prompt = PromptBuilder("plan").static(orchestrator_context).build()
+        plan_text = provider.chat(system_prompt, user_question, temperature=0.2)
 
         # Limpiar formato markdown si existe
         if plan_text.startswith("```json"):
@@ -2264,7 +2673,14 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
 
         return plan_text
 
-    plan_json = retry_operation(generate_plan, validation_type="json")
+    if context is not None and context.plan is not None:
+        # El plan ya vino del paso understand junto con la corrección y los filtros
+        print("\n[PASO 1] Usando el plan generado en el paso understand")
+        plan_json = json.dumps(context.plan, ensure_ascii=False)
+    else:
+        print("\n[PASO 1] Generando plan de ejecución con IA...")
+        report_progress("plan", "Planificando cómo responder")
+        plan_json = retry_operation(generate_plan, validation_type="json")
 
     if not plan_json:
         return "Lo siento, no pude analizar tu consulta correctamente. ¿Puedes reformularla?"
@@ -2307,28 +2723,51 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
 
     # PASO 3: Ejecutar consulta a DB si es necesaria
     if plan.get("query_for_query_bot"):
-        print(f"\n[PASO 2] Generando SQL desde instrucción: '{plan['query_for_query_bot']}'")
+        # Las instrucciones con forma conocida (contar, agrupar, distintos, hashes)
+        # usan una plantilla con parámetros; el resto la escribe el LLM
+        db_results_df = None
+        template = None
+        if USE_QUERY_TEMPLATES:
+            template = match_query_template(
+                analyze_entities(plan["query_for_query_bot"]),
+                ENTITY_COLUMNS,
+                needs_hashes=plan.get("needs_json_fetch", False)
+            )
+        if template is not None:
+            print(f"\n[PASO 2-3] SQL desde plantilla '{template.name}': {template.sql} {template.params}")
+            report_progress("base_datos", "Consultando la base de datos")
+            set_span_attributes(sql_template=template.name)
+            db_results_df = execute_query(template.sql, params=template.params)
+            if db_results_df.empty:
+                # Sin resultados con igualdad exacta: el LLM puede intentar algo más amplio
+                print("[INFO] La plantilla no retornó resultados. Generando SQL con el LLM...")
+                db_results_df = None
 
-        sql_query = retry_operation(query_bot, plan["query_for_query_bot"], validation_type="sql")
+        if db_results_df is None:
+            print(f"\n[PASO 2] Generando SQL desde instrucción: '{plan['query_for_query_bot']}'")
+            report_progress("sql", "Generando la consulta a la base de datos")
 
-        if not sql_query:
-            return "No pude generar una consulta SQL válida. Por favor, reformula tu pregunta."
+            sql_query = retry_operation(query_bot, plan["query_for_query_bot"], validation_type="sql")
 
-        print(f"\n[PASO 3] Ejecutando query SQL en la base de datos...")
+            if not sql_query:
+                return "No pude generar una consulta SQL válida. Por favor, reformula tu pregunta."
 
-        db_results_df = retry_operation(execute_query, sql_query, validation_type="dataframe")
+            print(f"\n[PASO 3] Ejecutando query SQL en la base de datos...")
+            report_progress("base_datos", "Consultando la base de datos")
 
-        if db_results_df is None:
-            # Si no hay resultados, intentar con consulta alternativa
-            print("[INFO] No se encontraron resultados. Intentando consulta más amplia...")
-            alternative_prompt = f"No hubo resultados para: '{plan['query_for_query_bot']}'. Sugiere una consulta SQL más amplia que pueda retornar datos relacionados."
+            db_results_df = retry_operation(execute_query, sql_query, validation_type="dataframe")
+
+            if db_results_df is None:
+                # Si no hay resultados, intentar con consulta alternativa
+                print("[INFO] No se encontraron resultados. Intentando consulta más amplia...")
+                alternative_prompt = f"No hubo resultados para: '{plan['query_for_query_bot']}'. Sugiere una consulta SQL más amplia que pueda retornar datos relacionados."
 
-            alt_sql = retry_operation(query_bot, alternative_prompt, validation_type="sql")
-            if alt_sql:
-                db_results_df = execute_query(alt_sql)
+                alt_sql = retry_operation(query_bot, alternative_prompt, validation_type="sql")
+                if alt_sql:
+                    db_results_df = execute_query(alt_sql)
 
-            if db_results_df is None or db_results_df.empty:
-                return f"No se encontraron registros que coincidan con tu consulta: '{user_question}'. Intenta con términos más generales."
+                if db_results_df is None or db_results_df.empty:
+                    return f"No se encontraron registros que coincidan con tu consulta: '{user_question}'. Intenta con términos más generales."
 
         # =========================================================================
         # IMPORTANTE: NO enviar todos los datos crudos de DB al LLM
@@ -2372,14 +2811,22 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
         print(f"✓ Recuperados {len(db_results_df)} registros de la base de datos")
 
         # PASO 3.5: VALIDACIÓN DE FACTIBILIDAD (NUEVO)
+        prefetch = None
         if plan.get("needs_json_fetch", False) and 'ttickhash' in db_results_df.columns:
             # Contar hashes antes de procesar
             total_hashes = db_results_df['ttickhash'].dropna().nunique()
 
             print(f"\n[PASO 3.5] Validando factibilidad de la consulta...")
+            report_progress("validacion", f"Validando la consulta sobre {total_hashes} prendas")
             print(f"  → Total de hashes a procesar: {total_hashes}")
 
-            # Validar si la consulta es factible y coherente
+            # Validar si la consulta es factible y coherente (LLM) mientras se precargan
+            # en la caché los primeros documentos de Swarm. La precarga no se espera:
+            # las respuestas de consulta inválida o de confirmación no la necesitan
+            prefetch_limit = min(plan.get("limit_hashes") or max_hashes, SWARM_PREFETCH_LIMIT)
+            prefetch_hashes = db_results_df['ttickhash'].dropna().unique().tolist()[:prefetch_limit]
+            if auto_confirm and prefetch_hashes and not USE_DOCUMENT_STORE:
+                prefetch = prefetch_swarm_documents(prefetch_hashes)
             validation = validate_query_feasibility(user_question, total_hashes)
 
             print(f"  → Consulta válida: {validation['is_valid']}")
@@ -2439,6 +2886,11 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
             print(f"✓ Se identificaron {len(hashes)} hashes para análisis detallado")
 
             # PASO 5: Recuperar y filtrar JSONs de Swarm
+            report_progress("swarm", f"Recuperando la trazabilidad de {len(hashes)} prendas")
+            if prefetch is not None:
+                # Terminar la precarga en curso para no descargar dos veces los mismos documentos
+                with span("precarga_swarm_espera"):
+                    wait([prefetch])
             try:
                 filtered_jsons = fetch_and_filter_jsons(hashes, user_question)
 
@@ -2490,6 +2942,7 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
 
     # PASO FINAL: Generar respuesta al usuario
     print(f"\n[PASO FINAL] Generando respuesta final para el usuario...")
+    report_progress("respuesta", "Redactando la respuesta")
 
     # =========================================================================
     # Verificar tamaño de all_data antes de enviarlo al LLM
@@ -2511,6 +2964,7 @@ Responde SOLO con la corrección (sin explicaciones adicionales).
         final_response_bot,
         all_data_str,
         user_question,
+        on_token=token_callback,
         validation_type="text"
     )
 
@@ -54,6 +54,36 @@ def get_complete_history_bot():
     return pd.DataFrame()
 
 
+# Consultas del historial del chatbot (index_advisor.py les hace EXPLAIN)
+NEXT_CONVERSATION_GROUP_SQL = """
+SELECT COALESCE(MAX(tgrupconv), 0) + 1
+FROM apdoblochistbott
+WHERE tcodiusua = %s
+"""
+
+CURRENT_CONVERSATION_GROUP_SQL = """
+SELECT MAX(tgrupconv)
+FROM apdoblochistbott
+WHERE tcodiusua = %s
+"""
+
+CONVERSATION_HISTORY_SQL = """
+SELECT tpregusua, trespbott, tfechconv
+FROM apdoblochistbott
+WHERE tcodiusua = %s AND tgrupconv = %s
+ORDER BY tfechconv ASC
+"""
+
+USER_CONVERSATIONS_SQL = """
+SELECT tgrupconv, MIN(tpregusua) as first_question,
+       DATE_FORMAT(MIN(tfechconv), '%%Y-%%m-%%d %%H:%%i') as start_date
+FROM apdoblochistbott
+WHERE tcodiusua = %s
+GROUP BY tgrupconv
+ORDER BY MIN(tfechconv) DESC
+"""
+
+
 def get_next_conversation_group(user_code: str) -> int:
     """
     Obtiene el siguiente numero de grupo de conversacion para un usuario.
@@ -63,12 +93,7 @@ def get_next_conversation_group(user_code: str) -> int:
     if conn:
         try:
             cursor = conn.cursor()
-            query = """
-                SELECT COALESCE(MAX(tgrupconv), 0) + 1
-                FROM apdoblochistbott
-                WHERE tcodiusua = %s
-            """
-            cursor.execute(query, (user_code,))
+            cursor.execute(NEXT_CONVERSATION_GROUP_SQL, (user_code,))
             result = cursor.fetchone()
             cursor.close()
             conn.close()
@@ -89,12 +114,7 @@ def get_current_conversation_group(user_code: str) -> int:
     if conn:
         try:
             cursor = conn.cursor()
-            query = """
-                SELECT MAX(tgrupconv)
-                FROM apdoblochistbott
-                WHERE tcodiusua = %s
-            """
-            cursor.execute(query, (user_code,))
+            cursor.execute(CURRENT_CONVERSATION_GROUP_SQL, (user_code,))
             result = cursor.fetchone()
             cursor.close()
             conn.close()
@@ -115,25 +135,16 @@ def get_conversation_history(user_code: str, conversation_group: int) -> list:
     if conn:
         try:
             cursor = conn.cursor()
-            query = """
-                SELECT tpregusua, trespbott, tfechconv
-                FROM apdoblochistbott
-                WHERE tcodiusua = %s AND tgrupconv = %s
-                ORDER BY tfechconv ASC
-            """
-            cursor.execute(query, (user_code, conversation_group))
+            cursor.execute(CONVERSATION_HISTORY_SQL, (user_code, conversation_group))
             results = cursor.fetchall()
             cursor.close()
             conn.close()
 
-            history = []
-            for row in results:
-                history.append({
-                    "question": row[0],
-                    "answer": row[1],
-                    "timestamp": row[2].strftime('%Y-%m-%d %H:%M:%S') if row[2] else None
-                })
-            return history
+            # timestamp queda como datetime: el proveedor JSON de la API lo formatea
+            return [
+                {"question": row[0], "answer": row[1], "timestamp": row[2]}
+                for row in results
+            ]
         except Exception as e:
             print(f"Error en get_conversation_history: {e}")
             conn.close()
@@ -150,14 +161,7 @@ def get_all_conversations_for_user(user_code: str) -> list:
     if conn:
         try:
             cursor = conn.cursor()
-            query = """
-                SELECT tgrupconv, MIN(tpregusua) as first_question, MIN(tfechconv) as start_date
-                FROM apdoblochistbott
-                WHERE tcodiusua = %s
-                GROUP BY tgrupconv
-                ORDER BY start_date DESC
-            """
-            cursor.execute(query, (user_code,))
+            cursor.execute(USER_CONVERSATIONS_SQL, (user_code,))
             results = cursor.fetchall()
             cursor.close()
             conn.close()
@@ -167,7 +171,7 @@ def get_all_conversations_for_user(user_code: str) -> list:
                 conversations.append({
                     "group_id": row[0],
                     "first_question": row[1][:50] + "..." if row[1] and len(row[1]) > 50 else row[1],
-                    "start_date": row[2].strftime('%Y-%m-%d %H:%M') if row[2] else None
+                    "start_date": row[2]
                 })
             return conversations
         except Exception as e:
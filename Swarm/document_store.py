@@ -0,0 +1,232 @@
+import json
+import pymysql
+
+from db import connect_to_my_db
+
+# ============================================================================
+# ESPEJO LOCAL DE LOS DOCUMENTOS DE TRAZABILIDAD
+# ============================================================================
+# Swarm sigue siendo la prueba de integridad; esta tabla es solo una copia
+# consultable del último documento de cada tickbarr. Cada fila de cada sección
+# se guarda como JSON y los campos más consultados (máquinas, operarios, OB,
+# fechas) se exponen como columnas generadas e indexadas.
+
+DOCUMENT_STORE_DDL = """
+CREATE TABLE IF NOT EXISTS apdobloctrazdocu (
+    TTICKBARR VARCHAR(20) NOT NULL,
+    TNOMBSECC VARCHAR(40) NOT NULL,
+    TNUMEFILA INT NOT NULL,
+    TNUMEVERS INT NOT NULL,
+    TTICKHASH VARCHAR(128) NOT NULL,
+    TDATAFILA LONGTEXT NOT NULL CHECK (JSON_VALID(TDATAFILA)),
+    TNOMBMAQUACAB VARCHAR(100) AS (JSON_VALUE(TDATAFILA, '$.TNOMBMAQUACAB')) PERSISTENT,
+    TNOMBMAQUTENI VARCHAR(100) AS (JSON_VALUE(TDATAFILA, '$.TNOMBMAQUTENI')) PERSISTENT,
+    TNOMBMAQUSECA VARCHAR(100) AS (JSON_VALUE(TDATAFILA, '$.TNOMBMAQUSECA')) PERSISTENT,
+    TNOMBMAQU VARCHAR(100) AS (JSON_VALUE(TDATAFILA, '$.TNOMBMAQU')) PERSISTENT,
+    TNOMBPERS VARCHAR(150) AS (JSON_VALUE(TDATAFILA, '$.TNOMBPERS')) PERSISTENT,
+    TNUMEOB VARCHAR(30) AS (JSON_VALUE(TDATAFILA, '$.TNUMEOB')) PERSISTENT,
+    TFECHACABINIC VARCHAR(19) AS (JSON_VALUE(TDATAFILA, '$.TFECHACABINIC')) PERSISTENT,
+    TFECHTENIINIC VARCHAR(19) AS (JSON_VALUE(TDATAFILA, '$.TFECHTENIINIC')) PERSISTENT,
+    TFECHTEJE VARCHAR(19) AS (JSON_VALUE(TDATAFILA, '$.TFECHTEJE')) PERSISTENT,
+    PRIMARY KEY (TTICKBARR, TNOMBSECC, TNUMEFILA),
+    KEY idx_trazdocu_hash (TTICKHASH),
+    KEY idx_trazdocu_rama (TNOMBMAQUACAB, TFECHACABINIC),
+    KEY idx_trazdocu_teni (TNOMBMAQUTENI, TFECHTENIINIC),
+    KEY idx_trazdocu_seca (TNOMBMAQUSECA),
+    KEY idx_trazdocu_teje (TNOMBMAQU, TFECHTEJE),
+    KEY idx_trazdocu_pers (TNOMBPERS),
+    KEY idx_trazdocu_ob (TNUMEOB)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+"""
+
+
+def ensure_document_store(conn=None) -> bool:
+    """Crea la tabla apdobloctrazdocu si no existe."""
+    own_conn = conn is None
+    conn = conn or connect_to_my_db()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(DOCUMENT_STORE_DDL)
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error en ensure_document_store: {e}")
+        return False
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def save_document_to_store(tickbarr, version, hash_value, json_data, conn=None) -> bool:
+    """
+    Reemplaza el documento guardado de un tickbarr por su versión más reciente.
+
+    Args:
+        tickbarr: Tickbarr de la prenda
+        version: Versión registrada en apdobloctrazhash
+        hash_value: Referencia Swarm del documento
+        json_data: Documento limpio (str JSON o dict) tal como se subió a Swarm
+        conn: Conexión abierta (opcional). Si se pasa, el commit queda a cargo del llamador.
+
+    Returns:
+        bool: True si se guardó correctamente
+    """
+    # Un documento inválido no es un error de la ingesta: se informa y se sigue
+    try:
+        document = json.loads(json_data) if isinstance(json_data, (str, bytes)) else json_data
+        if not isinstance(document, dict):
+            raise ValueError("el documento no es un objeto JSON")
+        rows = []
+        for section_name, section_rows in document.items():
+            if not isinstance(section_rows, list):
+                continue
+            for index, row in enumerate(section_rows):
+                rows.append((
+                    tickbarr, section_name, index, version, hash_value,
+                    json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+                ))
+    except Exception as e:
+        print(f"Error en save_document_to_store ({tickbarr}): documento inválido: {e}")
+        return False
+
+    own_conn = conn is None
+    conn = conn or connect_to_my_db()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            if not own_conn:
+                # Con conexión prestada, un fallo solo deshace este documento
+                # (el DELETE no debe quedar confirmado por el commit del llamador)
+                cursor.execute("SAVEPOINT espejo_documento")
+            cursor.execute("DELETE FROM apdobloctrazdocu WHERE TTICKBARR = %s", (tickbarr,))
+            if rows:
+                cursor.executemany(
+                    """
+                    INSERT INTO apdobloctrazdocu
+                    (TTICKBARR, TNOMBSECC, TNUMEFILA, TNUMEVERS, TTICKHASH, TDATAFILA)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    rows
+                )
+            if not own_conn:
+                cursor.execute("RELEASE SAVEPOINT espejo_documento")
+        if own_conn:
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error en save_document_to_store: {e}")
+        if own_conn:
+            conn.rollback()
+        else:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("ROLLBACK TO SAVEPOINT espejo_documento")
+            except Exception:
+                # Sin savepoint (falló al crearlo) se deshace todo lo pendiente
+                conn.rollback()
+        return False
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def load_documents_from_store(hashes) -> dict:
+    """
+    Reconstruye desde la tabla local los documentos de varios hashes en una consulta.
+
+    Args:
+        hashes: Lista de referencias Swarm
+
+    Returns:
+        dict: {hash: documento} solo para los hashes presentes en el espejo
+    """
+    hashes = list(dict.fromkeys(h for h in hashes if h))
+    if not hashes:
+        return {}
+
+    conn = connect_to_my_db()
+    if not conn:
+        return {}
+    try:
+        placeholders = ", ".join(["%s"] * len(hashes))
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT TTICKHASH, TNOMBSECC, TDATAFILA
+                FROM apdobloctrazdocu
+                WHERE TTICKHASH IN ({placeholders})
+                ORDER BY TTICKHASH, TNOMBSECC, TNUMEFILA
+                """,
+                tuple(hashes)
+            )
+            documents = {}
+            for hash_value, section_name, row_json in cursor.fetchall():
+                documents.setdefault(hash_value, {}).setdefault(section_name, []).append(json.loads(row_json))
+        return documents
+    except Exception as e:
+        print(f"Error en load_documents_from_store: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+def backfill_document_store(batch_size=200, max_workers=10) -> int:
+    """
+    Copia al espejo los documentos de los tickbarrs que aún no están en él,
+    descargándolos desde Swarm. Pensado para poblar la tabla por primera vez.
+
+    Returns:
+        int: Número de documentos copiados
+    """
+    from swarm_cache import fetch_swarm_documents
+
+    ensure_document_store()
+    copied = 0
+    last_tickbarr = ""
+
+    while True:
+        conn = connect_to_my_db()
+        if not conn:
+            return copied
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT h.TTICKBARR, h.TNUMEVERS, h.TTICKHASH
+                    FROM apdobloctrazactu h
+                    WHERE h.TTICKBARR > %s
+                      AND NOT EXISTS (
+                        SELECT 1 FROM apdobloctrazdocu d WHERE d.TTICKHASH = h.TTICKHASH
+                      )
+                    ORDER BY h.TTICKBARR
+                    LIMIT %s
+                    """,
+                    (last_tickbarr, batch_size)
+                )
+                pending = cursor.fetchall()
+
+            if not pending:
+                return copied
+            # Se avanza por tickbarr para no reintentar en bucle los que fallen
+            last_tickbarr = pending[-1]["TTICKBARR"]
+
+            documents = fetch_swarm_documents([row["TTICKHASH"] for row in pending], max_workers=max_workers)
+            saved_in_batch = 0
+            for row in pending:
+                document = documents.get(row["TTICKHASH"])
+                if document is None:
+                    continue
+                if save_document_to_store(row["TTICKBARR"], row["TNUMEVERS"], row["TTICKHASH"], document, conn=conn):
+                    saved_in_batch += 1
+            conn.commit()
+            copied += saved_in_batch
+            print(f"✓ Espejo de documentos: {copied} copiados")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    backfill_document_store()
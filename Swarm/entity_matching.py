@@ -0,0 +1,395 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+# ============================================================================
+# RECONOCIMIENTO Y CORRECCIÓN LOCAL DE ENTIDADES
+# ============================================================================
+# Reconoce en la pregunta los valores de la DB (clientes, géneros, tipos de
+# prenda, tejidos, tallas, edades) sin llamar al LLM:
+# - Los valores se normalizan (mayúsculas, sin tildes ni signos) y se indexan
+#   por frase exacta y en un índice de borrados simétricos (uno para todos los
+#   campos; las tallas, que son códigos cortos, solo se aceptan exactas).
+# - La pregunta se recorre por n-gramas de palabras, de la frase más larga a
+#   la más corta. Un n-grama que no coincide exacto se busca con distancia de
+#   edición acotada: el índice entrega los candidatos y cada uno se verifica
+#   con una distancia de Levenshtein que corta apenas supera el límite.
+# Si algo queda dudoso (empate entre valores, similitud baja, una corrección de
+# una sola letra en una palabra corta, una corrección a un campo que la
+# pregunta no menciona o una palabra sin reconocer) el resultado se marca como
+# no confiable y el llamador recurre al LLM.
+
+# Palabras frecuentes en las preguntas que nunca son entidades
+STOPWORDS = {
+    "A", "AL", "CON", "CUAL", "CUALES", "CUANTAS", "CUANTOS", "DE", "DEL", "EL", "EN", "ES", "ESTA",
+    "HAY", "LA", "LAS", "LO", "LOS", "MAS", "O", "PARA", "POR", "QUE", "QUIEN", "SE", "SON", "SU",
+    "TIENE", "TIENEN", "TOTAL", "UN", "UNA", "Y", "PRENDA", "PRENDAS", "CLIENTE", "CLIENTES",
+    "TALLA", "TALLAS", "TIPO", "TIPOS", "CAJA", "CAJAS", "MAQUINA", "MAQUINAS", "DAME", "LISTA",
+    "MUESTRA", "CUANTO", "DONDE", "COMO", "CUANDO", "PASO", "PASARON", "REGISTROS",
+}
+
+# Palabras que anteceden a una talla: "talla M", "tallas 10"
+SIZE_MARKERS = {"TALLA", "TALLAS", "SIZE"}
+
+# Palabras con las que la pregunta señala el campo de un valor. Una corrección
+# aproximada solo es confiable si la pregunta menciona su campo: "marca NIQUE"
+# no puede terminar corregido al tejido "Pique"
+FIELD_CUES = {
+    "client": {"CLIENTE", "CLIENTES", "MARCA", "MARCAS"},
+    "gender": {"GENERO", "GENEROS", "SEXO"},
+    "age": {"EDAD", "EDADES"},
+    "garmentType": {"TIPO", "TIPOS", "MODELO", "MODELOS"},
+    "fabric": {"TEJIDO", "TEJIDOS", "TELA", "TELAS"},
+    "size": SIZE_MARKERS,
+}
+
+# Frases más cortas que esto solo se aceptan con coincidencia exacta
+MIN_FUZZY_LENGTH = 4
+# Hasta este largo, una corrección de una sola letra es dudosa ("NIQUE" → "PIQUE")
+MAX_SHORT_FUZZY_LENGTH = 6
+# La similitud de una corrección debe superar (estrictamente) este valor
+MIN_CONFIDENCE = 0.8
+
+_WORD_PATTERN = re.compile(r"[0-9A-Za-zÀ-ÿ]+")
+
+
+def normalize_text(text):
+    """Mayúsculas, sin tildes y con los signos reemplazados por espacios."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9A-Za-z]+", " ", text).upper().split())
+
+
+def max_edit_distance(length):
+    """Errores tolerados según el largo de la frase."""
+    if length < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if length <= 6 else 2
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """Distancia de edición entre a y b, o max_distance + 1 si la supera."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(current[j - 1] + 1, previous[j] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletes(phrase, max_distance):
+    """Variantes de phrase con hasta max_distance caracteres borrados (incluye phrase)."""
+    variants = {phrase}
+    frontier = {phrase}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))} - variants
+        variants |= frontier
+    return variants
+
+
+class DeleteIndex:
+    """
+    Índice de borrados simétricos: dos frases están a distancia <= k solo si
+    comparten alguna variante con hasta k borrados. Buscar cuesta unas decenas
+    de consultas a un dict, en vez de comparar contra todo el vocabulario.
+    """
+
+    MAX_DISTANCE = 2
+
+    def __init__(self):
+        self.values = {}
+        self.index = {}
+
+    def insert(self, phrase, value):
+        if phrase in self.values:
+            return
+        self.values[phrase] = value
+        for variant in _deletes(phrase, self.MAX_DISTANCE):
+            self.index.setdefault(variant, []).append(phrase)
+
+    def search(self, term, max_distance):
+        """
+        Valores cuya frase está a distancia de Levenshtein <= max_distance de term.
+
+        Returns:
+            list: [(value, distance), ...] ordenada por distancia
+        """
+        max_distance = min(max_distance, self.MAX_DISTANCE)
+        candidates = set()
+        for variant in _deletes(term, max_distance):
+            candidates.update(self.index.get(variant, ()))
+        results = []
+        for phrase in candidates:
+            distance = bounded_levenshtein(term, phrase, max_distance)
+            if distance <= max_distance:
+                results.append((self.values[phrase], distance))
+        results.sort(key=lambda item: item[1])
+        return results
+
+
+class EntityAnalysis:
+    """Resultado de EntityMatcher.analyze."""
+
+    def __init__(self, question):
+        self.question = question
+        self.corrected_question = question
+        self.corrections = {}
+        self.entities = {}
+        # Todas las entidades reconocidas, en orden: [(campo, valor), ...]
+        self.matches = []
+        # Cada palabra normalizada con el campo de la entidad que la cubre (o None)
+        self.words = []
+        self.confidence = 1.0
+        self.doubts = []
+
+    @property
+    def confident(self):
+        return not self.doubts and self.confidence > MIN_CONFIDENCE
+
+    def __repr__(self):
+        return (f"EntityAnalysis(entities={self.entities}, corrections={self.corrections}, "
+                f"confidence={self.confidence:.2f}, doubts={self.doubts})")
+
+
+class EntityMatcher:
+    """Índices de los vocabularios de la DB para reconocer entidades en una pregunta."""
+
+    def __init__(self, vocabularies, known_words=()):
+        """
+        Args:
+            vocabularies: {campo: [valores de la DB]}, ej {"client": [...], "size": [...]}
+            known_words: Palabras normalizadas de las preguntas que no son entidades
+                         ni dudas (además de STOPWORDS), ej "CANTIDAD", "DISTINTOS"
+        """
+        self.known_words = set(STOPWORDS) | set(known_words)
+        for cues in FIELD_CUES.values():
+            self.known_words |= cues
+        self.exact = {}
+        self.index = DeleteIndex()
+        self.max_words = 1
+        for field, values in vocabularies.items():
+            for value in values or []:
+                phrase = normalize_text(value)
+                if not phrase or phrase in self.exact:
+                    continue
+                self.exact[phrase] = (field, value)
+                if field != "size":
+                    self.index.insert(phrase, (field, value))
+                self.max_words = max(self.max_words, phrase.count(" ") + 1)
+
+    def _lookup_exact(self, phrase):
+        match = self.exact.get(phrase)
+        if match:
+            return match
+        # Plural/singular: "HOMBRE" ↔ "HOMBRES", "CAMISA" ↔ "CAMISAS"
+        for variant in (phrase + "S", phrase + "ES", phrase[:-1] if phrase.endswith("S") else None):
+            if variant and variant in self.exact:
+                return self.exact[variant]
+        return None
+
+    def _lookup_fuzzy(self, phrase):
+        """
+        Returns:
+            tuple: (field, value, distance) o None; ("__ambiguo__", valores, distancia) si hay empate
+        """
+        max_distance = max_edit_distance(len(phrase))
+        if max_distance == 0:
+            return None
+        best = self.index.search(phrase, max_distance)
+        if not best:
+            return None
+        top_distance = best[0][1]
+        tied = [match for match, distance in best if distance == top_distance]
+        if len(tied) > 1:
+            return "__ambiguo__", sorted(value for _, value in tied), top_distance
+        (field, value), distance = best[0]
+        return field, value, distance
+
+    def analyze(self, question):
+        """
+        Reconoce y corrige entidades de la pregunta.
+
+        Args:
+            question: Pregunta del usuario
+
+        Returns:
+            EntityAnalysis
+        """
+        analysis = EntityAnalysis(question)
+        words = [(m.group(0), normalize_text(m.group(0)), m.start(), m.end())
+                 for m in _WORD_PATTERN.finditer(question)]
+        question_words = {word[1] for word in words}
+        covered = [None] * len(words)
+        replacements = []
+        found = []
+
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                if any(covered[start:start + size]):
+                    continue
+                window = words[start:start + size]
+                if window[0][1] in STOPWORDS or window[-1][1] in STOPWORDS:
+                    continue
+                phrase = " ".join(word[1] for word in window)
+
+                match = self._lookup_exact(phrase)
+                distance = 0
+                if match:
+                    field, value = match
+                    # Una talla solo cuenta si la pregunta la presenta como talla
+                    if field == "size" and (start == 0 or words[start - 1][1] not in SIZE_MARKERS):
+                        continue
+                else:
+                    fuzzy = self._lookup_fuzzy(phrase)
+                    if not fuzzy:
+                        continue
+                    field, value, distance = fuzzy
+                    original = question[window[0][2]:window[-1][3]]
+                    if field == "__ambiguo__":
+                        analysis.doubts.append(f"'{original}' podría ser {', '.join(value)}")
+                        continue
+                    confidence = 1 - distance / max(len(phrase), 1)
+                    analysis.confidence = min(analysis.confidence, confidence)
+                    if distance == 1 and len(phrase) <= MAX_SHORT_FUZZY_LENGTH:
+                        analysis.doubts.append(f"'{original}' → '{value}' es una corrección de una letra")
+                    if not FIELD_CUES.get(field, set()) & question_words:
+                        analysis.doubts.append(f"'{original}' → '{value}' ({field}) sin que la pregunta mencione el campo")
+                    analysis.corrections[original] = value
+                    replacements.append((window[0][2], window[-1][3], value))
+
+                for index in range(start, start + size):
+                    covered[index] = field
+                analysis.entities.setdefault(field, value)
+                found.append((start, field, value))
+
+        # Palabras que no se reconocieron: probable nombre mal escrito ("marca nik")
+        for index, (original, phrase, _, _) in enumerate(words):
+            if covered[index] is None and len(original) >= 3 and original.isalpha() \
+                    and phrase not in self.known_words:
+                analysis.doubts.append(f"'{original}' no se reconoce")
+
+        analysis.matches = [(field, value) for _, field, value in sorted(found)]
+        analysis.words = [(word[1], field) for word, field in zip(words, covered)]
+
+        corrected = question
+        for start, end, value in sorted(replacements, reverse=True):
+            corrected = corrected[:start] + value + corrected[end:]
+        analysis.corrected_question = corrected
+        return analysis
+
+
+# ============================================================================
+# MATCHER DIFUSO REUTILIZABLE (fuzzy_match_value)
+# ============================================================================
+# Mismo criterio que difflib.get_close_matches (ratio de SequenceMatcher >= umbral),
+# pero los valores se normalizan una sola vez y los candidatos salen de un
+# índice de trigramas: solo se calcula el ratio de los valores que comparten
+# más trigramas con la entrada, no de todo el vocabulario.
+
+# Candidatos (por trigramas compartidos) a los que se calcula el ratio
+FUZZY_MAX_CANDIDATES = 64
+# Resultados recordados por matcher
+FUZZY_SCORE_CACHE_SIZE = 4096
+# Matchers recordados (uno por lista de valores)
+FUZZY_MATCHER_CACHE_SIZE = 32
+
+
+def _padded_trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyMatcher:
+    """Índice de un vocabulario para buscar el valor más parecido a una entrada."""
+
+    def __init__(self, values):
+        self.values = list(values)
+        self.normalized = [str(v).strip().upper() for v in self.values]
+        # Primera aparición de cada forma normalizada (como list.index)
+        self.positions = {}
+        for position, key in enumerate(self.normalized):
+            self.positions.setdefault(key, position)
+        self.trigram_ids = {}
+        for key, position in self.positions.items():
+            for trigram in _padded_trigrams(key):
+                self.trigram_ids.setdefault(trigram, []).append(position)
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def match(self, input_value, threshold=0.6):
+        """
+        Returns:
+            tuple: (valor original, similitud) o (None, 0.0) si nada supera el umbral
+        """
+        query = str(input_value).strip().upper()
+        cache_key = (query, threshold)
+        with self._lock:
+            if cache_key in self._scores:
+                self._scores.move_to_end(cache_key)
+                return self._scores[cache_key]
+
+        result = self._match(query, threshold)
+        with self._lock:
+            self._scores[cache_key] = result
+            if len(self._scores) > FUZZY_SCORE_CACHE_SIZE:
+                self._scores.popitem(last=False)
+        return result
+
+    def _match(self, query, threshold):
+        # Match exacto (caso insensitive)
+        if query in self.positions:
+            return self.values[self.positions[query]], 1.0
+
+        shared = {}
+        for trigram in _padded_trigrams(query):
+            for position in self.trigram_ids.get(trigram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:FUZZY_MAX_CANDIDATES]
+
+        best_position, best_ratio = None, 0.0
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        for position in candidates:
+            matcher.set_seq1(self.normalized[position])
+            # Cotas baratas antes del ratio exacto, como get_close_matches
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= threshold and ratio > best_ratio:
+                best_position, best_ratio = position, ratio
+
+        if best_position is None:
+            return None, 0.0
+        return self.values[best_position], best_ratio
+
+
+_fuzzy_matchers = OrderedDict()
+_fuzzy_matchers_lock = threading.Lock()
+
+
+def fuzzy_matcher_for(values):
+    """
+    FuzzyMatcher de una lista de valores, construido una vez por lista.
+    La clave es la identidad de la lista (las de get_unique_values viven en su
+    caché); se guarda la lista junto al matcher para que su id no se reutilice.
+    """
+    key = (id(values), len(values))
+    with _fuzzy_matchers_lock:
+        entry = _fuzzy_matchers.get(key)
+        if entry is not None and entry[0] is values:
+            _fuzzy_matchers.move_to_end(key)
+            return entry[1]
+
+    matcher = FuzzyMatcher(values)
+    with _fuzzy_matchers_lock:
+        _fuzzy_matchers[key] = (values, matcher)
+        if len(_fuzzy_matchers) > FUZZY_MATCHER_CACHE_SIZE:
+            _fuzzy_matchers.popitem(last=False)
+    return matcher
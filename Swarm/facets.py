@@ -0,0 +1,172 @@
+from db import connect_to_my_db
+
+# ============================================================================
+# CONTEOS POR FACETA
+# ============================================================================
+# apdobloctrazface guarda cuántas prendas vigentes hay por cada combinación de
+# cliente, género, edad, tipo de prenda, tejido y talla. La mantiene la ingesta
+# (restando la combinación de la versión anterior y sumando la nueva), así que
+# los conteos del panel de filtros no recorren apdobloctrazactu.
+
+# Clave de FilterState (frontend) -> columna
+FACET_DIMENSIONS = {
+    "client": "TDESCCLIE",
+    "gender": "TTIPOGENE",
+    "age": "TTIPOEDAD",
+    "garmentType": "TTIPOPREN",
+    "fabric": "TTIPOTEJI",
+    "size": "TCODITALL",
+}
+FACET_COLUMNS = list(FACET_DIMENSIONS.values())
+
+FACETS_DDL = """
+CREATE TABLE IF NOT EXISTS apdobloctrazface (
+    TDESCCLIE VARCHAR(150) NOT NULL DEFAULT '',
+    TTIPOGENE VARCHAR(30) NOT NULL DEFAULT '',
+    TTIPOEDAD VARCHAR(30) NOT NULL DEFAULT '',
+    TTIPOPREN VARCHAR(100) NOT NULL DEFAULT '',
+    TTIPOTEJI VARCHAR(100) NOT NULL DEFAULT '',
+    TCODITALL VARCHAR(20) NOT NULL DEFAULT '',
+    TCANTPREN INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (TDESCCLIE, TTIPOGENE, TTIPOEDAD, TTIPOPREN, TTIPOTEJI, TCODITALL)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+"""
+
+# Los NULL se guardan como '' porque forman parte de la clave primaria
+_FACET_SELECT = ", ".join(f"COALESCE({column}, '')" for column in FACET_COLUMNS)
+
+
+def get_facet_key(cursor, tickbarr):
+    """
+    Combinación de facetas de la versión vigente de un tickbarr.
+
+    Returns:
+        tuple: Valores en el orden de FACET_COLUMNS, o None si el tickbarr no existe
+    """
+    cursor.execute(
+        f"SELECT {_FACET_SELECT} FROM apdobloctrazactu WHERE TTICKBARR = %s FOR UPDATE",
+        (tickbarr,)
+    )
+    row = cursor.fetchone()
+    return tuple(row) if row else None
+
+
+def apply_facet_change(cursor, previous_key, current_key):
+    """
+    Actualiza los conteos cuando la versión vigente de una prenda cambia de
+    combinación. Se ejecuta en la transacción de la ingesta.
+
+    Args:
+        cursor: Cursor de la transacción abierta
+        previous_key: Combinación anterior (None si la prenda es nueva)
+        current_key: Combinación nueva
+    """
+    if previous_key == current_key:
+        return
+
+    where_sql = " AND ".join(f"{column} = %s" for column in FACET_COLUMNS)
+    if previous_key is not None:
+        cursor.execute(
+            f"UPDATE apdobloctrazface SET TCANTPREN = TCANTPREN - 1 WHERE {where_sql}",
+            previous_key
+        )
+    if current_key is not None:
+        cursor.execute(
+            f"""
+            INSERT INTO apdobloctrazface ({", ".join(FACET_COLUMNS)}, TCANTPREN)
+            VALUES ({", ".join(["%s"] * len(FACET_COLUMNS))}, 1)
+            ON DUPLICATE KEY UPDATE TCANTPREN = TCANTPREN + 1
+            """,
+            current_key
+        )
+
+
+def rebuild_facets() -> bool:
+    """Recalcula apdobloctrazface desde cero a partir de apdobloctrazactu."""
+    conn = connect_to_my_db()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(FACETS_DDL)
+            cursor.execute("DELETE FROM apdobloctrazface")
+            cursor.execute(
+                f"""
+                INSERT INTO apdobloctrazface ({", ".join(FACET_COLUMNS)}, TCANTPREN)
+                SELECT {_FACET_SELECT}, COUNT(*)
+                FROM apdobloctrazactu
+                GROUP BY {_FACET_SELECT}
+                """
+            )
+        conn.commit()
+        print("✓ Conteos por faceta recalculados")
+        return True
+    except Exception as e:
+        print(f"Error en rebuild_facets: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def get_facet_counts(filters=None, limit=200):
+    """
+    Cuenta prendas por cada faceta bajo la selección actual. Para cada faceta
+    se aplican los filtros de las demás, así el usuario ve a qué valores puede
+    cambiar sin quitar su selección.
+
+    Args:
+        filters: Dict {faceta: valor} con claves de FACET_DIMENSIONS
+        limit: Máximo de valores por faceta
+
+    Returns:
+        dict: {"total": int, "facets": {faceta: [{value, count}]}}
+    """
+    filters = {k: v for k, v in (filters or {}).items() if k in FACET_DIMENSIONS and v}
+
+    def where_for(excluded):
+        clauses, params = [], []
+        for dimension, value in filters.items():
+            if dimension != excluded:
+                clauses.append(f"{FACET_DIMENSIONS[dimension]} = %s")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    # Una sola consulta: un GROUP BY por faceta unidos con UNION ALL, más el total
+    parts, params = [], []
+    for dimension, column in FACET_DIMENSIONS.items():
+        where_sql, where_params = where_for(dimension)
+        parts.append(
+            f"SELECT %s AS faceta, {column} AS valor, SUM(TCANTPREN) AS cantidad "
+            f"FROM apdobloctrazface{where_sql} GROUP BY {column} HAVING cantidad > 0"
+        )
+        params.extend([dimension] + where_params)
+    where_sql, where_params = where_for(None)
+    parts.append(f"SELECT '' AS faceta, '' AS valor, COALESCE(SUM(TCANTPREN), 0) AS cantidad FROM apdobloctrazface{where_sql}")
+    params.extend(where_params)
+
+    conn = connect_to_my_db()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(" UNION ALL ".join(f"({part})" for part in parts), tuple(params))
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    result = {"total": 0, "facets": {dimension: [] for dimension in FACET_DIMENSIONS}}
+    for dimension, value, count in rows:
+        if dimension == "":
+            result["total"] = int(count)
+        elif value != "":
+            result["facets"][dimension].append({"value": value, "count": int(count)})
+
+    for dimension in result["facets"]:
+        result["facets"][dimension].sort(key=lambda item: -item["count"])
+        result["facets"][dimension] = result["facets"][dimension][:limit]
+    return result
+
+
+if __name__ == "__main__":
+    rebuild_facets()
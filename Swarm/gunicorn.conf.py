@@ -0,0 +1,44 @@
+import os
+
+# ============================================================================
+# CONFIGURACIÓN DE GUNICORN PARA PRODUCCIÓN
+# ============================================================================
+# Uso (desde la carpeta Swarm):
+#   gunicorn -c gunicorn.conf.py backend:app
+#
+# Workers gthread: cada proceso atiende GUNICORN_THREADS peticiones a la vez.
+# Las llamadas al chatbot y a Swarm pasan la mayor parte del tiempo esperando
+# red (LLM, gateway, MariaDB), así que los hilos rinden bien pese al GIL.
+# Los límites por grupo de endpoints están en bulkhead.py.
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# Los jobs de /chat/jobs se guardan en memoria del worker: con más de un
+# worker, el balanceador debe enviar cada cliente siempre al mismo
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# Una pregunta al chatbot puede tomar hasta un par de minutos
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+# Al apagar o recargar, las peticiones en curso tienen este margen para terminar
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "90"))
+keepalive = 5
+
+# Reciclar workers libera memoria de las cachés en proceso, pero también borra
+# los jobs de /chat/jobs (ChatJobStore vive en memoria) y los clientes que aún
+# consultan su estado reciben 404. Por eso viene desactivado (0) mientras los
+# jobs no se guarden fuera del worker
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def worker_int(worker):
+    worker.log.info("Worker %s interrumpido, terminando peticiones en curso", worker.pid)
+
+
+def worker_exit(server, worker):
+    server.log.info("Worker %s detenido", worker.pid)
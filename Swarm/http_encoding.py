@@ -0,0 +1,157 @@
+import os
+import json
+import gzip
+from datetime import date
+from decimal import Decimal
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ============================================================================
+# SERIALIZACIÓN JSON Y COMPRESIÓN DE RESPUESTAS
+# ============================================================================
+# - El JSON de la API se genera con orjson si está instalado (JSON_ENCODER=json
+#   fuerza el encoder estándar). Ambos escriben las fechas en ISO 8601
+#   (2024-01-31T08:15:00), así que las consultas pueden devolver datetime sin
+#   formatearlas a mano; en orjson eso ocurre en código nativo.
+# - Las respuestas se comprimen con brotli o gzip según Accept-Encoding. No se
+#   tocan las respuestas en streaming (NDJSON, SSE, documentos de Swarm en
+#   curso), las que ya traen Content-Encoding ni las muy pequeñas.
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson" if orjson else "json")
+
+# Respuestas más pequeñas no compensan el costo de comprimir
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Calidad 5 da casi la razón de gzip -9 a una fracción del tiempo
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "application/javascript",
+}
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def json_default(value):
+    """Tipos que ninguno de los dos encoders serializa por sí solo."""
+    # datetime es subclase de date: ambos en ISO 8601, igual que orjson
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    # Escalares de numpy/pandas con el encoder estándar
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
+def dumps_bytes(value, encoder=None) -> bytes:
+    """
+    Serializa a JSON compacto en UTF-8.
+
+    Args:
+        value: Objeto a serializar
+        encoder: "orjson" o "json" (por defecto JSON_ENCODER)
+
+    Returns:
+        bytes: JSON codificado
+    """
+    encoder = encoder or JSON_ENCODER
+    if encoder == "orjson" and orjson is not None:
+        return orjson.dumps(value, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    """Comprime data con 'br' o 'gzip'."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def available_encodings() -> list:
+    """Codificaciones soportadas, en orden de preferencia del servidor."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask que usa dumps_bytes para jsonify."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if JSON_ENCODER == "orjson" and orjson is not None:
+            option = ORJSON_OPTIONS
+            if kwargs.get("indent"):
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=json_default, option=option).decode("utf-8")
+        kwargs.setdefault("default", json_default)
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if JSON_ENCODER == "orjson" and orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Se arma el cuerpo en bytes directamente, sin pasar por str
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.app.debug:
+            return super().response(obj)
+        return self.app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def compress_response(response):
+    """Hook after_request: comprime la respuesta si el cliente lo acepta."""
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    compressed = compress_bytes(data, encoding)
+    if len(compressed) >= len(data):
+        return response
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # El cuerpo comprimido no es idéntico byte a byte: el ETag pasa a ser débil
+    # (If-None-Match se compara siempre en forma débil)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Instala el proveedor JSON y la compresión en la aplicación."""
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+    print(f"[INFO] JSON: {JSON_ENCODER} | compresión: {', '.join(available_encodings())}")
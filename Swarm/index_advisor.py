@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter
+
+import pymysql
+
+from db import (
+    connect_to_my_db,
+    NEXT_CONVERSATION_GROUP_SQL,
+    CURRENT_CONVERSATION_GROUP_SQL,
+    CONVERSATION_HISTORY_SQL,
+    USER_CONVERSATIONS_SQL
+)
+from latest_versions import (
+    LATEST_HASH_SQL,
+    FILTER_DATA_COLUMNS,
+    latest_hashes_query,
+    filter_data_where,
+    filter_data_query
+)
+from saveHashInDb import TICKBARR_VERSIONS_SQL
+
+# Mismo registro que escribe chatbot.execute_query
+QUERY_LOG_PATH = os.getenv(
+    "QUERY_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "query_bot_sql.jsonl")
+)
+
+# ============================================================================
+# ASESOR DE ÍNDICES
+# ============================================================================
+# Ejecuta EXPLAIN sobre las consultas de la API (backend.py, db.py) y sobre las
+# queries reales generadas por query_bot (registradas por execute_query), y
+# marca las que recorren la tabla completa o necesitan filesort/temporales.
+# Los índices se crean con migrations.py; este script solo diagnostica.
+
+# Parámetros de ejemplo para las consultas de la API
+EXAMPLE_TICKBARR = "000000000000"
+EXAMPLE_CODE = "0"
+EXAMPLE_CURSOR = ("2000-01-01 00:00:00", EXAMPLE_TICKBARR)
+# Filas por página de ejemplo (backend.FILTER_PAGE_SIZE por defecto + 1)
+EXAMPLE_PAGE_LIMIT = 501
+
+
+def api_statements():
+    """
+    Consultas de la API armadas con las mismas constantes y funciones que
+    ejecutan backend.py, db.py y saveHashInDb.py, con parámetros de ejemplo.
+
+    Returns:
+        list: Tuplas (etiqueta, sql, params)
+    """
+    statements = [
+        ("backend.get_hash", LATEST_HASH_SQL, (EXAMPLE_TICKBARR,)),
+        ("backend.get_latest_hashes (numecaja)", *latest_hashes_query(numecaja=EXAMPLE_CODE)),
+        ("backend.get_latest_hashes (tickbarrs)", *latest_hashes_query(tickbarrs=[EXAMPLE_TICKBARR] * 3)),
+    ]
+    for key in FILTER_DATA_COLUMNS:
+        where_clauses, params = filter_data_where({key: EXAMPLE_CODE})
+        statements.append((
+            f"backend.filter_data ({key})",
+            *filter_data_query(where_clauses, params, limit=EXAMPLE_PAGE_LIMIT)
+        ))
+        statements.append((
+            f"backend.filter_data ({key}, página siguiente)",
+            *filter_data_query(where_clauses, params, after=EXAMPLE_CURSOR, limit=EXAMPLE_PAGE_LIMIT)
+        ))
+    statements.extend([
+        ("saveHashInDb.get_version_from_same_tickbarr", TICKBARR_VERSIONS_SQL, (EXAMPLE_TICKBARR,)),
+        ("db.get_next_conversation_group", NEXT_CONVERSATION_GROUP_SQL, (EXAMPLE_CODE,)),
+        ("db.get_current_conversation_group", CURRENT_CONVERSATION_GROUP_SQL, (EXAMPLE_CODE,)),
+        ("db.get_conversation_history", CONVERSATION_HISTORY_SQL, (EXAMPLE_CODE, 1)),
+        ("db.get_all_conversations_for_user", USER_CONVERSATIONS_SQL, (EXAMPLE_CODE,)),
+    ])
+    return statements
+
+# Tablas con menos filas estimadas que esto no se reportan aunque no usen índice
+MIN_ROWS_TO_FLAG = 1000
+
+
+def normalize_sql(query):
+    """Reemplaza literales por ? para agrupar queries con la misma forma."""
+    shape = re.sub(r"'(?:[^'\\]|\\.)*'", "?", query)
+    shape = re.sub(r"\b\d+\b", "?", shape)
+    return re.sub(r"\s+", " ", shape).strip()
+
+
+def load_logged_queries(log_path=QUERY_LOG_PATH, limit=50):
+    """
+    Lee el registro de query_bot y devuelve las formas de consulta más frecuentes.
+
+    Returns:
+        list: Tuplas (etiqueta, sql, params) listas para explain_statement
+    """
+    if not os.path.exists(log_path):
+        print(f"[WARN] No existe el registro de queries: {log_path}")
+        return []
+
+    shapes = Counter()
+    examples = {}
+    with open(log_path, encoding="utf-8") as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+                query = record["sql"]
+            except (ValueError, KeyError):
+                continue
+            if not query.lstrip().upper().startswith("SELECT"):
+                continue
+            shape = normalize_sql(query)
+            shapes[shape] += 1
+            # Las plantillas de query_templates.py se registran con sus parámetros
+            examples.setdefault(shape, (query, tuple(record.get("params") or ()) or None))
+
+    return [
+        (f"query_bot (x{count})", *examples[shape])
+        for shape, count in shapes.most_common(limit)
+    ]
+
+
+def explain_statement(cursor, query, params=None):
+    """
+    Ejecuta EXPLAIN y devuelve los problemas encontrados en el plan.
+
+    Returns:
+        list: Descripciones de los accesos problemáticos (vacía si el plan es bueno)
+    """
+    cursor.execute("EXPLAIN " + query, params)
+    problems = []
+    for row in cursor.fetchall():
+        table = row.get("table")
+        rows = row.get("rows") or 0
+        extra = row.get("Extra") or ""
+        if row.get("type") == "ALL" and rows >= MIN_ROWS_TO_FLAG:
+            problems.append(f"recorrido completo de {table} (~{rows} filas)")
+        elif row.get("type") == "index" and rows >= MIN_ROWS_TO_FLAG:
+            problems.append(f"recorrido completo del índice {row.get('key')} de {table} (~{rows} filas)")
+        if "Using filesort" in extra and rows >= MIN_ROWS_TO_FLAG:
+            problems.append(f"filesort sobre {table} (~{rows} filas)")
+        if "Using temporary" in extra and rows >= MIN_ROWS_TO_FLAG:
+            problems.append(f"tabla temporal para {table} (~{rows} filas)")
+    return problems
+
+
+def run_advisor(log_path=QUERY_LOG_PATH, log_limit=50, include_api=True):
+    """
+    Revisa las consultas de la API y del registro de query_bot.
+
+    Returns:
+        dict: {etiqueta: [problemas]} solo para las consultas con problemas
+    """
+    statements = api_statements() if include_api else []
+    statements.extend(load_logged_queries(log_path, log_limit))
+
+    conn = connect_to_my_db()
+    if not conn:
+        return {}
+
+    flagged = {}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            for label, query, params in statements:
+                try:
+                    problems = explain_statement(cursor, query, params)
+                except Exception as e:
+                    print(f"[WARN] No se pudo analizar {label}: {e}")
+                    continue
+                if problems:
+                    flagged[label] = problems
+                    print(f"✗ {label}")
+                    print(f"    {normalize_sql(query)[:200]}")
+                    for problem in problems:
+                        print(f"    - {problem}")
+                else:
+                    print(f"✓ {label}")
+    finally:
+        conn.close()
+
+    print(f"\n{len(flagged)} de {len(statements)} consultas necesitan revisión")
+    return flagged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisa con EXPLAIN las consultas de la API y del chatbot")
+    parser.add_argument("--log", default=QUERY_LOG_PATH, help="Registro JSONL de queries de query_bot")
+    parser.add_argument("--limit", type=int, default=50, help="Máximo de formas de query a revisar del registro")
+    parser.add_argument("--solo-registro", action="store_true", help="No revisar las consultas de la API")
+    args = parser.parse_args()
+
+    flagged = run_advisor(args.log, args.limit, include_api=not args.solo_registro)
+    raise SystemExit(1 if flagged else 0)
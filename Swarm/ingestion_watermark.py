@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+
+from db import connect_to_my_db
+
+# ============================================================================
+# MARCA DE INGESTA
+# ============================================================================
+# apdobloctrazmarc guarda un contador por marca. La ingesta lo incrementa en la
+# misma transacción en la que guarda una versión nueva en apdobloctrazhash, así
+# que cualquier proceso (la API, otro worker de gunicorn) sabe si hubo cambios
+# comparando el número con el que tenía al cargar sus cachés.
+
+WATERMARK_DDL = """
+CREATE TABLE IF NOT EXISTS apdobloctrazmarc (
+    TNOMBMARC VARCHAR(40) NOT NULL,
+    TNUMEMARC BIGINT NOT NULL DEFAULT 0,
+    TFECHACTU DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (TNOMBMARC)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+"""
+
+INGESTION_WATERMARK = "ingesta"
+
+# Cada cuánto se vuelve a leer la marca desde MariaDB (los lectores comparten la lectura)
+WATERMARK_CHECK_SECONDS = float(os.getenv("WATERMARK_CHECK_SECONDS", "15"))
+
+_cached = {}
+_cached_lock = threading.Lock()
+
+
+def bump_watermark(cursor, name=INGESTION_WATERMARK):
+    """Incrementa la marca dentro de la transacción abierta del cursor."""
+    cursor.execute(
+        "INSERT INTO apdobloctrazmarc (TNOMBMARC, TNUMEMARC) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE TNUMEMARC = TNUMEMARC + 1",
+        (name,)
+    )
+
+
+def read_watermark(name=INGESTION_WATERMARK):
+    """
+    Lee la marca desde MariaDB.
+
+    Returns:
+        int: Valor actual (0 si la marca no existe) o None si no hay conexión
+    """
+    conn = connect_to_my_db()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT TNUMEMARC FROM apdobloctrazmarc WHERE TNOMBMARC = %s", (name,))
+            row = cursor.fetchone()
+            return int(row[0]) if row else 0
+    except Exception as e:
+        print(f"Error en read_watermark: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def current_watermark(name=INGESTION_WATERMARK, force=False):
+    """
+    Marca vigente, leída de MariaDB como máximo cada WATERMARK_CHECK_SECONDS.
+
+    Returns:
+        int o None si nunca se pudo leer
+    """
+    now = time.time()
+    with _cached_lock:
+        value, checked_at = _cached.get(name, (None, 0.0))
+        if not force and now - checked_at < WATERMARK_CHECK_SECONDS:
+            return value
+        # Se marca la lectura antes de hacerla: las demás peticiones usan el valor anterior
+        _cached[name] = (value, now)
+
+    fresh = read_watermark(name)
+    if fresh is None:
+        return value
+    with _cached_lock:
+        _cached[name] = (fresh, time.time())
+    return fresh
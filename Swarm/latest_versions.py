@@ -0,0 +1,237 @@
+from db import connect_to_my_db
+
+# ============================================================================
+# VERSIÓN VIGENTE DE CADA PRENDA
+# ============================================================================
+# apdobloctrazhash guarda todas las versiones de cada tickbarr. Esta tabla
+# mantiene solo la más reciente (una fila por TTICKBARR), para que buscar el
+# hash de una prenda sea un acceso por clave primaria y los conteos no
+# cuenten dos veces las prendas reingresadas.
+
+LATEST_VERSIONS_TABLE = "apdobloctrazactu"
+
+LATEST_VERSIONS_COLUMNS = (
+    "TTICKBARR, TNUMEVERS, TNUMECAJA, TESTICLIE, TETIQCLIE, TCODITALL, TTICKHASH, "
+    "TCODICLIE, TDESCCLIE, TTIPOPREN, TTIPOEDAD, TTIPOGENE, TLUGADEST, TTIPOTEJI, TFECHGUAR"
+)
+
+
+def latest_versions_ddl(table=LATEST_VERSIONS_TABLE):
+    """
+    CREATE de la tabla de versiones vigentes. Las columnas se copian de
+    apdobloctrazhash (CREATE ... AS SELECT sin filas), así tienen exactamente
+    el mismo tipo y largo: un valor que entra en el historial siempre entra aquí.
+    """
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (PRIMARY KEY (TTICKBARR))
+    AS SELECT {LATEST_VERSIONS_COLUMNS} FROM apdobloctrazhash WHERE 1 = 0
+    """
+
+
+def _upsert_updates(table):
+    """
+    Solo se reemplaza la fila si la versión que llega no es más antigua. Las
+    columnas destino van calificadas para no ser ambiguas en INSERT ... SELECT
+    """
+    return ", ".join(
+        f"{table}.{column} = IF(VALUES(TNUMEVERS) >= {table}.TNUMEVERS, "
+        f"VALUES({column}), {table}.{column})"
+        for column in [c.strip() for c in LATEST_VERSIONS_COLUMNS.split(",")]
+        if column not in ("TTICKBARR", "TNUMEVERS")
+    ) + f", {table}.TNUMEVERS = GREATEST({table}.TNUMEVERS, VALUES(TNUMEVERS))"
+
+
+def latest_versions_backfill(table=LATEST_VERSIONS_TABLE):
+    """
+    Copia la versión más reciente de cada tickbarr del historial. Es idempotente:
+    la usan las migraciones y backfill_latest_versions
+    """
+    return f"""
+    INSERT INTO {table} ({LATEST_VERSIONS_COLUMNS})
+    SELECT {", ".join("h." + c.strip() for c in LATEST_VERSIONS_COLUMNS.split(","))}
+    FROM apdobloctrazhash h
+    JOIN (
+        SELECT TTICKBARR, MAX(TNUMEVERS) AS TNUMEVERS
+        FROM apdobloctrazhash
+        GROUP BY TTICKBARR
+    ) ult ON ult.TTICKBARR = h.TTICKBARR AND ult.TNUMEVERS = h.TNUMEVERS
+    ON DUPLICATE KEY UPDATE {_upsert_updates(table)}
+    """
+
+
+LATEST_VERSIONS_DDL = latest_versions_ddl()
+LATEST_VERSIONS_BACKFILL = latest_versions_backfill()
+_UPSERT_UPDATES = _upsert_updates(LATEST_VERSIONS_TABLE)
+
+
+def ensure_latest_versions(conn=None) -> bool:
+    """Crea la tabla apdobloctrazactu si no existe."""
+    own_conn = conn is None
+    conn = conn or connect_to_my_db()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(LATEST_VERSIONS_DDL)
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error en ensure_latest_versions: {e}")
+        return False
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def upsert_latest_version(cursor, tickbarr, version):
+    """
+    Copia a apdobloctrazactu una versión recién insertada en apdobloctrazhash.
+    Se ejecuta con el mismo cursor del INSERT para quedar en la misma transacción.
+
+    Args:
+        cursor: Cursor de la transacción abierta
+        tickbarr: Tickbarr de la prenda
+        version: Versión insertada
+    """
+    cursor.execute(
+        f"""
+        INSERT INTO apdobloctrazactu ({LATEST_VERSIONS_COLUMNS})
+        SELECT {LATEST_VERSIONS_COLUMNS}
+        FROM apdobloctrazhash
+        WHERE TTICKBARR = %s AND TNUMEVERS = %s
+        ON DUPLICATE KEY UPDATE {_UPSERT_UPDATES}
+        """,
+        (tickbarr, version)
+    )
+
+
+def backfill_latest_versions() -> int:
+    """
+    Reconstruye apdobloctrazactu a partir de todo el historial de apdobloctrazhash.
+
+    Returns:
+        int: Número de filas insertadas o actualizadas
+    """
+    conn = connect_to_my_db()
+    if not conn:
+        return 0
+    try:
+        ensure_latest_versions(conn)
+        with conn.cursor() as cursor:
+            affected = cursor.execute(LATEST_VERSIONS_BACKFILL)
+        conn.commit()
+        print(f"✓ Versiones vigentes sincronizadas: {affected} filas afectadas")
+        return affected
+    except Exception as e:
+        print(f"Error en backfill_latest_versions: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+
+# ============================================================================
+# CONSULTAS DE LA API SOBRE LA VERSIÓN VIGENTE
+# ============================================================================
+# backend.py las ejecuta e index_advisor.py les hace EXPLAIN: al estar en un
+# solo lugar, el asesor revisa exactamente las consultas que corre la API.
+
+# /get_hash: acceso por clave primaria
+LATEST_HASH_SQL = "SELECT TTICKHASH FROM apdobloctrazactu WHERE TTICKBARR = %s"
+
+# Filtros de /filter_data -> columna de apdobloctrazactu
+FILTER_DATA_COLUMNS = {
+    "numecaja": "TNUMECAJA",
+    "esticlie": "TESTICLIE",
+    "etiqclie": "TETIQCLIE",
+    "coditall": "TCODITALL",
+}
+
+
+def latest_hashes_query(tickbarrs=None, numecaja=None):
+    """
+    SELECT de /resolve_tickbarrs: hash vigente de varios tickbarrs o de una caja.
+
+    Returns:
+        tuple: (query, params)
+    """
+    if tickbarrs:
+        placeholders = ", ".join(["%s"] * len(tickbarrs))
+        where_sql = f"TTICKBARR IN ({placeholders})"
+        params = tuple(tickbarrs)
+    else:
+        where_sql = "TNUMECAJA = %s"
+        params = (numecaja,)
+
+    query = f"""
+    SELECT TTICKBARR, TNUMEVERS, TTICKHASH
+    FROM apdobloctrazactu
+    WHERE {where_sql}
+    ORDER BY TTICKBARR
+    """
+    return query, params
+
+
+def filter_data_where(filters):
+    """
+    Condiciones de /filter_data para los filtros con valor.
+
+    Returns:
+        tuple: (lista de condiciones, lista de parámetros)
+    """
+    where_clauses = []
+    params = []
+    for key, column in FILTER_DATA_COLUMNS.items():
+        value = filters.get(key)
+        if value:
+            where_clauses.append(f"h.{column} = %s")
+            params.append(value)
+    return where_clauses, params
+
+
+def filter_data_query(where_clauses, params, after=None, limit=None):
+    """
+    Construye el SELECT de /filter_data ordenado por (TFECHGUAR, TTICKBARR) descendente.
+    La fecha se formatea en MariaDB para no recorrer las filas en Python.
+    En orden descendente MariaDB deja las filas sin fecha (NULL) al final, así
+    que el cursor las trata explícitamente en lugar de usar COALESCE (que
+    impediría usar los índices (filtro, TFECHGUAR, TTICKBARR)).
+    """
+    where_clauses = list(where_clauses)
+    params = list(params)
+
+    if after:
+        fecha, tickbarr = after
+        if fecha is None:
+            # El cursor ya está en el tramo sin fecha: solo quedan esas filas
+            where_clauses.append("(h.TFECHGUAR IS NULL AND h.TTICKBARR < %s)")
+            params.append(tickbarr)
+        else:
+            where_clauses.append(
+                "(h.TFECHGUAR < %s OR (h.TFECHGUAR = %s AND h.TTICKBARR < %s) OR h.TFECHGUAR IS NULL)"
+            )
+            params.extend([fecha, fecha, tickbarr])
+
+    query = f"""
+    SELECT
+        h.TTICKBARR,
+        h.TNUMEVERS,
+        h.TNUMECAJA,
+        h.TESTICLIE,
+        h.TETIQCLIE,
+        h.TCODITALL,
+        h.TTICKHASH,
+        DATE_FORMAT(h.TFECHGUAR, '%%Y-%%m-%%d %%H:%%i:%%s') AS TFECHGUAR
+    FROM apdobloctrazactu h
+    WHERE {" AND ".join(where_clauses)}
+    ORDER BY h.TFECHGUAR DESC, h.TTICKBARR DESC
+    """
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    return query, tuple(params)
+
+
+if __name__ == "__main__":
+    backfill_latest_versions()
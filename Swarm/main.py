@@ -5,6 +5,7 @@ import datetime
 from uploadFile import upload_to_swarm
 from oracle_tickbarrs import get_tickbarrs_yesterday
 from saveHashInDb import save_tickbarr_hash_to_db, save_failed_tickbarr
+from document_store import save_document_to_store
 
 
 def up_tickbarr_to_swarm(stamp):
@@ -24,8 +25,11 @@ def up_tickbarr_to_swarm(stamp):
         code_tall = row['TCODITALL']
 
         try:
-            data_columns, hash = upload_to_swarm(tickbarr, stamp)
-            save_tickbarr_hash_to_db(tickbarr, data_columns['caja'], code_esty_clie, code_etiq_clie, data_columns['talla'], hash, data_columns['cod_cliente'], data_columns['cliente'], data_columns['tipo_prenda'], data_columns['edad'], data_columns['genero'], data_columns['destino'], data_columns['tipo_tejido'])
+            data_columns, hash, json_data = upload_to_swarm(tickbarr, stamp)
+            version = save_tickbarr_hash_to_db(tickbarr, data_columns['caja'], code_esty_clie, code_etiq_clie, data_columns['talla'], hash, data_columns['cod_cliente'], data_columns['cliente'], data_columns['tipo_prenda'], data_columns['edad'], data_columns['genero'], data_columns['destino'], data_columns['tipo_tejido'])
+            # Copia consultable del documento; Swarm sigue siendo la fuente de verdad
+            if version and not save_document_to_store(tickbarr, version, hash, json_data):
+                print(f"[WARN] Tickbarr {tickbarr} subido pero no copiado al espejo local")
             print(f"✓ Tickbarr {tickbarr} procesado exitosamente")
         except Exception as e:
             # Si falla, guardar el error y continuar con el siguiente
@@ -0,0 +1,143 @@
+from db import connect_to_my_db
+from document_store import DOCUMENT_STORE_DDL
+from latest_versions import LATEST_VERSIONS_DDL, LATEST_VERSIONS_BACKFILL, latest_versions_ddl, latest_versions_backfill
+from facets import FACETS_DDL
+from ingestion_watermark import WATERMARK_DDL, INGESTION_WATERMARK
+
+# ============================================================================
+# MIGRACIONES DE ESQUEMA
+# ============================================================================
+# Cada migración tiene un número de versión y una lista de sentencias DDL
+# idempotentes. Las versiones aplicadas se registran en apdoblocmigrvers, así
+# que correr este módulo varias veces solo aplica las que falten. Nunca se
+# edita una migración ya publicada: los cambios van en una versión nueva.
+
+MIGRATIONS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS apdoblocmigrvers (
+    TNUMEVERS INT NOT NULL,
+    TDESCMIGR VARCHAR(200) NOT NULL,
+    TFECHAPLI DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (TNUMEVERS)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+"""
+
+# /filter_data y /resolve_tickbarrs: igualdad en el filtro + orden (TFECHGUAR, TTICKBARR);
+# consultas del chatbot: cliente + género/tipo de prenda y valores únicos
+LATEST_VERSIONS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_caja ON apdobloctrazactu (TNUMECAJA, TFECHGUAR, TTICKBARR)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_esti ON apdobloctrazactu (TESTICLIE, TFECHGUAR, TTICKBARR)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_etiq ON apdobloctrazactu (TETIQCLIE, TFECHGUAR, TTICKBARR)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_tall ON apdobloctrazactu (TCODITALL, TFECHGUAR, TTICKBARR)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_clie ON apdobloctrazactu (TDESCCLIE, TTIPOGENE, TTIPOPREN)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_gene ON apdobloctrazactu (TTIPOGENE, TTIPOEDAD)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_pren ON apdobloctrazactu (TTIPOPREN)",
+    "CREATE INDEX IF NOT EXISTS idx_trazactu_teji ON apdobloctrazactu (TTIPOTEJI)",
+]
+
+MIGRATIONS = [
+    (1, "Espejo de documentos de trazabilidad (apdobloctrazdocu)", [
+        DOCUMENT_STORE_DDL,
+    ]),
+    (2, "Versión vigente de cada prenda (apdobloctrazactu)", [
+        LATEST_VERSIONS_DDL,
+        # Copiar las prendas ya guardadas; la migración 6 cuenta facetas sobre esta tabla
+        LATEST_VERSIONS_BACKFILL,
+    ]),
+    (3, "Índices del historial apdobloctrazhash", [
+        # Cálculo de la siguiente versión y copia a apdobloctrazactu al guardar
+        "CREATE INDEX IF NOT EXISTS idx_trazhash_tick_vers ON apdobloctrazhash (TTICKBARR, TNUMEVERS)",
+    ]),
+    (4, "Índices de filtros y paginación de apdobloctrazactu", LATEST_VERSIONS_INDEXES),
+    (5, "Índices del historial del chatbot (apdoblochistbott)", [
+        # db.py filtra siempre por usuario y grupo, y ordena la conversación por fecha
+        "CREATE INDEX IF NOT EXISTS idx_histbott_usua_grup ON apdoblochistbott (tcodiusua, tgrupconv, tfechconv)",
+    ]),
+    (6, "Conteos por faceta (apdobloctrazface)", [
+        FACETS_DDL,
+        # Poblar la tabla con las prendas vigentes al momento de crearla
+        "INSERT IGNORE INTO apdobloctrazface "
+        "(TDESCCLIE, TTIPOGENE, TTIPOEDAD, TTIPOPREN, TTIPOTEJI, TCODITALL, TCANTPREN) "
+        "SELECT COALESCE(TDESCCLIE, ''), COALESCE(TTIPOGENE, ''), COALESCE(TTIPOEDAD, ''), "
+        "COALESCE(TTIPOPREN, ''), COALESCE(TTIPOTEJI, ''), COALESCE(TCODITALL, ''), COUNT(*) "
+        "FROM apdobloctrazactu "
+        "GROUP BY COALESCE(TDESCCLIE, ''), COALESCE(TTIPOGENE, ''), COALESCE(TTIPOEDAD, ''), "
+        "COALESCE(TTIPOPREN, ''), COALESCE(TTIPOTEJI, ''), COALESCE(TCODITALL, '')",
+    ]),
+    (7, "Marca de ingesta para invalidar cachés (apdobloctrazmarc)", [
+        WATERMARK_DDL,
+        f"INSERT IGNORE INTO apdobloctrazmarc (TNOMBMARC, TNUMEMARC) VALUES ('{INGESTION_WATERMARK}', 0)",
+    ]),
+    (8, "apdobloctrazactu con los mismos tipos de columna que apdobloctrazhash", [
+        # La versión 2 original usaba largos propios; un valor más largo hacía fallar
+        # la ingesta. Se reconstruye la tabla copiando los tipos del historial y se
+        # intercambia con la actual. Correr sin la ingesta en marcha
+        "DROP TABLE IF EXISTS apdobloctrazactu_nueva",
+        "DROP TABLE IF EXISTS apdobloctrazactu_vieja",
+        latest_versions_ddl("apdobloctrazactu_nueva"),
+        latest_versions_backfill("apdobloctrazactu_nueva"),
+        "RENAME TABLE apdobloctrazactu TO apdobloctrazactu_vieja, apdobloctrazactu_nueva TO apdobloctrazactu",
+        "DROP TABLE apdobloctrazactu_vieja",
+        *LATEST_VERSIONS_INDEXES,
+    ]),
+]
+
+
+def get_applied_versions(conn) -> set:
+    """Versiones de migración ya registradas en apdoblocmigrvers."""
+    with conn.cursor() as cursor:
+        cursor.execute(MIGRATIONS_TABLE_DDL)
+        cursor.execute("SELECT TNUMEVERS FROM apdoblocmigrvers")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migrations(target_version=None) -> list:
+    """
+    Aplica en orden las migraciones pendientes.
+
+    Args:
+        target_version: Última versión a aplicar (opcional, por defecto todas)
+
+    Returns:
+        list: Versiones aplicadas en esta ejecución
+    """
+    conn = connect_to_my_db()
+    if not conn:
+        return []
+
+    applied_now = []
+    try:
+        applied = get_applied_versions(conn)
+        for version, description, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            if target_version is not None and version > target_version:
+                break
+
+            print(f"→ Aplicando migración {version}: {description}")
+            # Las sentencias DDL hacen commit implícito en MariaDB; por eso
+            # cada una debe ser idempotente y la versión se registra al final
+            with conn.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO apdoblocmigrvers (TNUMEVERS, TDESCMIGR) VALUES (%s, %s)",
+                    (version, description)
+                )
+            conn.commit()
+            applied_now.append(version)
+
+        if applied_now:
+            print(f"✓ Migraciones aplicadas: {applied_now}")
+        else:
+            print("✓ El esquema ya está al día")
+        return applied_now
+    except Exception as e:
+        print(f"Error en apply_migrations: {e}")
+        conn.rollback()
+        return applied_now
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    apply_migrations()
@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+
+from tracing import span
+
+# ============================================================================
+# CONTEXTO DE UNA PREGUNTA EN EL PIPELINE DEL CHATBOT
+# ============================================================================
+# Guarda los resultados de cada paso (corrección, filtros, pregunta con
+# contexto) para que los pasos siguientes los reutilicen en vez de repetir
+# llamadas al LLM, y el tiempo que tomó cada etapa.
+
+
+class PipelineContext:
+    """Estado compartido por las etapas de una pregunta al chatbot."""
+
+    def __init__(self, question, request_id=None):
+        self.question = question
+        self.request_id = request_id
+        # PASO 1: corrección (None = todavía no se corrigió)
+        self.corrected_question = None
+        self.corrections = {}
+        # PASO 2-3: filtros extraídos de la pregunta y combinados con los del panel
+        self.extracted_filters = {}
+        self.filters = {}
+        # PASO 4: pregunta que recibe el orquestador (historial + filtros)
+        self.question_with_context = None
+        # Plan del orquestador si ya lo generó el paso understand
+        self.plan = None
+        # Duración de cada etapa en ms
+        self.timings = {}
+
+    @property
+    def corrected(self):
+        return self.corrected_question is not None
+
+    @contextmanager
+    def stage(self, name):
+        """Mide una etapa del pipeline (y la registra como span de la traza)."""
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def timings_summary(self):
+        return ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items())
@@ -0,0 +1,126 @@
+import re
+
+from entity_matching import normalize_text, fuzzy_matcher_for, STOPWORDS
+from tracing import set_span_attributes
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# ============================================================================
+# ARMADO DE PROMPTS CON PRESUPUESTO DE TOKENS
+# ============================================================================
+# Los prompts de sistema se arman en dos partes:
+# - Prefijo estático (instrucciones, reglas, ejemplos): idéntico en cada
+#   llamada, así DeepSeek y Gemini lo sirven desde su caché de prefijos.
+# - Parte variable (catálogos de valores de la DB, historial), siempre al final.
+# Los catálogos se recortan a los valores relacionados con la pregunta más los
+# más frecuentes, y se registra en la traza cuántos tokens se ahorraron frente
+# a enviar la lista como antes.
+
+# Caracteres por token aproximados en español (si tiktoken no está instalado)
+CHARS_PER_TOKEN = 3.5
+
+# Similitud mínima para considerar que un valor del catálogo se menciona en la pregunta
+CATALOG_MATCH_THRESHOLD = 0.75
+
+_WORD_PATTERN = re.compile(r"[0-9A-Za-zÀ-ÿ\-]+")
+
+
+def count_tokens(text):
+    """Tokens de un texto (exactos con tiktoken, estimados sin él)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def relevant_values(values, question):
+    """
+    Valores del catálogo que aparecen (o casi) en la pregunta, en orden de frecuencia.
+
+    Args:
+        values: Valores de la columna, del más al menos frecuente
+        question: Pregunta del usuario
+    """
+    if not values or not question:
+        return []
+    words = [normalize_text(word) for word in _WORD_PATTERN.findall(question)]
+    words = [word for word in words if word and word not in STOPWORDS]
+    # Palabras sueltas y pares de palabras ("TURTLE NECK")
+    phrases = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    matcher = fuzzy_matcher_for(values)
+    found = set()
+    for phrase in phrases:
+        value, _ = matcher.match(phrase, CATALOG_MATCH_THRESHOLD)
+        if value is not None:
+            found.add(value)
+    return [value for value in values if value in found]
+
+
+class PromptBuilder:
+    """Prompt de sistema: prefijo estático primero, catálogos y contexto variable después."""
+
+    def __init__(self, name):
+        self.name = name
+        self._static = []
+        self._dynamic = []
+        self.saved_tokens = 0
+
+    def static(self, text):
+        """Instrucciones que no cambian entre llamadas (prefijo cacheable)."""
+        self._static.append(text.strip("\n"))
+        return self
+
+    def dynamic(self, text):
+        """Texto que cambia en cada llamada."""
+        if text:
+            self._dynamic.append(text.strip("\n"))
+        return self
+
+    def catalog(self, label, values, question="", limit=20, previous_limit=None):
+        """
+        Agrega una lista de valores válidos recortada a la pregunta.
+
+        Args:
+            label: Título de la lista, ej "Clientes (client)"
+            values: Valores de la DB, del más al menos frecuente
+            question: Pregunta del usuario; sus valores van primero
+            limit: Valores máximos a enviar
+            previous_limit: Cuántos valores se enviaban antes (None = todos), para
+                            calcular el ahorro
+        """
+        values = values or []
+        if not values:
+            return self.dynamic(f"- {label}: No disponible")
+
+        mentioned = relevant_values(values, question)
+        kept = mentioned + [value for value in values if value not in mentioned][:max(limit - len(mentioned), 0)]
+        line = f"- {label}: {', '.join(kept)}"
+        if len(values) > len(kept):
+            line += f" (y {len(values) - len(kept)} más)"
+
+        previous = values[:previous_limit] if previous_limit else values
+        self.saved_tokens += max(count_tokens(", ".join(previous)) - count_tokens(", ".join(kept)), 0)
+        return self.dynamic(line)
+
+    def build(self):
+        """
+        Returns:
+            str: Prompt de sistema. También registra en el span en curso los tokens
+                 estimados del prompt y los ahorrados.
+        """
+        prompt = "\n\n".join(self._static)
+        if self._dynamic:
+            prompt += "\n\n" + "\n".join(self._dynamic)
+        prompt += "\n"
+        set_span_attributes(
+            prompt=self.name,
+            prompt_tokens_estimated=count_tokens(prompt),
+            prompt_tokens_saved=self.saved_tokens
+        )
+        return prompt
@@ -0,0 +1,291 @@
+import os
+from functools import lru_cache
+
+# ============================================================================
+# PLANTILLAS DE SQL PARA query_bot
+# ============================================================================
+# La mayoría de las instrucciones del orquestador tienen una de pocas formas:
+# contar prendas, contar agrupando por una columna, listar los valores
+# distintos de una columna o recuperar los hashes de las prendas filtradas.
+# Cuando la instrucción se reconoce completa (todas sus palabras son de la
+# plantilla o entidades del vocabulario de la DB), el SQL sale de una plantilla
+# con parámetros enlazados y no se llama al LLM. Cualquier palabra desconocida
+# ("más", "no", "máquina", un número suelto) deja la instrucción al LLM.
+
+USE_QUERY_TEMPLATES = os.getenv("USE_QUERY_TEMPLATES", "true").lower() in ("1", "true", "si", "yes")
+
+# Columnas que pueden aparecer en una plantilla (filtro, agrupación o DISTINCT)
+TEMPLATE_COLUMNS = {"TDESCCLIE", "TTIPOGENE", "TTIPOEDAD", "TCODITALL", "TTIPOPREN", "TTIPOTEJI", "TLUGADEST"}
+
+# Frases (palabras normalizadas) que nombran una columna
+DIMENSION_PHRASES = {
+    ("CLIENTE",): "TDESCCLIE", ("CLIENTES",): "TDESCCLIE",
+    ("GENERO",): "TTIPOGENE", ("GENEROS",): "TTIPOGENE",
+    ("EDAD",): "TTIPOEDAD", ("EDADES",): "TTIPOEDAD", ("GRUPO", "DE", "EDAD"): "TTIPOEDAD",
+    ("GRUPOS", "DE", "EDAD"): "TTIPOEDAD",
+    ("TALLA",): "TCODITALL", ("TALLAS",): "TCODITALL",
+    ("TIPO", "DE", "PRENDA"): "TTIPOPREN", ("TIPOS", "DE", "PRENDA"): "TTIPOPREN",
+    ("TIPO", "DE", "PRENDAS"): "TTIPOPREN", ("TIPOS", "DE", "PRENDAS"): "TTIPOPREN",
+    ("TEJIDO",): "TTIPOTEJI", ("TEJIDOS",): "TTIPOTEJI",
+    ("TIPO", "DE", "TEJIDO"): "TTIPOTEJI", ("TIPOS", "DE", "TEJIDO"): "TTIPOTEJI",
+    ("TIPOS", "DE", "TEJIDOS"): "TTIPOTEJI",
+    ("DESTINO",): "TLUGADEST", ("DESTINOS",): "TLUGADEST",
+    ("LUGAR", "DE", "DESTINO"): "TLUGADEST", ("LUGARES", "DE", "DESTINO"): "TLUGADEST",
+}
+_MAX_PHRASE_WORDS = max(len(phrase) for phrase in DIMENSION_PHRASES)
+
+COUNT_WORDS = {"CUANTAS", "CUANTOS", "CUANTO", "CANTIDAD", "CONTAR", "CUENTA", "CUENTE", "NUMERO", "TOTAL"}
+HASH_WORDS = {"HASH", "HASHES", "TICKBAR", "TICKBARS", "TICKBARR", "TICKBARRS"}
+
+# Palabras que no cambian la forma de la consulta
+NEUTRAL_WORDS = {
+    "A", "AL", "CON", "DE", "DEL", "EL", "EN", "ES", "ESTA", "ESTAN", "HAY", "LA", "LAS", "LO", "LOS",
+    "PARA", "QUE", "SE", "SON", "SU", "SUS", "UN", "UNA", "UNOS", "UNAS", "Y", "O", "CUAL", "CUALES",
+    "TIENE", "TIENEN", "PRENDA", "PRENDAS", "REGISTRO", "REGISTROS", "REGISTRADAS", "REGISTRADOS",
+    "EXISTE", "EXISTEN", "DAME", "LISTA", "LISTAR", "MUESTRA", "MUESTRAME", "MOSTRAR", "OBTENER",
+    "OBTEN", "TODAS", "TODOS", "BASE", "DATOS", "TABLA", "DISTINTOS", "DISTINTAS", "DIFERENTES",
+    "UNICOS", "UNICAS", "VALORES", "AGRUPADAS", "AGRUPADOS", "AGRUPANDO", "SEGUN", "FILTRAR",
+    "FILTRANDO", "FILTRADAS", "FILTRADOS", "POR", "TIPO", "USADOS", "USADAS", "UTILIZADOS", "UTILIZADAS",
+}
+
+# Palabras que las plantillas entienden; EntityMatcher no las marca como dudas
+QUESTION_WORDS = NEUTRAL_WORDS | COUNT_WORDS | HASH_WORDS | {
+    word for phrase in DIMENSION_PHRASES for word in phrase
+}
+
+# Orden de las columnas de filtro en el WHERE (misma forma de SQL para la misma consulta)
+_FILTER_ORDER = ("TDESCCLIE", "TTIPOGENE", "TTIPOEDAD", "TTIPOPREN", "TTIPOTEJI", "TCODITALL", "TLUGADEST")
+
+
+# Nombre legible (singular, plural) de cada columna para las respuestas sin LLM
+COLUMN_LABELS = {
+    "TDESCCLIE": ("cliente", "clientes"),
+    "TTIPOGENE": ("género", "géneros"),
+    "TTIPOEDAD": ("edad", "edades"),
+    "TCODITALL": ("talla", "tallas"),
+    "TTIPOPREN": ("tipo de prenda", "tipos de prenda"),
+    "TTIPOTEJI": ("tipo de tejido", "tipos de tejido"),
+    "TLUGADEST": ("destino", "destinos"),
+}
+
+# Valores que se listan en una respuesta sin LLM antes de resumir "y N más"
+MAX_LISTED_VALUES = 50
+
+
+class TemplateQuery:
+    """SQL de una plantilla con sus parámetros."""
+
+    def __init__(self, name, sql, params, column=None, filters=None):
+        self.name = name
+        self.sql = sql
+        self.params = params
+        # Columna de agrupación / DISTINCT y filtros {columna: [valores]}, para format_template_answer
+        self.column = column
+        self.filters = filters or {}
+
+    def __repr__(self):
+        return f"TemplateQuery({self.name}: {self.sql} {self.params})"
+
+
+@lru_cache(maxsize=256)
+def build_template_sql(intent, column, filter_shape):
+    """
+    Arma (una vez por forma) el SQL de una plantilla.
+
+    Args:
+        intent: "count", "count_by", "count_distinct", "distinct" o "hashes"
+        column: Columna de agrupación / DISTINCT (o None)
+        filter_shape: Tupla ((columna, cantidad de valores), ...) del WHERE
+
+    Returns:
+        str: SQL con marcadores %s
+    """
+    for name in [column] + [filter_column for filter_column, _ in filter_shape]:
+        if name is not None and name not in TEMPLATE_COLUMNS:
+            raise ValueError(f"Columna no permitida en plantilla: {name}")
+
+    conditions = []
+    for filter_column, count in filter_shape:
+        if count == 1:
+            conditions.append(f"{filter_column} = %s")
+        else:
+            conditions.append(f"{filter_column} IN ({', '.join(['%s'] * count)})")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if intent == "count":
+        return f"SELECT COUNT(*) FROM apdobloctrazactu{where}"
+    if intent == "count_by":
+        return (f"SELECT {column}, COUNT(*) as cantidad FROM apdobloctrazactu{where} "
+                f"GROUP BY {column} ORDER BY cantidad DESC")
+    if intent == "count_distinct":
+        return f"SELECT COUNT(DISTINCT {column}) FROM apdobloctrazactu{where}"
+    if intent == "distinct":
+        columns = "TCODICLIE, TDESCCLIE" if column == "TDESCCLIE" else column
+        not_empty = f"{column} IS NOT NULL AND {column} <> ''"
+        where = f"{where} AND {not_empty}" if where else f" WHERE {not_empty}"
+        return f"SELECT DISTINCT {columns} FROM apdobloctrazactu{where} ORDER BY {column}"
+    if intent == "hashes":
+        columns = f"TTICKBARR, TTICKHASH, {column}" if column else "TTICKBARR, TTICKHASH"
+        return f"SELECT {columns} FROM apdobloctrazactu{where}"
+    raise ValueError(f"Plantilla desconocida: {intent}")
+
+
+def _dimensions(words, entity_columns):
+    """
+    Recorre las palabras y separa las que nombran columnas.
+
+    Returns:
+        list: Dimensiones [(columna, plural, después de POR)] o None si una
+              palabra no se reconoce
+    """
+    dimensions = []
+    index = 0
+    while index < len(words):
+        word, field = words[index]
+        if field is not None:
+            index += 1
+            continue
+
+        for size in range(min(_MAX_PHRASE_WORDS, len(words) - index), 0, -1):
+            window = words[index:index + size]
+            if any(f is not None for _, f in window):
+                continue
+            column = DIMENSION_PHRASES.get(tuple(w for w, _ in window))
+            if column:
+                break
+        else:
+            column, size = None, 1
+
+        if column is None:
+            if word not in NEUTRAL_WORDS and word not in COUNT_WORDS and word not in HASH_WORDS:
+                return None
+            index += 1
+            continue
+
+        # "cliente LACOSTE", "talla M": la columna solo presenta al valor que sigue
+        next_field = words[index + size][1] if index + size < len(words) else None
+        if next_field is None or entity_columns.get(next_field) != column:
+            after_por = index > 0 and words[index - 1][0] == "POR"
+            dimensions.append((column, window[0][0].endswith("S"), after_por))
+        index += size
+    return dimensions
+
+
+def match_query_template(analysis, entity_columns, needs_hashes=False, extra_filters=None):
+    """
+    Reconoce una instrucción de query_bot con forma de plantilla.
+
+    Args:
+        analysis: EntityAnalysis de la instrucción (entity_matching)
+        entity_columns: {campo de entidad: columna}, ej {"client": "TDESCCLIE"}
+        needs_hashes: Si el plan va a descargar JSONs (el resultado debe traer TTICKHASH)
+        extra_filters: Filtros del panel {columna: valor}; si contradicen a la
+                       pregunta se deja la decisión al LLM
+
+    Returns:
+        TemplateQuery o None si la instrucción necesita al LLM
+    """
+    if analysis is None or not analysis.confident or not analysis.words:
+        return None
+    if any(entity_columns.get(field) not in TEMPLATE_COLUMNS for field, _ in analysis.matches):
+        return None
+
+    dimensions = _dimensions(analysis.words, entity_columns)
+    if dimensions is None:
+        return None
+
+    plain_words = {word for word, field in analysis.words if field is None}
+    grouped = [column for column, _, after_por in dimensions if after_por]
+    listed = [(column, plural) for column, plural, after_por in dimensions if not after_por]
+    if len(grouped) > 1 or len(listed) > 1:
+        return None
+    group_column = grouped[0] if grouped else None
+
+    if needs_hashes or plain_words & HASH_WORDS:
+        if listed:
+            return None
+        intent, column = "hashes", group_column
+    elif plain_words & COUNT_WORDS:
+        if group_column and listed:
+            return None
+        if group_column:
+            intent, column = "count_by", group_column
+        elif listed:
+            if not listed[0][1]:
+                return None
+            intent, column = "count_distinct", listed[0][0]
+        else:
+            intent, column = "count", None
+    elif listed and listed[0][1] and not group_column:
+        intent, column = "distinct", listed[0][0]
+    else:
+        return None
+
+    values = {}
+    for field, value in analysis.matches:
+        column_values = values.setdefault(entity_columns[field], [])
+        if value not in column_values:
+            column_values.append(value)
+    for name, value in (extra_filters or {}).items():
+        if name not in TEMPLATE_COLUMNS:
+            return None
+        if name in values and [str(v).upper() for v in values[name]] != [str(value).upper()]:
+            return None
+        values[name] = [value]
+    filter_shape = tuple((name, len(values[name])) for name in _FILTER_ORDER if name in values)
+    params = tuple(value for name in _FILTER_ORDER for value in values.get(name, []))
+
+    filters = {name: values[name] for name in _FILTER_ORDER if name in values}
+    return TemplateQuery(intent, build_template_sql(intent, column, filter_shape), params, column, filters)
+
+
+def _describe_filters(filters):
+    """Ej "de cliente LACOSTE o NIKE y género Hombres"."""
+    parts = [
+        f"{COLUMN_LABELS[name][0]} {' o '.join(str(value) for value in values)}"
+        for name, values in filters.items()
+    ]
+    return f" de {' y '.join(parts)}" if parts else ""
+
+
+def _format_count(value):
+    return f"{int(value):,}".replace(",", ".")
+
+
+def format_template_answer(template, rows):
+    """
+    Respuesta breve en markdown a partir de las filas de una plantilla (sin LLM).
+
+    Args:
+        template: TemplateQuery ejecutada
+        rows: Filas del resultado como tuplas, en el orden de las columnas del SELECT
+
+    Returns:
+        str: Respuesta o None si la plantilla no tiene formato compacto
+    """
+    description = _describe_filters(template.filters)
+
+    if template.name == "count":
+        return f"Hay **{_format_count(rows[0][0])}** prendas{description}."
+
+    singular, plural = COLUMN_LABELS.get(template.column, ("", ""))
+    if template.name == "count_distinct":
+        return f"Cantidad de {plural} en las prendas{description}: **{_format_count(rows[0][0])}**."
+
+    if template.name == "count_by":
+        total = sum(int(count) for _, count in rows)
+        lines = [f"- {value or 'Sin dato'}: {_format_count(count)}" for value, count in rows[:MAX_LISTED_VALUES]]
+        if len(rows) > MAX_LISTED_VALUES:
+            lines.append(f"- ... y {len(rows) - MAX_LISTED_VALUES} {plural} más")
+        return (f"Prendas{description} por {singular}:\n\n" + "\n".join(lines)
+                + f"\n\n**Total: {_format_count(total)}** prendas.")
+
+    if template.name == "distinct":
+        # Para clientes el SELECT trae (código, nombre): se muestra el nombre
+        values = [str(row[-1]) for row in rows]
+        listed = ", ".join(values[:MAX_LISTED_VALUES])
+        if len(values) > MAX_LISTED_VALUES:
+            listed += f" y {len(values) - MAX_LISTED_VALUES} más"
+        return f"Hay **{len(values)}** {plural} en las prendas{description}: {listed}."
+
+    return None
@@ -4,6 +4,9 @@ import pymysql
 import warnings
 
 from dotenv import load_dotenv
+from latest_versions import upsert_latest_version
+from facets import get_facet_key, apply_facet_change
+from ingestion_watermark import bump_watermark
 
 
 # Cargar las variables de entorno
@@ -35,12 +38,14 @@ def connect_to_my_db():
         print("falló al conectarse a la base de datos de MariaDB")
         return None
 
+# Versiones guardadas de un tickbarr (index_advisor.py le hace EXPLAIN)
+TICKBARR_VERSIONS_SQL = "SELECT * FROM apdobloctrazhash WHERE TTICKBARR = %s"
+
 def get_version_from_same_tickbarr(tickbarr):
     conn = connect_to_my_db()
     if conn:
         try:
-            query = "SELECT * FROM apdobloctrazhash WHERE TTICKBARR = %s"
-            df = pd.read_sql(query, conn, params=(tickbarr,))
+            df = pd.read_sql(TICKBARR_VERSIONS_SQL, conn, params=(tickbarr,))
             if df.empty:
                 return 1
             else:
@@ -67,16 +72,30 @@ def get_version_from_same_tickbarr_error(tickbarr):
 
 def save_tickbarr_hash_to_db(tickbarr, num_box, code_esty_clie, code_etiq_clie, code_tall, hash, cod_clie, desc_clie, tipo_pren, edad, genero, destino, tipo_tejido):
     conn = connect_to_my_db()
-    if conn:
-        try:
-            query = "INSERT INTO apdobloctrazhash (TTICKBARR, TNUMEVERS, TNUMECAJA, TESTICLIE, TETIQCLIE, TCODITALL, TTICKHASH, TCODICLIE, TDESCCLIE, TTIPOPREN, TTIPOEDAD, TTIPOGENE, TLUGADEST, TTIPOTEJI) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-            version = get_version_from_same_tickbarr(tickbarr)
-            with conn.cursor() as cursor:
-                cursor.execute(query, (tickbarr, version, num_box, code_esty_clie, code_etiq_clie, code_tall, hash, cod_clie ,desc_clie ,tipo_pren ,edad ,genero ,destino ,tipo_tejido))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(e)
+    if not conn:
+        raise ConnectionError(f"No se pudo guardar el hash de {tickbarr}: sin conexión a MariaDB")
+    try:
+        query = "INSERT INTO apdobloctrazhash (TTICKBARR, TNUMEVERS, TNUMECAJA, TESTICLIE, TETIQCLIE, TCODITALL, TTICKHASH, TCODICLIE, TDESCCLIE, TTIPOPREN, TTIPOEDAD, TTIPOGENE, TLUGADEST, TTIPOTEJI) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        version = get_version_from_same_tickbarr(tickbarr)
+        with conn.cursor() as cursor:
+            cursor.execute(query, (tickbarr, version, num_box, code_esty_clie, code_etiq_clie, code_tall, hash, cod_clie ,desc_clie ,tipo_pren ,edad ,genero ,destino ,tipo_tejido))
+            # Misma transacción: la versión vigente y los conteos por faceta
+            # nunca quedan desfasados del historial
+            previous_facets = get_facet_key(cursor, tickbarr)
+            upsert_latest_version(cursor, tickbarr, version)
+            apply_facet_change(cursor, previous_facets, get_facet_key(cursor, tickbarr))
+            # Avisa a las cachés de la API (vocabularios) que hubo cambios
+            bump_watermark(cursor)
+        conn.commit()
+        conn.close()
+        return version
+    except Exception as e:
+        # Deshacer la transacción completa y propagar el error para que
+        # main.py registre el tickbarr en apdoblochasherror
+        print(e)
+        conn.rollback()
+        conn.close()
+        raise
 
 def save_failed_tickbarr(tickbarr, error_message):
     conn = connect_to_my_db()
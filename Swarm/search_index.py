@@ -0,0 +1,203 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+
+from db import connect_to_my_db
+
+# ============================================================================
+# ÍNDICE DE BÚSQUEDA PARA AUTOCOMPLETADO
+# ============================================================================
+# Cajas, estilos y etiquetas tienen muchos menos valores distintos que prendas,
+# así que se indexan en memoria: una lista ordenada para prefijos (bisect) y un
+# índice de trigramas para coincidencias en medio del código. El índice se
+# reconstruye cada SEARCH_INDEX_TTL segundos desde apdobloctrazactu.
+# Los tickbarrs no se cargan en memoria: su prefijo se resuelve con la clave
+# primaria en MariaDB.
+
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+# Campo de la API -> columna de apdobloctrazactu
+SEARCH_FIELDS = {
+    "numecaja": "TNUMECAJA",
+    "esticlie": "TESTICLIE",
+    "etiqclie": "TETIQCLIE",
+}
+
+# Orden de relevancia según el tipo de coincidencia
+MATCH_RANK = {"exacto": 0, "prefijo": 1, "contiene": 2}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ValueSearchIndex:
+    """
+    Índice de los valores distintos de una columna con su cantidad de prendas.
+    Inmutable una vez construido: se reemplaza completo al refrescar.
+    """
+
+    def __init__(self, value_counts):
+        """
+        Args:
+            value_counts: Iterable de (valor, cantidad de prendas)
+        """
+        entries = sorted(
+            (str(value).strip().upper(), str(value), count)
+            for value, count in value_counts
+            if value is not None and str(value).strip()
+        )
+        self._keys = [key for key, _, _ in entries]
+        self._values = [value for _, value, _ in entries]
+        self._counts = [count for _, _, count in entries]
+
+        self._trigram_ids = {}
+        for position, key in enumerate(self._keys):
+            for trigram in _trigrams(key):
+                self._trigram_ids.setdefault(trigram, []).append(position)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _prefix_positions(self, key):
+        start = bisect_left(self._keys, key)
+        end = bisect_left(self._keys, key + "\uffff")
+        return range(start, end)
+
+    def _infix_positions(self, key):
+        trigrams = _trigrams(key)
+        if not trigrams:
+            # Consultas de 1-2 caracteres: solo prefijo
+            return []
+        # Se intersecta empezando por el trigrama menos frecuente
+        posting_lists = sorted((self._trigram_ids.get(t, []) for t in trigrams), key=len)
+        if not posting_lists[0]:
+            return []
+        candidates = set(posting_lists[0])
+        for posting in posting_lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        # Los trigramas no garantizan el orden: se confirma la subcadena
+        return [position for position in candidates if key in self._keys[position]]
+
+    def search(self, query, limit=10):
+        """
+        Busca valores que empiecen por o contengan la consulta.
+
+        Returns:
+            list: Diccionarios {value, count, match} ordenados por relevancia
+        """
+        key = query.strip().upper()
+        if not key:
+            return []
+
+        matches = {}
+        for position in self._prefix_positions(key):
+            matches[position] = "exacto" if self._keys[position] == key else "prefijo"
+        for position in self._infix_positions(key):
+            matches.setdefault(position, "contiene")
+
+        ranked = sorted(
+            matches.items(),
+            key=lambda item: (MATCH_RANK[item[1]], -self._counts[item[0]], len(self._keys[item[0]]))
+        )
+        return [
+            {"value": self._values[position], "count": self._counts[position], "match": match}
+            for position, match in ranked[:limit]
+        ]
+
+
+class SearchIndexRegistry:
+    """Mantiene un ValueSearchIndex por campo y lo reconstruye al vencer el TTL."""
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._indexes = {}
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        conn = connect_to_my_db()
+        if not conn:
+            return None
+        try:
+            indexes = {}
+            with conn.cursor() as cursor:
+                for field, column in SEARCH_FIELDS.items():
+                    cursor.execute(
+                        f"SELECT {column}, COUNT(*) FROM apdobloctrazactu "
+                        f"WHERE {column} IS NOT NULL GROUP BY {column}"
+                    )
+                    indexes[field] = ValueSearchIndex(cursor.fetchall())
+            return indexes
+        except Exception as e:
+            print(f"Error al construir el índice de búsqueda: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def get(self, field):
+        """Devuelve el índice del campo, reconstruyéndolo si venció."""
+        if time.time() - self._built_at > self.ttl:
+            # Un solo hilo reconstruye; el resto sigue usando el índice anterior
+            if self._lock.acquire(blocking=not self._indexes):
+                try:
+                    if time.time() - self._built_at > self.ttl:
+                        start_time = time.time()
+                        indexes = self._load()
+                        if indexes is not None:
+                            self._indexes = indexes
+                            self._built_at = time.time()
+                            sizes = ", ".join(f"{f}={len(i)}" for f, i in indexes.items())
+                            print(f"✓ Índice de búsqueda reconstruido en {time.time() - start_time:.2f}s ({sizes})")
+                finally:
+                    self._lock.release()
+        return self._indexes.get(field)
+
+
+_registry = SearchIndexRegistry()
+
+
+def search_tickbarrs(query, limit=10):
+    """Tickbarrs que empiezan por la consulta (rango sobre la clave primaria)."""
+    conn = connect_to_my_db()
+    if not conn:
+        return []
+    try:
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT TTICKBARR FROM apdobloctrazactu WHERE TTICKBARR LIKE %s ORDER BY TTICKBARR LIMIT %s",
+                (escaped + "%", limit)
+            )
+            return [
+                {"value": row[0], "count": 1, "match": "exacto" if row[0] == query else "prefijo"}
+                for row in cursor.fetchall()
+            ]
+    finally:
+        conn.close()
+
+
+def search_values(query, fields=None, limit=10):
+    """
+    Busca candidatos para autocompletar en los campos indicados.
+
+    Args:
+        query: Texto parcial escrito por el usuario
+        fields: Campos a buscar (numecaja, esticlie, etiqclie, tickbarr). Por defecto todos.
+        limit: Máximo de candidatos por campo
+
+    Returns:
+        dict: {campo: [{value, count, match}]}
+    """
+    fields = fields or list(SEARCH_FIELDS) + ["tickbarr"]
+    results = {}
+    for field in fields:
+        if field == "tickbarr":
+            results[field] = search_tickbarrs(query.strip(), limit)
+            continue
+        index = _registry.get(field)
+        results[field] = index.search(query, limit) if index is not None else []
+    return results
@@ -0,0 +1,397 @@
+import os
+import re
+import gzip
+import json
+import threading
+import requests
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ============================================================================
+# CACHÉ Y DESCARGA MASIVA DE DOCUMENTOS DE SWARM
+# ============================================================================
+# Las referencias de Swarm son direcciones de contenido: el documento asociado
+# a un hash nunca cambia. Por eso se pueden cachear sin expiración, limitando
+# solo el uso de memoria (LRU por bytes).
+
+SWARM_GATEWAY_URL = os.getenv("SWARM_GATEWAY_URL", "https://api.gateway.ethswarm.org")
+SWARM_CACHE_MAX_BYTES = int(os.getenv("SWARM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SWARM_POOL_SIZE = int(os.getenv("SWARM_POOL_SIZE", "20"))
+# Documentos más pequeños que esto no se comprimen al servirlos
+GZIP_MIN_BYTES = 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Referencia Swarm: 32 bytes en hex (64 bytes si el contenido está cifrado)
+_REFERENCE_PATTERN = re.compile(r"[0-9a-fA-F]{64}(?:[0-9a-fA-F]{64})?")
+
+# Cuerpo listo para enviar al cliente: iterable de bytes y cabeceras HTTP
+SwarmDocumentStream = namedtuple(
+    "SwarmDocumentStream", ["body", "content_type", "content_encoding", "content_length"]
+)
+
+
+class SwarmGatewayError(Exception):
+    """Error HTTP devuelto por el gateway de Swarm (conserva el status code)."""
+
+    def __init__(self, status_code: int, hash_value: str):
+        super().__init__(f"Gateway de Swarm respondió {status_code} para {hash_value[:16]}")
+        self.status_code = status_code
+        self.hash_value = hash_value
+
+
+class SwarmDocumentCache:
+    """
+    Caché LRU thread-safe de documentos crudos (bytes) indexados por referencia Swarm.
+    El límite es en bytes, no en cantidad de documentos.
+    """
+
+    def __init__(self, max_bytes: int = SWARM_CACHE_MAX_BYTES, size_of=len):
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, hash_value: str):
+        with self._lock:
+            data = self._entries.get(hash_value)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(hash_value)
+            self.hits += 1
+            return data
+
+    def put(self, hash_value: str, data):
+        size = self.size_of(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(hash_value, None)
+            if previous is not None:
+                self._size -= self.size_of(previous)
+            self._entries[hash_value] = data
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self.size_of(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class ParsedSwarmDocument:
+    """
+    Documento de trazabilidad parseado una sola vez y guardado por secciones.
+
+    Cada sección se conserva parseada (para proyectar campos) y ya serializada
+    en JSON compacto (para devolver secciones completas sin volver a serializar).
+    """
+
+    __slots__ = ("sections", "encoded", "nbytes")
+
+    def __init__(self, document: dict):
+        self.sections = document
+        self.encoded = {
+            name: json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            for name, rows in document.items()
+        }
+        self.nbytes = sum(len(value) for value in self.encoded.values())
+
+
+_document_cache = SwarmDocumentCache()
+# Los objetos Python ocupan varias veces más que su JSON: se estima x4
+_parsed_cache = SwarmDocumentCache(SWARM_CACHE_MAX_BYTES // 2, size_of=lambda doc: doc.nbytes * 4)
+# Versión comprimida de los documentos ya servidos con gzip (se comprime una sola vez)
+_gzip_cache = SwarmDocumentCache(SWARM_CACHE_MAX_BYTES // 4)
+_thread_local = threading.local()
+# Precargas en segundo plano (prefetch_swarm_documents); cada una descarga en paralelo
+SWARM_PREFETCH_WORKERS = int(os.getenv("SWARM_PREFETCH_WORKERS", "4"))
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+
+
+def get_document_cache() -> SwarmDocumentCache:
+    """Retorna la caché global de documentos de Swarm."""
+    return _document_cache
+
+
+def _get_session() -> requests.Session:
+    """Sesión HTTP por thread con keep-alive hacia el gateway."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SWARM_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _thread_local.session = session
+    return session
+
+
+def is_valid_swarm_reference(hash_value) -> bool:
+    """Verifica que el valor tenga formato de referencia Swarm (hex de 64 o 128 caracteres)."""
+    return isinstance(hash_value, str) and _REFERENCE_PATTERN.fullmatch(hash_value) is not None
+
+
+def swarm_document_url(hash_value: str) -> str:
+    return f"{SWARM_GATEWAY_URL}/bzz/{hash_value}"
+
+
+def get_swarm_document_bytes(hash_value: str, timeout: int = 30) -> bytes:
+    """
+    Obtiene el documento crudo de un hash, desde caché o desde el gateway.
+
+    Args:
+        hash_value: Referencia Swarm del documento
+        timeout: Timeout en segundos para la petición HTTP
+
+    Returns:
+        bytes: Contenido del documento tal como está almacenado en Swarm
+
+    Raises:
+        SwarmGatewayError: Si el gateway responde con un status distinto de 200
+        requests.exceptions.RequestException: Errores de red o timeout
+    """
+    data = _document_cache.get(hash_value)
+    if data is not None:
+        return data
+    return _download_swarm_document(hash_value, timeout)
+
+
+def _download_swarm_document(hash_value: str, timeout: int) -> bytes:
+    """Descarga un documento del gateway y lo guarda en caché (sin consultarla antes)."""
+    response = _get_session().get(swarm_document_url(hash_value), timeout=timeout)
+    if response.status_code != 200:
+        raise SwarmGatewayError(response.status_code, hash_value)
+
+    data = response.content
+    _document_cache.put(hash_value, data)
+    return data
+
+
+def open_swarm_document_stream(hash_value: str, accept_gzip: bool = False, timeout: int = 30) -> SwarmDocumentStream:
+    """
+    Prepara el documento para enviarlo tal cual al cliente, sin parsear el JSON.
+
+    - Si está en caché se entrega en un solo bloque (comprimido con gzip si el
+      cliente lo acepta; la versión comprimida también se cachea).
+    - Si no está en caché se transmite por bloques desde el gateway mientras se
+      descarga y se guarda en caché al terminar. Si el gateway responde con
+      gzip y el cliente lo acepta, los bytes comprimidos pasan sin tocarse.
+
+    Args:
+        hash_value: Referencia Swarm del documento
+        accept_gzip: Si el cliente acepta Content-Encoding gzip
+        timeout: Timeout en segundos para conectar con el gateway
+
+    Returns:
+        SwarmDocumentStream con el cuerpo y las cabeceras de la respuesta
+
+    Raises:
+        SwarmGatewayError: Si el gateway responde con un status distinto de 200
+        requests.exceptions.RequestException: Errores de red o timeout
+    """
+    content_type = "application/json"
+
+    if accept_gzip:
+        compressed = _gzip_cache.get(hash_value)
+        if compressed is not None:
+            return SwarmDocumentStream([compressed], content_type, "gzip", len(compressed))
+
+    data = _document_cache.get(hash_value)
+    if data is not None:
+        if accept_gzip and len(data) >= GZIP_MIN_BYTES:
+            compressed = gzip.compress(data, compresslevel=6)
+            _gzip_cache.put(hash_value, compressed)
+            return SwarmDocumentStream([compressed], content_type, "gzip", len(compressed))
+        return SwarmDocumentStream([data], content_type, None, len(data))
+
+    response = _get_session().get(
+        swarm_document_url(hash_value),
+        timeout=timeout,
+        stream=True,
+        headers={"Accept-Encoding": "gzip" if accept_gzip else "identity"}
+    )
+    if response.status_code != 200:
+        response.close()
+        raise SwarmGatewayError(response.status_code, hash_value)
+
+    passthrough_gzip = accept_gzip and response.headers.get("Content-Encoding") == "gzip"
+    content_type = response.headers.get("Content-Type", content_type)
+    content_length = None
+    if passthrough_gzip or not response.headers.get("Content-Encoding"):
+        content_length = response.headers.get("Content-Length")
+
+    def body():
+        chunks = []
+        completed = False
+        try:
+            for chunk in response.raw.stream(STREAM_CHUNK_SIZE, decode_content=not passthrough_gzip):
+                chunks.append(chunk)
+                yield chunk
+            completed = True
+        finally:
+            response.close()
+            # Solo se cachea si el documento llegó completo
+            if completed:
+                payload = b"".join(chunks)
+                if passthrough_gzip:
+                    _gzip_cache.put(hash_value, payload)
+                    _document_cache.put(hash_value, gzip.decompress(payload))
+                else:
+                    _document_cache.put(hash_value, payload)
+
+    return SwarmDocumentStream(
+        body(),
+        content_type,
+        "gzip" if passthrough_gzip else None,
+        int(content_length) if content_length else None
+    )
+
+
+def get_parsed_swarm_document(hash_value: str, timeout: int = 30) -> ParsedSwarmDocument:
+    """
+    Retorna el documento parseado por secciones, desde caché o descargándolo.
+
+    Raises:
+        SwarmGatewayError, requests.exceptions.RequestException: Igual que get_swarm_document_bytes
+        ValueError: Si el documento no es un objeto JSON
+    """
+    parsed = _parsed_cache.get(hash_value)
+    if parsed is not None:
+        return parsed
+
+    document = json.loads(get_swarm_document_bytes(hash_value, timeout=timeout))
+    if not isinstance(document, dict):
+        raise ValueError("El documento de Swarm no es un objeto JSON")
+
+    parsed = ParsedSwarmDocument(document)
+    _parsed_cache.put(hash_value, parsed)
+    return parsed
+
+
+def project_swarm_document(hash_value: str, sections=None, fields=None):
+    """
+    Arma un JSON con solo las secciones y campos pedidos de un documento.
+
+    Args:
+        hash_value: Referencia Swarm del documento
+        sections: Lista de secciones (ej: ["tztotrazwebtint"]); None = todas
+        fields: Lista de campos a conservar. "CAMPO" aplica a todas las secciones
+                pedidas y "seccion.CAMPO" solo a esa sección; None = todos
+
+    Returns:
+        tuple: (bytes con el JSON proyectado, lista de secciones no encontradas)
+    """
+    parsed = get_parsed_swarm_document(hash_value)
+
+    common_fields = []
+    section_fields = {}
+    for field in fields or []:
+        if "." in field:
+            section_name, field_name = field.split(".", 1)
+            section_fields.setdefault(section_name, []).append(field_name)
+        else:
+            common_fields.append(field)
+
+    requested = sections or list(parsed.sections.keys())
+    missing = [name for name in requested if name not in parsed.sections]
+
+    parts = []
+    for name in requested:
+        if name not in parsed.sections:
+            continue
+        wanted = common_fields + section_fields.get(name, [])
+        if wanted:
+            rows = parsed.sections[name]
+            projected = [
+                {field: row[field] for field in wanted if field in row}
+                for row in rows if isinstance(row, dict)
+            ]
+            encoded = json.dumps(projected, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        else:
+            # Sección completa: se reutiliza el JSON ya serializado
+            encoded = parsed.encoded[name]
+        parts.append(json.dumps(name).encode("utf-8") + b":" + encoded)
+
+    return b"{" + b",".join(parts) + b"}", missing
+
+
+def fetch_swarm_documents(hashes, max_workers: int = 10, timeout: int = 15) -> dict:
+    """
+    Descarga varios documentos en paralelo, sirviendo primero desde caché.
+
+    Args:
+        hashes: Lista de referencias Swarm (se eliminan duplicados)
+        max_workers: Número de threads para las descargas pendientes
+        timeout: Timeout en segundos por documento
+
+    Returns:
+        dict: {hash: bytes} - el valor es None si el documento no pudo obtenerse
+    """
+    results = {}
+    pending = []
+    for hash_value in dict.fromkeys(h for h in hashes if h):
+        data = _document_cache.get(hash_value)
+        if data is not None:
+            results[hash_value] = data
+        else:
+            pending.append(hash_value)
+
+    if not pending:
+        return results
+
+    def fetch_one(hash_value):
+        try:
+            # La caché ya se consultó arriba: no contar el fallo dos veces
+            return hash_value, _download_swarm_document(hash_value, timeout)
+        except Exception as e:
+            print(f"  ✗ No se pudo descargar {hash_value[:16]}: {str(e)[:100]}")
+            return hash_value, None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+        for hash_value, data in executor.map(fetch_one, pending):
+            results[hash_value] = data
+
+    return results
+
+
+def prefetch_swarm_documents(hashes, timeout: int = 15):
+    """
+    Descarga documentos a la caché en segundo plano, sin esperar el resultado.
+
+    Returns:
+        Future de fetch_swarm_documents (None si no hay nada que precargar). Quien
+        vaya a usar los documentos puede esperarlo para no descargarlos dos veces.
+    """
+    global _prefetch_executor
+    hashes = [h for h in hashes if h]
+    if not hashes:
+        return None
+    with _prefetch_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(max_workers=SWARM_PREFETCH_WORKERS, thread_name_prefix="swarm-prefetch")
+    return _prefetch_executor.submit(fetch_swarm_documents, hashes, timeout=timeout)
+
+
+def to_ndjson_fragment(data: bytes) -> bytes:
+    """
+    Compacta un documento JSON a una sola línea sin parsearlo.
+
+    En JSON válido los saltos de línea literales solo pueden aparecer como
+    espacio en blanco entre tokens (dentro de strings van escapados), así que
+    eliminarlos no altera el contenido.
+    """
+    return data.replace(b"\r", b"").replace(b"\n", b"")
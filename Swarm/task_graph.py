@@ -0,0 +1,118 @@
+import os
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from tracing import span
+
+# ============================================================================
+# GRAFO DE TAREAS DEL PIPELINE
+# ============================================================================
+# Los pasos de una pregunta que no dependen entre sí (leer el historial,
+# reconocer entidades, corregir la pregunta, extraer filtros...) se declaran como tareas con sus dependencias y se
+# ejecutan en threads apenas terminan las tareas de las que dependen.
+# Cada tarea corre en una copia del contexto del llamador, así que su span
+# queda dentro de la traza activa y el resumen muestra el solapamiento.
+
+# Threads compartidos por todos los grafos (las tareas son cortas: I/O o LLM).
+# Por defecto alcanzan para que todas las preguntas simultáneas (/chat síncrono,
+# limitado por CHAT_MAX_CONCURRENT como en bulkhead.py, más los jobs de
+# CHAT_JOB_WORKERS) corran a la vez sus tareas independientes
+TASKS_PER_PIPELINE = 3
+_CONCURRENT_PIPELINES = (
+    int(os.getenv("CHAT_MAX_CONCURRENT", str(max(1, int(os.getenv("GUNICORN_THREADS", "32")) // 4))))
+    + int(os.getenv("CHAT_JOB_WORKERS", "8"))
+)
+TASK_GRAPH_WORKERS = int(os.getenv("TASK_GRAPH_WORKERS", str(TASKS_PER_PIPELINE * _CONCURRENT_PIPELINES)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TASK_GRAPH_WORKERS, thread_name_prefix="pipeline")
+        return _executor
+
+
+class TaskGraph:
+    """Tareas con dependencias ejecutadas en paralelo cuando están listas."""
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+
+    def add(self, name, function, depends_on=(), when=None, stage=None):
+        """
+        Declara una tarea.
+
+        Args:
+            name: Nombre de la tarea (y de su span)
+            function: Callable que recibe el dict de resultados de sus dependencias
+            depends_on: Nombres de las tareas que deben terminar antes
+            when: Callable opcional (resultados -> bool); si retorna False la
+                  tarea no se ejecuta y su resultado es None
+            stage: Context manager opcional que envuelve la tarea en lugar del
+                   span (ej PipelineContext.stage, que además mide su duración)
+        """
+        for dependency in depends_on:
+            if dependency not in self._tasks:
+                raise ValueError(f"Tarea '{name}' depende de '{dependency}', que no está declarada")
+        self._tasks[name] = (function, tuple(depends_on), when, stage)
+        return self
+
+    def _run_task(self, name, results):
+        function, depends_on, when, stage = self._tasks[name]
+        inputs = {dependency: results[dependency] for dependency in depends_on}
+        if when is not None and not when(inputs):
+            return None
+        with (stage(name) if stage else span(name)):
+            return function(inputs)
+
+    def run(self):
+        """
+        Ejecuta el grafo y espera a que terminen todas las tareas.
+        No llamar desde una tarea de otro grafo (comparten los threads).
+
+        Returns:
+            dict: {nombre de tarea: resultado}
+
+        Raises:
+            La primera excepción de una tarea (las demás tareas en curso terminan igual)
+        """
+        results = {}
+        pending = dict(self._tasks)
+        running = {}
+        executor = _get_executor()
+        error = None
+
+        while pending or running:
+            if error is None:
+                ready = [
+                    name for name, (_, depends_on, _, _) in pending.items()
+                    if all(dependency in results for dependency in depends_on)
+                ]
+                for name in ready:
+                    del pending[name]
+                    # Una copia del contexto por tarea: la traza y el span padre viajan al thread
+                    task_context = contextvars.copy_context()
+                    future = executor.submit(task_context.run, self._run_task, name, dict(results))
+                    running[future] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Tarea '{name}' del grafo '{self.name}' falló: {e}")
+                    if error is None:
+                        error = e
+
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime
+
+# ============================================================================
+# TRAZAS DE LATENCIA DEL CHATBOT
+# ============================================================================
+# Cada pregunta abre una traza con un request id; cada etapa del pipeline
+# (corrección, filtros, plan, SQL, Swarm, respuesta final, llamadas al LLM)
+# es un span con su duración y atributos (tokens, filas, hashes...).
+# La traza activa viaja en un contextvar, así que las funciones instrumentadas
+# no reciben parámetros extra. Sin traza activa, los spans no registran nada.
+# Al cerrar la traza se agrega una línea a TRACE_LOG_PATH (JSONL).
+
+TRACE_LOG_PATH = os.getenv(
+    "TRACE_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "chat_traces.jsonl")
+)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+# Atributos numéricos que se suman en el resumen de la traza
+SUMMED_ATTRIBUTES = (
+    "prompt_tokens", "completion_tokens", "cached_tokens", "prompt_tokens_estimated",
+    "prompt_tokens_saved", "sql_ms", "rows", "hashes", "documents"
+)
+
+
+class Span:
+    """Una etapa medida dentro de una traza."""
+
+    __slots__ = ("id", "name", "parent_id", "start", "duration_ms", "attributes", "error")
+
+    def __init__(self, name, parent_id, attributes):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def to_dict(self, trace_start):
+        data = {
+            "id": self.id,
+            "name": self.name,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start - trace_start) * 1000, 1),
+            "duration_ms": self.duration_ms,
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Trace:
+    """Conjunto de spans de una petición."""
+
+    def __init__(self, request_id=None, name="chat"):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.name = name
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict(self.start) for span in self.spans]
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "fecha": self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "duration_ms": self.duration_ms,
+            "spans": spans
+        }
+
+    def summary(self):
+        """
+        Resumen para la respuesta de /chat: tiempo por etapa y totales.
+
+        Returns:
+            dict: {request_id, duration_ms, stages: {nombre: {count, total_ms, start_ms}}, totals: {...}}
+                  start_ms es el inicio de la primera ejecución de la etapa: las etapas
+                  que corren en paralelo se solapan
+        """
+        stages = {}
+        totals = {key: 0 for key in SUMMED_ATTRIBUTES}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span.name, {
+                "count": 0, "total_ms": 0.0, "start_ms": round((span.start - self.start) * 1000, 1)
+            })
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + (span.duration_ms or 0), 1)
+            for key in SUMMED_ATTRIBUTES:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    totals[key] += value
+        return {
+            "request_id": self.request_id,
+            "duration_ms": self.duration_ms,
+            "stages": stages,
+            "totals": totals
+        }
+
+
+def _export(trace):
+    if not TRACE_LOG_PATH:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+    try:
+        with _export_lock:
+            os.makedirs(os.path.dirname(TRACE_LOG_PATH), exist_ok=True)
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+    except OSError as e:
+        print(f"[WARN] No se pudo guardar la traza {trace.request_id}: {e}")
+
+
+@contextmanager
+def start_trace(request_id=None, name="chat"):
+    """Abre una traza para el bloque y la exporta al salir."""
+    trace = Trace(request_id, name)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        trace.duration_ms = round((time.perf_counter() - trace.start) * 1000, 1)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _export(trace)
+        print(f"[TRACE] {trace.request_id}: {trace.duration_ms} ms en {len(trace.spans)} spans")
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Mide un bloque como span de la traza activa.
+
+    Yields:
+        Span o None si no hay traza activa (los llamadores deben tolerar None)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)[:200]
+        raise
+    finally:
+        current.duration_ms = round((time.perf_counter() - current.start) * 1000, 1)
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Generador (chat_stream) cerrado desde otro contexto
+            pass
+        trace.add(current)
+
+
+def set_span_attributes(**attributes):
+    """Agrega atributos al span en curso (no hace nada sin traza activa)."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def traced(name):
+    """Decorador: ejecuta la función dentro de un span con ese nombre."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_request_id():
+    """Request id de la traza activa, o None."""
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
@@ -43,7 +43,7 @@ def upload_to_swarm(tickbarr: str, batch_stamp: str):
         print("Subido Correctamente.")
         print("Tickbarr:", tickbarr)
         print("Hash Swarm:", swarm_hash)
-        return index_dicc, swarm_hash
+        return index_dicc, swarm_hash, json_data
     except requests.exceptions.JSONDecodeError:
         print("Error: la respuesta no contiene JSON válido. Respuesta completa:", response.text)
 
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+
+from db import connect_to_my_db
+from facets import FACET_COLUMNS
+from ingestion_watermark import current_watermark
+
+# ============================================================================
+# CACHÉ DE VOCABULARIOS (valores únicos por columna)
+# ============================================================================
+# Los valores válidos de clientes, géneros, tallas, etc. se cargan todos en una
+# sola consulta y se guardan con un TTL. Además se descartan en cuanto cambia la
+# marca de ingesta (ingestion_watermark), así que los clientes nuevos aparecen
+# sin reiniciar la API. La carga es single-flight: mientras una petición
+# recarga, las demás usan los valores anteriores (o esperan si todavía no hay).
+
+VOCABULARY_TTL = int(os.getenv("VOCABULARY_TTL", "900"))
+# Si la carga falla, se reintenta después de este tiempo
+VOCABULARY_RETRY_SECONDS = 30
+
+VOCABULARY_COLUMNS = [
+    'TDESCCLIE', 'TCODICLIE', 'TTIPOGENE', 'TTIPOEDAD',
+    'TTIPOPREN', 'TTIPOTEJI', 'TCODITALL', 'TLUGADEST'
+]
+
+
+def _vocabulary_query():
+    """
+    UNION ALL con (columna, valor, cantidad de prendas) de todas las columnas.
+    Las columnas de faceta se leen de apdobloctrazface, mucho más chica.
+    """
+    parts = []
+    for column in VOCABULARY_COLUMNS:
+        if column in FACET_COLUMNS:
+            parts.append(
+                f"SELECT '{column}', {column}, SUM(TCANTPREN) FROM apdobloctrazface "
+                f"WHERE {column} <> '' AND TCANTPREN > 0 GROUP BY {column}"
+            )
+        else:
+            parts.append(
+                f"SELECT '{column}', {column}, COUNT(*) FROM apdobloctrazactu "
+                f"WHERE {column} IS NOT NULL AND {column} <> '' GROUP BY {column}"
+            )
+    return "\nUNION ALL\n".join(parts)
+
+
+class VocabularyCache:
+    """Valores únicos por columna con TTL, invalidación por marca de ingesta y carga única."""
+
+    def __init__(self, ttl=VOCABULARY_TTL):
+        self.ttl = ttl
+        self._values = None
+        self._watermark = None
+        self._expires_at = 0.0
+        self._load_lock = threading.Lock()
+
+    def _is_fresh(self):
+        if self._values is None or time.time() >= self._expires_at:
+            return False
+        watermark = current_watermark()
+        # Si la marca no se puede leer se confía en el TTL
+        return watermark is None or self._watermark is None or watermark == self._watermark
+
+    def _load(self):
+        watermark = current_watermark(force=True)
+        conn = connect_to_my_db()
+        if not conn:
+            self._expires_at = time.time() + VOCABULARY_RETRY_SECONDS
+            if self._values is None:
+                self._values = {}
+            return
+
+        start_time = time.time()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(_vocabulary_query())
+                rows = cursor.fetchall()
+        except Exception as e:
+            print(f"Error al cargar vocabularios: {e}")
+            self._expires_at = time.time() + VOCABULARY_RETRY_SECONDS
+            if self._values is None:
+                self._values = {}
+            return
+        finally:
+            conn.close()
+
+        counts = {column: {} for column in VOCABULARY_COLUMNS}
+        for column, value, count in rows:
+            value = str(value).strip()
+            if value:
+                counts[column][value] = counts[column].get(value, 0) + int(count or 0)
+
+        # Los valores más frecuentes primero: los prompts muestran solo los primeros
+        self._values = {
+            column: sorted(values, key=values.get, reverse=True)
+            for column, values in counts.items()
+        }
+        self._watermark = watermark
+        self._expires_at = time.time() + self.ttl
+        print(f"✓ Vocabularios cargados en {(time.time() - start_time) * 1000:.0f} ms: "
+              + ", ".join(f"{column} {len(values)}" for column, values in self._values.items()))
+
+    def get(self, column, force=False):
+        """
+        Valores de una columna, del más al menos frecuente.
+
+        Args:
+            column: Columna de VOCABULARY_COLUMNS
+            force: Recargar aunque la caché esté vigente
+
+        Returns:
+            list: Valores (compartida entre llamadas: no modificarla)
+        """
+        if force or not self._is_fresh():
+            # Sin valores todavía (o recarga forzada) se espera a la carga en curso
+            blocking = force or self._values is None
+            if self._load_lock.acquire(blocking=blocking):
+                try:
+                    if force or not self._is_fresh():
+                        self._load()
+                finally:
+                    self._load_lock.release()
+        return (self._values or {}).get(column, [])
+
+    def invalidate(self):
+        """Fuerza la recarga en el próximo acceso."""
+        self._expires_at = 0.0
+
+
+vocabulary_cache = VocabularyCache()
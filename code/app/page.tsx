@@ -26,13 +26,8 @@ export default function Home() {
 
     try {
       // Obtener datos de Swarm a través del backend proxy
-      const response = await fetch("http://128.0.17.5:5000/get_swarm_data", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ hash }),
-      })
+      // GET permite que el navegador reutilice el documento (es inmutable)
+      const response = await fetch(`http://128.0.17.5:5000/get_swarm_data/${encodeURIComponent(hash)}`)
 
       if (!response.ok) {
         const errorData = await response.json()
@@ -29,6 +29,9 @@ interface Conversation {
 
 const BACKEND_URL = "http://128.0.17.5:5000"
 
+// Intervalo de consulta del estado del job si la conexión SSE falla
+const JOB_POLL_INTERVAL_MS = 2000
+
 export default function ChatInterface({ language, filters, onFiltersExtracted }: ChatInterfaceProps) {
   const { theme } = useTheme()
   const { userCode, username } = useAuth()
@@ -37,6 +40,8 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
   const [messages, setMessages] = useState<Message[]>([])
   const [inputValue, setInputValue] = useState("")
   const [isLoading, setIsLoading] = useState(false)
+  const [progressMessage, setProgressMessage] = useState<string | null>(null)
+  const [streamingText, setStreamingText] = useState("")
   const [conversationGroup, setConversationGroup] = useState<number | null>(null)
   const [conversations, setConversations] = useState<Conversation[]>([])
   const [showSidebar, setShowSidebar] = useState(false)
@@ -59,7 +64,7 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
 
   useEffect(() => {
     scrollToBottom()
-  }, [messages])
+  }, [messages, streamingText])
 
   // Cargar conversaciones del usuario al montar el componente
   useEffect(() => {
@@ -217,6 +222,60 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
     }
   }
 
+  // Consulta el estado del job hasta que termine (respaldo si SSE no está disponible)
+  const pollChatJob = async (jobId: string): Promise<any> => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+      const response = await fetch(`${BACKEND_URL}/chat/jobs/${jobId}`)
+      const job = await response.json()
+      if (!response.ok) return job
+      if (job.progress?.length) setProgressMessage(job.progress[job.progress.length - 1].message)
+      if (job.status === "completado") return job.result
+      if (job.status === "error") return { success: false, error: job.error }
+    }
+  }
+
+  // Encola la pregunta y espera el resultado recibiendo el avance por SSE
+  const runChatJob = async (body: Record<string, unknown>): Promise<any> => {
+    const response = await fetch(`${BACKEND_URL}/chat/jobs`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    })
+    const job = await response.json()
+    if (!response.ok || !job.job_id) return job
+
+    if (typeof EventSource === "undefined") return pollChatJob(job.job_id)
+
+    return new Promise((resolve) => {
+      const source = new EventSource(`${BACKEND_URL}${job.events_url}`)
+      source.addEventListener("progress", (event) => {
+        setProgressMessage(JSON.parse((event as MessageEvent).data).message)
+      })
+      source.addEventListener("token", (event) => {
+        const { text } = JSON.parse((event as MessageEvent).data)
+        setStreamingText((prev) => prev + text)
+      })
+      source.addEventListener("token_reset", () => {
+        setStreamingText("")
+      })
+      source.addEventListener("result", (event) => {
+        source.close()
+        resolve(JSON.parse((event as MessageEvent).data))
+      })
+      source.addEventListener("failed", (event) => {
+        source.close()
+        resolve({ success: false, ...JSON.parse((event as MessageEvent).data) })
+      })
+      source.onerror = () => {
+        // EventSource reintenta solo; si la conexión quedó cerrada se pasa a polling
+        if (source.readyState === EventSource.CLOSED) {
+          pollChatJob(job.job_id).then(resolve)
+        }
+      }
+    })
+  }
+
   const handleSendMessage = async () => {
     if (!inputValue.trim() || isLoading) return
 
@@ -249,25 +308,19 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
     setMessages(prev => [...prev, userMessage])
     setInputValue("")
     setIsLoading(true)
+    setProgressMessage(null)
+    setStreamingText("")
 
     try {
-      const response = await fetch(`${BACKEND_URL}/chat`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          question: userMessage.content,
-          model: "deepseek",
-          filters: filters || {},
-          user_code: userCode,
-          user_name: username,
-          conversation_group: currentGroup,
-        }),
+      const data = await runChatJob({
+        question: userMessage.content,
+        model: "deepseek",
+        filters: filters || {},
+        user_code: userCode,
+        user_name: username,
+        conversation_group: currentGroup,
       })
 
-      const data = await response.json()
-
       let assistantContent: string
       if (data.success && data.response) {
         assistantContent = data.response
@@ -317,6 +370,8 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
       setMessages(prev => [...prev, errorMessage])
     } finally {
       setIsLoading(false)
+      setProgressMessage(null)
+      setStreamingText("")
     }
   }
 
@@ -507,12 +562,17 @@ export default function ChatInterface({ language, filters, onFiltersExtracted }:
                 <Bot className={`w-4 h-4 ${isDark ? "text-white" : "text-slate-700"}`} />
               </div>
               <div className={`rounded-lg px-4 py-3 ${messageBgAssistant}`}>
-                <div className="flex items-center gap-2">
-                  <Loader2 className={`w-5 h-5 animate-spin ${subtextClass}`} />
-                  <span className={`text-sm ${subtextClass}`}>
-                    {language === "en" ? "Thinking..." : "Pensando..."}
-                  </span>
-                </div>
+                {streamingText ? (
+                  // La respuesta se muestra mientras el modelo la genera
+                  <p className="text-sm whitespace-pre-wrap">{streamingText}</p>
+                ) : (
+                  <div className="flex items-center gap-2">
+                    <Loader2 className={`w-5 h-5 animate-spin ${subtextClass}`} />
+                    <span className={`text-sm ${subtextClass}`}>
+                      {progressMessage || (language === "en" ? "Thinking..." : "Pensando...")}
+                    </span>
+                  </div>
+                )}
               </div>
             </div>
           )}
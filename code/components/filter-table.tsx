@@ -1,6 +1,6 @@
 "use client"
 
-import React, { useState } from "react"
+import React, { useRef, useState } from "react"
 import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import { AlertCircle, Loader2, Search, ChevronLeft, ChevronRight } from "lucide-react"
@@ -18,9 +18,17 @@ interface FilterData {
   TFECHGUAR: string
 }
 
+type SuggestField = "numecaja" | "esticlie" | "etiqclie"
+
+interface SearchResponse {
+  results: Partial<Record<SuggestField, { value: string; count: number }[]>>
+}
+
 interface FilterResponse {
   success: boolean
   count: number
+  has_more?: boolean
+  next_cursor?: string | null
   data: FilterData[]
   message?: string
 }
@@ -36,6 +44,16 @@ export default function FilterTable() {
   const [data, setData] = useState<FilterData[]>([])
   const [currentPage, setCurrentPage] = useState(1)
   const [totalCount, setTotalCount] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  // Filtros de la búsqueda a la que pertenece nextCursor
+  const [cursorFilters, setCursorFilters] = useState<Record<string, string>>({})
+  const [loadingMore, setLoadingMore] = useState(false)
+  const [suggestions, setSuggestions] = useState<Record<SuggestField, string[]>>({
+    numecaja: [],
+    esticlie: [],
+    etiqclie: [],
+  })
+  const suggestTimer = useRef<ReturnType<typeof setTimeout> | null>(null)
 
   const { theme, language } = useTheme()
   const t = translations[language]
@@ -53,6 +71,53 @@ export default function FilterTable() {
   const tableHeaderClass = isDark ? "bg-slate-600 text-slate-200" : "bg-slate-200 text-slate-700"
   const tableRowClass = isDark ? "hover:bg-slate-600 border-slate-600" : "hover:bg-slate-100 border-slate-200"
 
+  // Autocompletado con /search, esperando a que el usuario deje de escribir
+  const requestSuggestions = (field: SuggestField, value: string) => {
+    if (suggestTimer.current) clearTimeout(suggestTimer.current)
+    if (value.trim().length < 2) {
+      setSuggestions((prev) => ({ ...prev, [field]: [] }))
+      return
+    }
+
+    suggestTimer.current = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ q: value.trim(), fields: field, limit: "8" })
+        const response = await fetch(`http://128.0.17.5:5000/search?${params}`)
+        if (!response.ok) return
+        const result: SearchResponse = await response.json()
+        setSuggestions((prev) => ({ ...prev, [field]: (result.results[field] || []).map((item) => item.value) }))
+      } catch {
+        // Sin sugerencias si falla la búsqueda; el filtro exacto sigue disponible
+      }
+    }, 200)
+  }
+
+  const buildFilters = () => {
+    const filters: Record<string, string> = {}
+    if (numecaja) filters.numecaja = numecaja
+    if (esticlie) filters.esticlie = esticlie
+    if (etiqclie) filters.etiqclie = etiqclie
+    if (coditall) filters.coditall = coditall
+    return filters
+  }
+
+  const fetchPage = async (filters: Record<string, string>, cursor: string | null): Promise<FilterResponse> => {
+    const response = await fetch("http://128.0.17.5:5000/filter_data", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(cursor ? { ...filters, cursor } : filters),
+    })
+
+    if (!response.ok) {
+      const errorData = await response.json()
+      throw new Error(errorData.error || "Error fetching data")
+    }
+
+    return response.json()
+  }
+
   const handleSearch = async (e: React.FormEvent) => {
     e.preventDefault()
 
@@ -65,33 +130,18 @@ export default function FilterTable() {
     setLoading(true)
     setError(null)
     setData([])
+    setNextCursor(null)
     setCurrentPage(1)
 
     try {
-      const filters: Record<string, string> = {}
-      if (numecaja) filters.numecaja = numecaja
-      if (esticlie) filters.esticlie = esticlie
-      if (etiqclie) filters.etiqclie = etiqclie
-      if (coditall) filters.coditall = coditall
-
-      const response = await fetch("http://128.0.17.5:5000/filter_data", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify(filters),
-      })
-
-      if (!response.ok) {
-        const errorData = await response.json()
-        throw new Error(errorData.error || "Error fetching data")
-      }
-
-      const result: FilterResponse = await response.json()
+      const filters = buildFilters()
+      const result = await fetchPage(filters, null)
 
       if (result.success) {
+        setCursorFilters(filters)
         setData(result.data)
         setTotalCount(result.count)
+        setNextCursor(result.has_more ? result.next_cursor ?? null : null)
         if (result.count === 0) {
           setError(language === "en" ? "No results found" : "No se encontraron resultados")
         }
@@ -104,6 +154,30 @@ export default function FilterTable() {
     }
   }
 
+  // Trae la siguiente página del servidor y la agrega a la tabla. Usa los
+  // filtros de la búsqueda original aunque el usuario haya editado los campos
+  const handleLoadMore = async () => {
+    if (!nextCursor) return
+
+    setLoadingMore(true)
+    setError(null)
+
+    try {
+      const result = await fetchPage(cursorFilters, nextCursor)
+
+      if (result.success) {
+        setData((prev) => [...prev, ...result.data])
+        setTotalCount((prev) => prev + result.count)
+        setNextCursor(result.has_more ? result.next_cursor ?? null : null)
+      }
+    } catch (err) {
+      const message = err instanceof Error ? err.message : "Error fetching data"
+      setError(message)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleClear = () => {
     setNumecaja("")
     setEsticlie("")
@@ -113,6 +187,8 @@ export default function FilterTable() {
     setError(null)
     setCurrentPage(1)
     setTotalCount(0)
+    setNextCursor(null)
+    setCursorFilters({})
   }
 
   // Paginación
@@ -142,10 +218,20 @@ export default function FilterTable() {
               type="text"
               placeholder={language === "en" ? "Enter box number..." : "Ingresa número de caja..."}
               value={numecaja}
-              onChange={(e) => setNumecaja(e.target.value)}
+              onChange={(e) => {
+                setNumecaja(e.target.value)
+                requestSuggestions("numecaja", e.target.value)
+              }}
+              list="suggest-numecaja"
+              autoComplete="off"
               disabled={loading}
               className={`w-full px-4 py-3 text-base ${inputBgClass} rounded-lg focus:border-emerald-500 focus:ring-2 focus:ring-emerald-500/20 disabled:opacity-50`}
             />
+            <datalist id="suggest-numecaja">
+              {suggestions.numecaja.map((value) => (
+                <option key={value} value={value} />
+              ))}
+            </datalist>
           </div>
 
           <div>
@@ -156,10 +242,20 @@ export default function FilterTable() {
               type="text"
               placeholder={language === "en" ? "Enter client style..." : "Ingresa estilo cliente..."}
               value={esticlie}
-              onChange={(e) => setEsticlie(e.target.value)}
+              onChange={(e) => {
+                setEsticlie(e.target.value)
+                requestSuggestions("esticlie", e.target.value)
+              }}
+              list="suggest-esticlie"
+              autoComplete="off"
               disabled={loading}
               className={`w-full px-4 py-3 text-base ${inputBgClass} rounded-lg focus:border-emerald-500 focus:ring-2 focus:ring-emerald-500/20 disabled:opacity-50`}
             />
+            <datalist id="suggest-esticlie">
+              {suggestions.esticlie.map((value) => (
+                <option key={value} value={value} />
+              ))}
+            </datalist>
           </div>
 
           <div>
@@ -170,10 +266,20 @@ export default function FilterTable() {
               type="text"
               placeholder={language === "en" ? "Enter client label..." : "Ingresa etiqueta cliente..."}
               value={etiqclie}
-              onChange={(e) => setEtiqclie(e.target.value)}
+              onChange={(e) => {
+                setEtiqclie(e.target.value)
+                requestSuggestions("etiqclie", e.target.value)
+              }}
+              list="suggest-etiqclie"
+              autoComplete="off"
               disabled={loading}
               className={`w-full px-4 py-3 text-base ${inputBgClass} rounded-lg focus:border-emerald-500 focus:ring-2 focus:ring-emerald-500/20 disabled:opacity-50`}
             />
+            <datalist id="suggest-etiqclie">
+              {suggestions.etiqclie.map((value) => (
+                <option key={value} value={value} />
+              ))}
+            </datalist>
           </div>
 
           <div>
@@ -238,7 +344,9 @@ export default function FilterTable() {
       {data.length > 0 && (
         <div className="mt-6 space-y-4">
           <div className={`text-sm ${subtextClass} font-medium`}>
-            {language === "en" ? `Found ${totalCount} results` : `Se encontraron ${totalCount} resultados`}
+            {language === "en"
+              ? `Found ${totalCount}${nextCursor ? "+" : ""} results`
+              : `Se encontraron ${totalCount}${nextCursor ? "+" : ""} resultados`}
           </div>
 
           {/* Tabla - Responsive */}
@@ -337,6 +445,18 @@ export default function FilterTable() {
               </div>
             </div>
           )}
+
+          {/* Más resultados en el servidor */}
+          {nextCursor && (
+            <div className="flex justify-center">
+              <Button type="button" variant="outline" onClick={handleLoadMore} disabled={loadingMore}>
+                {loadingMore ? (
+                  <Loader2 className="w-4 h-4 mr-2 animate-spin" />
+                ) : null}
+                {language === "en" ? "Load more results" : "Cargar más resultados"}
+              </Button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -68,13 +68,9 @@ export default function HashInput({ onSubmit, loading, error }: HashInputProps)
 
     try {
       // First, call the tickbarr endpoint to get the hash
-      const tickbarrResponse = await fetch("http://128.0.17.5:5000/get_hash", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ tickbarr: tickbarr.trim() }),
-      })
+      const tickbarrResponse = await fetch(
+        `http://128.0.17.5:5000/get_hash/${encodeURIComponent(tickbarr.trim())}`,
+      )
 
       if (!tickbarrResponse.ok) {
         const errorData = await tickbarrResponse.json()